@@ -0,0 +1,219 @@
+"""
+Conditional request support (ETag / Last-Modified) for DRF viewsets.
+
+Validators are computed from `updated_at` row versions with a bounded
+query, so `If-None-Match` / `If-Modified-Since` can be answered with
+`304 Not Modified` before anything is serialized. A keyset paginated list
+reads the row versions with the page it responds with, so the page is
+queried once.
+
+Related rows embedded in the representation are part of the validators:
+`related_versions` are their `updated_at` lookups, `related_values` the
+lookups of embedded values without a row version (they only go into the
+ETag). Last-Modified is only sent for a detail whose dependencies all
+have a version; a list has none, the newest row of a page does not
+change when a row is deleted or filtered out.
+"""
+
+import hashlib
+from calendar import timegm
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    raw = "|".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode("utf-8")).hexdigest())
+
+
+def to_timestamp(value):
+    return timegm(value.utctimetuple()) if value else None
+
+
+class ConditionalRequestMixin:
+    """
+    Compute validators for a viewset whose model has an `updated_at`
+    field that changes on every write.
+    """
+
+    updated_field = "updated_at"
+    related_versions = ()
+    related_values = ()
+
+    def get_related_fields(self):
+        """`(related_versions, related_values)` of the current representation."""
+        return self.related_versions, self.related_values
+
+    def get_representation(self):
+        """Part of the ETag that changes when the response shape changes."""
+        return self.get_serializer_class().__name__
+
+    def get_detail_validators(self, lock=False):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        versions, values = self.get_related_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        if lock:
+            queryset = queryset.select_for_update(of=("self",))
+        try:
+            row = (
+                queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+                .values_list("pk", self.updated_field, *versions, *values)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            row = None
+        if row is None:
+            return None, None
+
+        pk, *dependencies = row
+        etag = make_etag(
+            queryset.model._meta.label,
+            pk,
+            *dependencies,
+            self.get_representation(),
+        )
+        if values:
+            return etag, None
+        stamps = [stamp for stamp in dependencies if stamp is not None]
+        return etag, max(stamps)
+
+    def paginates_by_keys(self):
+        return self.paginator is not None and hasattr(self.paginator, "get_ordering")
+
+    def get_list_etag(self, request, parts):
+        return make_etag(
+            self.get_queryset().model._meta.label,
+            request.get_host(),
+            request.get_full_path(),
+            self.get_representation(),
+            *parts,
+        )
+
+    def get_list_validators(self, request):
+        """
+        ETag of an unpaginated list from one aggregate query, lists have
+        no sound Last-Modified.
+        """
+        versions, values = self.get_related_fields()
+        if values:
+            # no bounded query covers every embedded value
+            return None, None
+        queryset = self.filter_queryset(self.get_queryset())
+        summary = queryset.order_by().aggregate(
+            count=Count("pk"),
+            **{
+                f"updated_{i}": Max(field)
+                for i, field in enumerate((self.updated_field, *versions))
+            },
+        )
+        return self.get_list_etag(request, summary.values()), None
+
+    def annotate_validators(self, queryset):
+        """Read the row versions and embedded values with the rows."""
+        versions, values = self.get_related_fields()
+        columns = ["pk", self.updated_field, *versions, *values]
+        return queryset.annotate(
+            **{f"validator_{i}": F(column) for i, column in enumerate(columns)}
+        )
+
+    def get_page_etag(self, request, page):
+        """ETag of a page of `annotate_validators` rows or objects."""
+        paginator = self.paginator
+        parts = [paginator.has_next, paginator.has_previous, paginator.total_count]
+        for row in page:
+            if not isinstance(row, dict):
+                row = vars(row)
+            parts.append(
+                tuple(
+                    value for key, value in row.items() if key.startswith("validator_")
+                )
+            )
+        return self.get_list_etag(request, parts)
+
+    @staticmethod
+    def set_validators(response, etag, updated):
+        if etag and response.status_code == 200:
+            response["ETag"] = etag
+            if updated:
+                response["Last-Modified"] = http_date(to_timestamp(updated))
+        return response
+
+    def evaluate_preconditions(self, request, etag, updated):
+        response = get_conditional_response(
+            request, etag=etag, last_modified=to_timestamp(updated)
+        )
+        if response is not None:
+            self.set_validators(response, etag, updated)
+        return response
+
+
+class ConditionalGetMixin(ConditionalRequestMixin):
+    """
+    Add ETag and Last-Modified to `list` and `retrieve` responses and
+    answer conditional GETs with 304 without serializing the body.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if self.paginates_by_keys():
+            # evaluated by paginate_queryset, on the page of the response
+            self.list_etag = self.not_modified = None
+            response = super().list(request, *args, **kwargs)
+            if self.not_modified is not None:
+                return self.not_modified
+            return self.set_validators(response, self.list_etag, None)
+
+        etag, updated = self.get_list_validators(request)
+        response = self.evaluate_preconditions(request, etag, updated)
+        if response is not None:
+            return response
+        return self.set_validators(
+            super().list(request, *args, **kwargs), etag, updated
+        )
+
+    def paginate_queryset(self, queryset):
+        if self.action != "list" or not self.paginates_by_keys():
+            return super().paginate_queryset(queryset)
+        page = super().paginate_queryset(self.annotate_validators(queryset))
+        self.list_etag = self.get_page_etag(self.request, page)
+        self.not_modified = self.evaluate_preconditions(
+            self.request, self.list_etag, None
+        )
+        # nothing to serialize for a 304, list() answers it
+        return [] if self.not_modified is not None else page
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, updated = self.get_detail_validators()
+        if etag:
+            response = self.evaluate_preconditions(request, etag, updated)
+            if response is not None:
+                return response
+        return self.set_validators(
+            super().retrieve(request, *args, **kwargs), etag, updated
+        )
+
+
+class ConditionalUpdateMixin(ConditionalRequestMixin):
+    """
+    Optimistic concurrency for `update` and `partial_update`: reject the
+    write with 412 when `If-Match` / `If-Unmodified-Since` do not match.
+    """
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            # the row stays locked until the update is written, so two
+            # clients sending the same If-Match cannot both succeed
+            etag, updated = self.get_detail_validators(lock=True)
+            if etag:
+                response = self.evaluate_preconditions(request, etag, updated)
+                if response is not None:
+                    return response
+            response = super().update(request, *args, **kwargs)
+
+        if response.status_code == 200:
+            etag, updated = self.get_detail_validators()
+            self.set_validators(response, etag, updated)
+        return response
@@ -0,0 +1,150 @@
+"""
+Per-request performance instrumentation.
+
+`InstrumentationMiddleware` counts the SQL statements of every request
+and their duration through an `execute_wrapper` on each database
+connection, and collects the time of the spans marked with `timed()`:
+JSON rendering (`TimedJSONRenderer`) and outbound HTTP calls. The numbers
+are logged as one JSON line per request to the `library.requests`
+logger, as a warning for requests slower than `SLOW_REQUEST_MS`, and are
+sent back as a `Server-Timing` header when `SERVER_TIMING` is on. Latency
+and query counts also feed the Prometheus histograms of
+`Library_service_project.metrics`.
+
+With `PROFILE_SAMPLE_RATE` above 0 that share of requests runs under
+cProfile and the profile of a slow one is dumped to `PROFILE_DIR`. With
+sampling off a request only pays for a few clock reads and counters.
+Streamed bodies are produced after the middleware returns and are not
+included.
+"""
+
+import cProfile
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils.timezone import now
+from rest_framework.renderers import JSONRenderer
+
+from Library_service_project.metrics import observe_request
+
+logger = logging.getLogger("library.requests")
+
+_metrics = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the span `name` of the request."""
+    metrics = _metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def server_timing(metrics, total):
+    entries = [f'db;dur={metrics.db * 1000:.1f};desc="{metrics.queries} queries"']
+    entries += [
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in metrics.spans.items()
+    ]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        profiler = None
+        if settings.PROFILE_SAMPLE_RATE and (
+            random.random() < settings.PROFILE_SAMPLE_RATE
+        ):
+            profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in settings.DATABASES:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics.execute)
+                    )
+                if profiler is not None:
+                    stack.enter_context(profiler)
+                response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        total = time.perf_counter() - start
+        observe_request(request, response, total, metrics.queries)
+
+        slow = total * 1000 >= settings.SLOW_REQUEST_MS
+        if profiler is not None and slow:
+            self.dump_profile(profiler, request)
+        self.log(request, response, metrics, total, slow)
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = server_timing(metrics, total)
+        return response
+
+    @staticmethod
+    def log(request, response, metrics, total, slow):
+        level = logging.WARNING if slow else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(total * 1000, 1),
+            "db_queries": metrics.queries,
+            "db_ms": round(metrics.db * 1000, 1),
+            **{
+                f"{name}_ms": round(seconds * 1000, 1)
+                for name, seconds in metrics.spans.items()
+            },
+        }
+        logger.log(level, json.dumps(record))
+
+    @staticmethod
+    def dump_profile(profiler, request):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = request.path.strip("/").replace("/", "_") or "root"
+        path = directory / f"{now():%Y%m%dT%H%M%S.%f}-{request.method}-{name}.prof"
+        profiler.dump_stats(path)
+        logger.warning("profile of a slow request written to %s", path)
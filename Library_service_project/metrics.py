@@ -0,0 +1,110 @@
+"""
+Prometheus metrics of the service, exposed at /metrics.
+
+Every process of a multi-worker server keeps its own samples. With
+PROMETHEUS_MULTIPROC_DIR set (`gunicorn.conf.py` does it) they are written
+to memory-mapped files in that directory and merged when /metrics is
+scraped, so any worker reports the totals of all of them. The directory
+must exist, be shared by every worker and be emptied before the server
+starts.
+
+The notification dispatcher runs in its own container, it serves its
+samples itself on `dispatch_notifications --metrics-port`.
+"""
+
+import os
+
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "library_request_duration_seconds",
+    "Time to build the response, per view and action.",
+    ["view", "action", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    "library_request_db_queries",
+    "SQL statements per request, per view and action.",
+    ["view", "action"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+BORROWINGS = Counter(
+    "library_borrowings",
+    "Borrowed and returned books.",
+    ["operation"],
+)
+BORROW_REJECTIONS = Counter(
+    "library_borrow_rejections",
+    "Borrowings refused, by reason.",
+    ["reason"],
+)
+RATE_LIMITED = Counter(
+    "library_rate_limited",
+    "Requests refused by the rate limits, by scope.",
+    ["scope"],
+)
+NOTIFICATIONS = Counter(
+    "library_notifications",
+    "Notification delivery attempts, by result.",
+    ["result"],
+)
+NOTIFICATION_LATENCY = Histogram(
+    "library_notification_delivery_seconds",
+    "Time from queueing a notification to its delivery.",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+
+def view_labels(request):
+    """Name of the view class and of the viewset action of the request."""
+    match = request.resolver_match
+    if match is None:
+        # keep unknown paths out of the label values
+        return "unmatched", ""
+    view = getattr(match.func, "cls", None) or getattr(match.func, "view_class", None)
+    name = view.__name__ if view is not None else match.url_name or "unknown"
+    actions = getattr(match.func, "actions", None)
+    if actions:
+        return name, actions.get(request.method.lower(), "")
+    return name, request.method.lower()
+
+
+def observe_request(request, response, seconds, queries):
+    view, action = view_labels(request)
+    REQUEST_LATENCY.labels(view, action, request.method, response.status_code).observe(
+        seconds
+    )
+    REQUEST_QUERIES.labels(view, action).observe(queries)
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """
+    Samples of every process, protected by `METRICS_TOKEN`. Without a token
+    it is only open with DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=401)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,238 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite key.
+
+    Unlike DRF's CursorPagination, the cursor stores the values of every
+    ordering field (the last one must be unique, usually `id`), so the
+    next page starts after them with `a > x OR (a = x AND id > y)`, each
+    comparison in the direction of its field (see `_after`). Page cost
+    does not depend on how deep the cursor is.
+    """
+
+    ordering = ("id",)
+    page_size = getattr(settings, "PAGINATION_PAGE_SIZE", 20)
+    page_size_query_param = "page_size"
+    max_page_size = getattr(settings, "PAGINATION_MAX_PAGE_SIZE", 100)
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    count_header = "X-Total-Count"
+    allow_total_count = True
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+        position, reverse = self.decode_cursor(request)
+
+        self.total_count = None
+        if self.allow_total_count and self.wants_total_count(request):
+            self.total_count = queryset.order_by().count()
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._invert(field) for field in ordering]
+
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, ordering))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size,
+                )
+            except (KeyError, ValueError):
+                pass
+        return min(self.page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        return list(getattr(view, "pagination_ordering", None) or self.ordering)
+
+    def wants_total_count(self, request):
+        value = request.query_params.get(self.count_query_param, "")
+        return value.lower() in ("1", "true")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self._link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        headers = {}
+        if self.total_count is not None:
+            headers[self.count_header] = str(self.total_count)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            },
+            headers=headers,
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": (
+                    f"Number of results to return per page "
+                    f"(max {self.max_page_size})."
+                ),
+                "schema": {"type": "integer"},
+            },
+        ]
+        if self.allow_total_count:
+            parameters.append(
+                {
+                    "name": self.count_query_param,
+                    "required": False,
+                    "in": "query",
+                    "description": (
+                        f"Set to 'true' to receive the total number of results "
+                        f"in the `{self.count_header}` header."
+                    ),
+                    "schema": {"type": "boolean"},
+                }
+            )
+        return parameters
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            cursor = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+            values = cursor["p"]
+            reverse = bool(cursor.get("r", False))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self._to_python(field.lstrip("-"), value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (
+            BinasciiError,
+            KeyError,
+            TypeError,
+            ValueError,
+            UnicodeError,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        cursor = {"p": position}
+        if reverse:
+            cursor["r"] = 1
+        data = json.dumps(cursor, default=self._encode_value, separators=(",", ":"))
+        encoded = b64encode(data.encode("utf-8")).decode("ascii")
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def _link(self, item, reverse):
+        position = [self._get_value(item, field.lstrip("-")) for field in self.ordering]
+        return self.encode_cursor(position, reverse)
+
+    @staticmethod
+    def _encode_value(value):
+        # DjangoJSONEncoder truncates datetimes to milliseconds, which would
+        # make the cursor skip or repeat rows with close timestamps.
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return str(value)
+
+    @staticmethod
+    def _get_value(item, name):
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def _to_python(self, name, value):
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def _after(position, ordering):
+        """
+        Build `(f1, f2, ...) > (v1, v2, ...)` respecting each field direction.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
@@ -0,0 +1,68 @@
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def explain(sql):
+    """Return the plan lines for `sql` on the default database."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # Make the planner pick any usable index even on small test tables,
+            # so a remaining Seq Scan means the index is missing.
+            cursor.execute("SET enable_seqscan = off")
+            try:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.execute("RESET enable_seqscan")
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return list(_postgresql_nodes(plan[0]["Plan"]))
+
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def sequential_scans(plan):
+    if connection.vendor == "postgresql":
+        return [line for line in plan if line.startswith("Seq Scan")]
+    return [
+        line
+        for line in plan
+        if line.startswith("SCAN ")
+        and " USING " not in line
+        and line != "SCAN CONSTANT ROW"
+    ]
+
+
+def _postgresql_nodes(node):
+    yield f"{node['Node Type']} on {node.get('Relation Name', '-')}"
+    for child in node.get("Plans", []):
+        yield from _postgresql_nodes(child)
+
+
+class QueryPlanAssertionsMixin:
+    """
+    Test case mixin that fails when a query falls back to a full table scan.
+    """
+
+    def assertNoSequentialScans(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+
+        selects = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].lstrip().upper().startswith("SELECT")
+        ]
+        self.assertTrue(selects, "No SELECT queries were executed.")
+
+        for sql in selects:
+            plan = explain(sql)
+            scans = sequential_scans(plan)
+            if scans:
+                self.fail(
+                    f"Sequential scan in query plan:\n{sql}\n\n" + "\n".join(plan)
+                )
+        return result
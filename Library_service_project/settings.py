@@ -19,6 +19,11 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def env_bool(name, default=False):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes")
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -30,9 +35,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool("DEBUG")
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
+    if host.strip()
+]
 
 
 # Application definition
@@ -53,7 +62,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "Library_service_project.instrumentation.InstrumentationMiddleware",
+    "Library_service_project.throttling.RateLimitHeadersMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -94,14 +106,136 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        # keep connections open between requests, checked before reuse; the
+        # ASGI handler runs every request in a new thread whose persistent
+        # connection is never reused nor closed, so it closes them by default
+        "CONN_MAX_AGE": int(
+            os.getenv(
+                "DB_CONN_MAX_AGE",
+                0 if os.getenv("SERVER_INTERFACE", "wsgi") == "asgi" else 60,
+            )
+        ),
+        "CONN_HEALTH_CHECKS": env_bool("DB_CONN_HEALTH_CHECKS", True),
+        "OPTIONS": {
+            "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", 5)),
+        },
     }
 }
 
+if env_bool("DB_POOL"):
+    # one psycopg pool per process, so workers * DB_POOL_MAX_SIZE must stay
+    # below max_connections of the server
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+    }
+
+if env_bool("DB_PGBOUNCER"):
+    # PgBouncer in transaction pooling mode hands every transaction to any
+    # server connection, so neither named cursors nor prepared statements
+    # survive between statements
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+    DATABASES["default"]["OPTIONS"]["prepare_threshold"] = None
+
 if "test" in sys.argv:
     DATABASES["default"] = {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
     }
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# locmem is per process; use file or redis when running several workers.
+
+CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "library",
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 1000))},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", BASE_DIR / ".cache"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 1000))},
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+    },
+    "dummy": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+    },
+}
+
+CACHES = {
+    "default": {
+        **CACHE_BACKENDS[os.getenv("CACHE_BACKEND", "locmem")],
+        "TIMEOUT": int(os.getenv("CACHE_TIMEOUT", 300)),
+    }
+}
+
+if "test" in sys.argv:
+    # tests that exercise caching switch to locmem with override_settings
+    CACHES["default"] = CACHE_BACKENDS["dummy"]
+
+# fine per overdue day, as a multiple of the book's daily fee
+FINE_MULTIPLIER = os.getenv("FINE_MULTIPLIER", "2")
+
+BOOKS_CACHE_ALIAS = "default"
+BOOKS_CACHE_TIMEOUT = int(os.getenv("BOOKS_CACHE_TIMEOUT", 300))
+# seconds the inventories of POST /books/availability/ are kept in process,
+# 0 reads them from the database on every call
+BOOK_AVAILABILITY_CACHE_TTL = float(os.getenv("BOOK_AVAILABILITY_CACHE_TTL", 0))
+
+# seconds the responses of requests with an Idempotency-Key are replayed,
+# run `purge_idempotency_keys` to delete the expired ones
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+# PASSWORD_HASHER hashes new passwords: pbkdf2, scrypt or argon2. The others
+# still verify existing hashes, and a login rehashes the password when its
+# hasher or cost is not the current one.
+
+PASSWORD_HASHER_CLASSES = {
+    "pbkdf2": "user.hashers.PBKDF2PasswordHasher",
+    "scrypt": "user.hashers.ScryptPasswordHasher",
+    "argon2": "user.hashers.Argon2PasswordHasher",
+}
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CLASSES[PASSWORD_HASHER],
+    *(
+        path
+        for name, path in PASSWORD_HASHER_CLASSES.items()
+        if name != PASSWORD_HASHER
+    ),
+    # Django's other default hashers, so their hashes still verify
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+]
+# costs of the hashers, Django's defaults when unset
+PASSWORD_HASHER_COSTS = {
+    policy: {name: int(value) for name, value in costs.items() if value}
+    for policy, costs in {
+        "pbkdf2": {"iterations": os.getenv("PASSWORD_PBKDF2_ITERATIONS")},
+        "scrypt": {"work_factor": os.getenv("PASSWORD_SCRYPT_WORK_FACTOR")},
+        "argon2": {
+            "time_cost": os.getenv("PASSWORD_ARGON2_TIME_COST"),
+            "memory_cost": os.getenv("PASSWORD_ARGON2_MEMORY_COST"),
+            "parallelism": os.getenv("PASSWORD_ARGON2_PARALLELISM"),
+        },
+    }.items()
+}
+
+if "test" in sys.argv:
+    # hashing costs only slow the tests down, the tests of the hasher
+    # policy switch back with override_settings
+    PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -137,6 +271,9 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = BASE_DIR / "staticfiles"
+# not collected for the tests, look the files up per request instead
+WHITENOISE_AUTOREFRESH = DEBUG or "test" in sys.argv
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -146,21 +283,83 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "user.User"
 
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("user.authentication.ClaimsJWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "Library_service_project.throttling.TokenBucketThrottle",
+    ],
+    # reverse proxies in front of the server, clients are told apart by
+    # REMOTE_ADDR unless they are counted, X-Forwarded-For can be forged
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": [
+        "Library_service_project.instrumentation.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
 
+# token bucket per client and scope, "<requests>/<period>" with bursts of
+# up to <requests>; THROTTLE_STORE is "local" (per process) or "redis"
+# (THROTTLE_CACHE_ALIAS, shared between workers), redis with a redis cache
+THROTTLE_ENABLED = env_bool("THROTTLE_ENABLED", True)
+THROTTLE_STORE = os.getenv("THROTTLE_STORE") or (
+    "redis" if os.getenv("CACHE_BACKEND") == "redis" else "local"
+)
+THROTTLE_CACHE_ALIAS = "default"
+THROTTLE_RATES = {
+    "login": os.getenv("THROTTLE_RATE_LOGIN", "10/min"),
+    "register": os.getenv("THROTTLE_RATE_REGISTER", "20/hour"),
+    "borrow": os.getenv("THROTTLE_RATE_BORROW", "30/min"),
+    "read": os.getenv("THROTTLE_RATE_READ", "600/min"),
+}
+
+if "test" in sys.argv:
+    # tests that exercise the limits turn them on with override_settings
+    THROTTLE_ENABLED = False
+
+PAGINATION_PAGE_SIZE = int(os.getenv("PAGE_SIZE", 20))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv("PAGINATION_MAX_PAGE_SIZE", 100))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=3),
     "ROTATE_REFRESH_TOKEN": False,
 }
 
+# build request.user from the token claims instead of loading it, revoked
+# tokens are tracked in the cache, which must be shared between workers
+JWT_STATELESS_AUTH = env_bool("JWT_STATELESS_AUTH")
+AUTH_CACHE_ALIAS = "default"
+
+# Request instrumentation, see Library_service_project/instrumentation.py.
+# Server-Timing tells clients how the time was spent, keep it off on public
+# deployments unless the numbers are fine to share.
+SERVER_TIMING = env_bool("SERVER_TIMING", DEBUG)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", BASE_DIR / "profiles")
+
+# bearer token required by /metrics, open when empty only with DEBUG on
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # one JSON line per request at INFO, slow requests at WARNING
+        "library.requests": {
+            "handlers": ["console"],
+            "level": os.getenv("REQUEST_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+    },
+}
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Library service API",
     "DESCRIPTION": "Documentation for Library service API",
@@ -0,0 +1,191 @@
+"""
+Token bucket rate limits for DRF views.
+
+Every scope of `THROTTLE_RATES` is a bucket of `<requests>` tokens per
+client, refilled continuously over `<period>`, so a client may burst up
+to the full count and then goes on at the average rate. Views pick their
+scope with `throttle_scope`; safe requests of views without one use
+"read", other requests are not limited. Clients are told apart by user
+id once authenticated, by IP address (`get_ident`, honouring
+`NUM_PROXIES`) otherwise.
+
+The buckets live in the store named by `THROTTLE_STORE`:
+
+- "local": a dict of the process, every worker counts on its own, so
+  N workers let N times the rate through.
+- "redis": the `THROTTLE_CACHE_ALIAS` Redis cache, shared by all
+  workers. A bucket is refilled and taken from by one Lua script on the
+  clock of the Redis server, so concurrent requests cannot both take
+  the last token.
+
+`RateLimitHeadersMiddleware` adds `RateLimit-Limit`, `RateLimit-Remaining`
+and `RateLimit-Reset` to every limited response, refused ones get a
+`Retry-After` from DRF.
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from Library_service_project.metrics import RATE_LIMITED
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+# `take` in Lua, KEYS[1] is the bucket, ARGV the capacity and tokens per
+# second; a bucket missing from Redis is full, it expires once refilled
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * per_second)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil((capacity - tokens) / per_second) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def parse_rate(rate):
+    """`"10/min"` -> `(10, 60)`, the period is read from its first letter."""
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0]]
+
+
+def take(tokens, elapsed, capacity, per_second):
+    """
+    Refill a bucket for `elapsed` seconds and take one token from it.
+
+    Returns whether the token was taken and the tokens left.
+    """
+    tokens = min(capacity, tokens + elapsed * per_second)
+    if tokens >= 1:
+        return True, tokens - 1
+    return False, tokens
+
+
+class LocalBucketStore:
+    def __init__(self, max_entries=100_000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, per_second):
+        """Take a token of the bucket `key`, returns `(allowed, tokens left)`."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            allowed, tokens = take(tokens, now - updated, capacity, per_second)
+            if len(self._buckets) >= self.max_entries and key not in self._buckets:
+                self._prune(now)
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+    def _prune(self, now):
+        # a bucket idle for a day is full again at any rate of up to one
+        # period a day, so it is the same as a missing one
+        horizon = now - PERIODS["d"]
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if bucket[1] > horizon
+        }
+        if len(self._buckets) >= self.max_entries:
+            self._buckets.clear()
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    def __init__(self):
+        self._script = None
+
+    def consume(self, key, capacity, per_second):
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        if not isinstance(cache, RedisCache):
+            raise ImproperlyConfigured(
+                'THROTTLE_STORE "redis" needs a Redis THROTTLE_CACHE_ALIAS cache.'
+            )
+        client = cache._cache.get_client(write=True)
+        if self._script is None:
+            self._script = client.register_script(TAKE_SCRIPT)
+        allowed, tokens = self._script(
+            keys=[cache.make_and_validate_key(f"throttle:{key}")],
+            args=[capacity, per_second],
+            client=client,
+        )
+        return bool(allowed), float(tokens)
+
+
+local_store = LocalBucketStore()
+redis_store = RedisBucketStore()
+
+
+def get_store():
+    if settings.THROTTLE_STORE == "redis":
+        return redis_store
+    return local_store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def get_scope(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        if scope is None and request.method in SAFE_METHODS:
+            return "read"
+        return scope
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        if not settings.THROTTLE_ENABLED:
+            return True
+        scope = self.get_scope(request, view)
+        if scope is None or scope not in settings.THROTTLE_RATES:
+            return True
+
+        capacity, period = parse_rate(settings.THROTTLE_RATES[scope])
+        per_second = capacity / period
+        allowed, tokens = get_store().consume(
+            f"{scope}:{self.get_client(request)}", capacity, per_second
+        )
+        self.wait_seconds = 0 if allowed else (1 - tokens) / per_second
+        request._request.rate_limit = {
+            "RateLimit-Limit": str(capacity),
+            "RateLimit-Remaining": str(math.floor(tokens)),
+            "RateLimit-Reset": str(math.ceil((capacity - tokens) / per_second)),
+        }
+        if not allowed:
+            RATE_LIMITED.labels(scope).inc()
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class RateLimitHeadersMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        for header, value in getattr(request, "rate_limit", {}).items():
+            response[header] = value
+        return response
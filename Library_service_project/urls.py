@@ -19,11 +19,14 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from Library_service_project.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("books/", include("books.urls", namespace="books")),
     path("users/", include("user.urls", namespace="user")),
     path("borrowings/", include("borrowing.urls", namespace="borrowing")),
+    path("metrics", metrics_view, name="metrics"),
     path("doc/", SpectacularAPIView.as_view(), name="schema"),
     # Optional UI:
     path(
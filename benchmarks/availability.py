@@ -0,0 +1,66 @@
+"""
+Time to read the inventory of many books: one call against one per book.
+
+Reads the inventory of `--ids` books through `POST /books/availability/`
+and through as many `GET /books/{id}/`, with the availability cache off
+and on, and reports milliseconds per batch, e.g.:
+
+    python -m benchmarks.availability --ids 200 --repeats 20
+"""
+
+import argparse
+import time
+
+from django.test import override_settings
+
+from benchmarks.endpoints import make_clients, seeded_database
+
+
+def per_batch(fetch, repeats):
+    fetch()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fetch()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--borrowings", type=int, default=1_000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--ids", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--cache-ttl", type=float, default=30)
+    parser.add_argument("--keepdb", action="store_true")
+    args = parser.parse_args()
+
+    with seeded_database(args.books, args.borrowings, args.users, args.keepdb):
+        from books.availability import availability_cache
+        from books.models import Book
+
+        client, _ = make_clients()["anonymous"]
+        ids = list(Book.objects.order_by("?").values_list("id", flat=True)[: args.ids])
+
+        def one_by_one():
+            for book_id in ids:
+                response = client.get(f"/books/{book_id}/")
+                assert response.status_code == 200, response.status_code
+
+        def batch():
+            response = client.post("/books/availability/", {"ids": ids}, format="json")
+            assert response.status_code == 200, response.status_code
+
+        print(f"{'endpoint':<26} {'ms/batch':>9}")
+        print(f"{'GET /books/{id}/':<26} {per_batch(one_by_one, args.repeats):>9.1f}")
+        print(
+            f"{'POST /books/availability/':<26} {per_batch(batch, args.repeats):>9.1f}"
+        )
+        availability_cache.clear()
+        with override_settings(BOOK_AVAILABILITY_CACHE_TTL=args.cache_ttl):
+            cached = per_batch(batch, args.repeats)
+        print(f"{'  cached':<26} {cached:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
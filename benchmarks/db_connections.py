@@ -0,0 +1,81 @@
+"""
+Measure database connection churn under load.
+
+Runs the same load against Gunicorn once per connection setup and reads
+`pg_stat_database.sessions` before and after, so the report shows how
+many PostgreSQL sessions every setup opened and how many connections
+stay open, next to its latency, e.g.:
+
+    python -m benchmarks.db_connections --requests 5000 --concurrency 32
+"""
+
+import argparse
+import os
+import time
+
+import django
+
+from benchmarks.loadgen import run_load
+from benchmarks.serve import run_server
+
+SETUPS = {
+    "per-request": {"DB_CONN_MAX_AGE": "0", "DB_POOL": "False"},
+    "persistent": {"DB_CONN_MAX_AGE": "60", "DB_POOL": "False"},
+    "pool": {"DB_POOL": "True"},
+}
+
+
+def connection_stats():
+    """Return the number of sessions opened so far and of open connections."""
+    from django.db import connection
+
+    # backends report their statistics with a short delay
+    time.sleep(1.5)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_stat_clear_snapshot()")
+        cursor.execute(
+            "SELECT sessions, numbackends FROM pg_stat_database "
+            "WHERE datname = current_database()"
+        )
+        sessions, backends = cursor.fetchone()
+    # leave out the connection of this script
+    return sessions, backends - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--path", default="/books/")
+    parser.add_argument("--mode", default="wsgi", choices=("wsgi", "asgi"))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument(
+        "--setups", default=",".join(SETUPS), help="Comma separated, from: %(default)s"
+    )
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Library_service_project.settings")
+    django.setup()
+
+    print(
+        f"{'setup':<12} {'requests':>9} {'errors':>7} {'rps':>9} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'sessions':>9} {'open':>5}"
+    )
+    for name in args.setups.split(","):
+        with run_server(args.mode, args.workers, args.threads, SETUPS[name]) as url:
+            run_load(f"{url}{args.path}", args.warmup, args.concurrency)
+            before, _ = connection_stats()
+            result = run_load(f"{url}{args.path}", args.requests, args.concurrency)
+            after, connections = connection_stats()
+        summary = result.summary()
+        print(
+            f"{name:<12} {summary['requests']:>9} {summary['errors']:>7} "
+            f"{summary['rps']:>9} {summary['p50_ms']:>8} {summary['p99_ms']:>8} "
+            f"{after - before:>9} {connections:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
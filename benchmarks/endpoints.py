@@ -0,0 +1,447 @@
+"""
+Query count, latency and allocation regression benchmark of every endpoint.
+
+Seeds a throwaway database (the test database of the configured one) with
+realistic volumes, calls every endpoint as every role through the test
+client and compares the results with `benchmarks/baseline.json`. Exits
+with status 1 when an endpoint issues more queries than its baseline, or
+is slower or allocates more than the baseline beyond the threshold, e.g.:
+
+    python -m benchmarks.endpoints --books 100000 --borrowings 1000000 --keepdb
+    python -m benchmarks.endpoints --keepdb --update-baseline
+
+Query counts do not depend on the volume or the machine. Latency and
+allocations do, so they are only compared when the baseline has them,
+record them with `--update-baseline` on the machine that runs the check.
+Caching is disabled so every request reaches the database, and so are
+the rate limits.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable
+
+import django
+
+BASELINE = Path(__file__).with_name("baseline.json")
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+PASSWORD = "benchmark-password"
+SEED_BATCH = 10000
+
+
+@dataclass
+class Scenario:
+    name: str
+    role: str
+    method: str
+    # build the path and the body of one call from the seeded objects
+    request: Callable
+    status: int = 200
+
+    @property
+    def key(self):
+        return f"{self.name}:{self.role}"
+
+
+@dataclass
+class Measurement:
+    queries: int = 0
+    times_ms: list = field(default_factory=list)
+    alloc_kib: float = 0.0
+    error: str = ""
+
+    def as_baseline(self):
+        return {
+            "queries": self.queries,
+            "time_ms": round(statistics.median(self.times_ms), 2),
+            "alloc_kib": round(self.alloc_kib, 1),
+        }
+
+
+def seed(books, borrowings, users):
+    """Fill the database, `borrowings` are spread over `users` users."""
+    from django.contrib.auth import get_user_model
+
+    from books.models import Book
+    from borrowing.fines import FineCalculator
+    from borrowing.models import Borrowing
+    from borrowing.summary import rebuild_summaries
+
+    User = get_user_model()
+    # hashing once keeps seeding fast, every user shares the password
+    template = User(email="template@benchmark.test")
+    template.set_password(PASSWORD)
+    User.objects.bulk_create(
+        [
+            User(email=f"user{i}@benchmark.test", password=template.password)
+            for i in range(users)
+        ]
+        + [
+            User(
+                email="staff@benchmark.test",
+                password=template.password,
+                is_staff=True,
+            )
+        ],
+        batch_size=SEED_BATCH,
+    )
+
+    for start in range(0, books, SEED_BATCH):
+        Book.objects.bulk_create(
+            Book(
+                title=f"Book {i} volume {i % 97}",
+                author=f"Author {i % 5000}",
+                cover="HARD" if i % 2 else "SOFT",
+                inventory=1000,
+                daily_fee="1.50",
+            )
+            for i in range(start, min(start + SEED_BATCH, books))
+        )
+
+    user_ids = list(User.objects.values_list("id", flat=True).order_by("id"))
+    book_ids = list(Book.objects.values_list("id", flat=True).order_by("id"))
+    today = date.today()
+    for start in range(0, borrowings, SEED_BATCH):
+        rows = []
+        for i in range(start, min(start + SEED_BATCH, borrowings)):
+            # one in ten borrowings is active, a third of those overdue
+            is_active = i % 10 == 0
+            due = today + timedelta(days=(i % 30) - (10 if is_active else 40))
+            rows.append(
+                Borrowing(
+                    user_id=user_ids[i % len(user_ids)],
+                    book_id=book_ids[i % len(book_ids)],
+                    expected_return_date=due,
+                    actual_return_date=None if is_active else due,
+                    is_active=is_active,
+                )
+            )
+        Borrowing.objects.bulk_create(rows)
+
+    FineCalculator(chunk_size=SEED_BATCH).run()
+    rebuild_summaries(chunk_size=SEED_BATCH)
+
+
+def seeded(books):
+    from books.models import Book
+
+    return Book.objects.filter(pk__lte=books).exists()
+
+
+@contextmanager
+def seeded_database(books, borrowings, users, keepdb=False):
+    """Set up Django on a seeded test database, caching and rate limits off."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Library_service_project.settings")
+    django.setup()
+    from django.db import connection
+    from django.test.utils import (
+        override_settings,
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    setup_test_environment(debug=False)
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, keepdb=keepdb)
+    try:
+        with override_settings(CACHES=NO_CACHE, THROTTLE_ENABLED=False):
+            if not seeded(books):
+                print(
+                    f"seeding {books} books and {borrowings} borrowings",
+                    file=sys.stderr,
+                )
+                seed(books, borrowings, users)
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def fresh_borrowings(user, count):
+    """Active borrowings of `user` for write scenarios, created unmeasured."""
+    from books.models import Book
+    from borrowing.services import borrow_book
+
+    book = Book.objects.order_by("id").first()
+    due = date.today() + timedelta(days=7)
+    return [borrow_book(user.id, book, due).id for _ in range(count)]
+
+
+def import_body(rows=100):
+    lines = ["isbn,title,author,cover,inventory,daily_fee"]
+    lines += [
+        f"{9790000000000 + i},Imported {i},Author {i},SOFT,3,1.00" for i in range(rows)
+    ]
+    return "\n".join(lines)
+
+
+def scenarios():
+    """Every endpoint as every role that can call it."""
+    books_list = "/books/"
+    borrowings_list = "/borrowings/"
+    counter = iter(range(10**9))
+
+    def book(context):
+        return f"{books_list}{context['book_id']}/", None
+
+    def borrowing(context):
+        return f"{borrowings_list}{context['borrowing_id']}/", None
+
+    def register(context):
+        email = f"new{next(counter)}@benchmark.test"
+        return "/users/", {"email": email, "password": PASSWORD}
+
+    def token(context):
+        return "/users/token/", {"email": context["email"], "password": PASSWORD}
+
+    def create_borrowing(context):
+        due = (date.today() + timedelta(days=7)).isoformat()
+        return borrowings_list, {
+            "book": context["book_id"],
+            "expected_return_date": due,
+        }
+
+    def return_one(context):
+        (borrowing_id,) = fresh_borrowings(context["user"], 1)
+        return f"{borrowings_list}{borrowing_id}/return/", None
+
+    def return_batch(context):
+        ids = fresh_borrowings(context["user"], 50)
+        return f"{borrowings_list}return/", {"ids": ids}
+
+    def create_book(context):
+        return books_list, {
+            "title": "Benchmark",
+            "author": "Author",
+            "cover": "SOFT",
+            "inventory": 1,
+            "daily_fee": "1.00",
+        }
+
+    def import_books(context):
+        return f"{books_list}import/?type=csv", import_body()
+
+    def get(path):
+        return lambda context: (path, None)
+
+    anonymous, user, staff = "anonymous", "user", "staff"
+    result = []
+    for role in (anonymous, user, staff):
+        result += [
+            Scenario("books.list", role, "get", get(books_list)),
+            Scenario("books.detail", role, "get", book),
+            Scenario("books.search", role, "get", get(f"{books_list}?search=volume")),
+            Scenario(
+                "books.autocomplete",
+                role,
+                "get",
+                get(f"{books_list}autocomplete/?q=Auth"),
+            ),
+        ]
+    for role in (user, staff):
+        result += [
+            Scenario("borrowings.list", role, "get", get(borrowings_list)),
+            Scenario(
+                "borrowings.list_active",
+                role,
+                "get",
+                get(f"{borrowings_list}?is_active=true"),
+            ),
+            Scenario("borrowings.detail", role, "get", borrowing),
+            Scenario(
+                "borrowings.summary", role, "get", get(f"{borrowings_list}summary/")
+            ),
+            Scenario("borrowings.create", role, "post", create_borrowing, 201),
+            Scenario("borrowings.return", role, "post", return_one),
+            Scenario("borrowings.holds", role, "get", get(f"{borrowings_list}holds/")),
+            Scenario("users.me", role, "get", get("/users/me/")),
+            Scenario("users.me_stats", role, "get", get("/users/me/stats/")),
+            Scenario("users.token", role, "post", token),
+        ]
+    result += [
+        Scenario("users.register", anonymous, "post", register, 201),
+        Scenario("books.create", staff, "post", create_book, 201),
+        Scenario("books.update", staff, "patch", lambda c: (book(c)[0], {})),
+        Scenario("books.import", staff, "post", import_books),
+        Scenario("books.export", staff, "get", get(f"{books_list}export/?type=csv")),
+        Scenario(
+            "borrowings.list_of_user",
+            staff,
+            "get",
+            lambda c: (f"{borrowings_list}?user_id={c['member_id']}", None),
+        ),
+        Scenario("borrowings.bulk_return", staff, "post", return_batch),
+    ]
+    return result
+
+
+def make_clients():
+    from django.contrib.auth import get_user_model
+    from rest_framework.test import APIClient
+
+    from user.serializers import TokenObtainPairSerializerExtended
+
+    User = get_user_model()
+    users = {
+        "user": User.objects.get(email="user0@benchmark.test"),
+        "staff": User.objects.get(email="staff@benchmark.test"),
+    }
+    clients = {"anonymous": (APIClient(), None)}
+    for role, user in users.items():
+        client = APIClient()
+        token = TokenObtainPairSerializerExtended.get_token(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        clients[role] = (client, user)
+    return clients
+
+
+def context_of(user):
+    from django.contrib.auth import get_user_model
+
+    from books.models import Book
+    from borrowing.models import Borrowing
+
+    member = get_user_model().objects.get(email="user0@benchmark.test")
+
+    borrowings = Borrowing.objects.order_by("-id")
+    if user is not None and not user.is_staff:
+        borrowings = borrowings.filter(user_id=user.id)
+    return {
+        "user": user,
+        "member_id": member.id,
+        "email": getattr(user, "email", None),
+        "book_id": Book.objects.order_by("id").values_list("id", flat=True)[0],
+        "borrowing_id": borrowings.values_list("id", flat=True).first(),
+    }
+
+
+def call(client, scenario, path, body):
+    if scenario.name == "books.import":
+        response = client.post(path, body, content_type="text/csv")
+    else:
+        response = getattr(client, scenario.method)(path, body, format="json")
+    if response.streaming:
+        # the rows are generated while the body is read
+        for _ in response.streaming_content:
+            pass
+    if response.status_code != scenario.status:
+        raise AssertionError(f"{path} returned {response.status_code}")
+
+
+def measure(scenario, client, context, warmup, repeats):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    result = Measurement()
+    try:
+        for _ in range(warmup):
+            call(client, scenario, *scenario.request(context))
+        for _ in range(repeats):
+            # the setup of write scenarios is not measured
+            request = scenario.request(context)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                call(client, scenario, *request)
+                elapsed = time.perf_counter() - start
+            result.queries = max(result.queries, len(queries))
+            result.times_ms.append(elapsed * 1000)
+
+        request = scenario.request(context)
+        tracemalloc.start()
+        try:
+            call(client, scenario, *request)
+            result.alloc_kib = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+    except AssertionError as error:
+        result.error = str(error)
+    return result
+
+
+def compare(key, measured, baseline, threshold):
+    """Return the regressions of one scenario against its baseline."""
+    if measured.error:
+        return [measured.error]
+    expected = baseline.get(key)
+    if expected is None:
+        return []
+    current = measured.as_baseline()
+    problems = []
+    if current["queries"] > expected["queries"]:
+        problems.append(f"queries {expected['queries']} -> {current['queries']}")
+    for metric in ("time_ms", "alloc_kib"):
+        if metric in expected and current[metric] > expected[metric] * (1 + threshold):
+            problems.append(f"{metric} {expected[metric]} -> {current[metric]}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--borrowings", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed growth of latency and allocations, %(default)s is +25%%",
+    )
+    parser.add_argument("--only", help="Comma separated scenario names")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--keepdb", action="store_true", help="Keep the seeded database for reruns"
+    )
+    args = parser.parse_args(argv)
+
+    with seeded_database(args.books, args.borrowings, args.users, args.keepdb):
+        results = run(args)
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        baseline.update({key: m.as_baseline() for key, m in results.items()})
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        return 0
+
+    failed = False
+    print(f"{'scenario':<36} {'queries':>7} {'p50 ms':>8} {'alloc KiB':>10}  result")
+    for key, measured in results.items():
+        problems = compare(key, measured, baseline, args.threshold)
+        failed = failed or bool(problems)
+        current = measured.as_baseline() if not measured.error else {}
+        print(
+            f"{key:<36} {current.get('queries', '-'):>7} "
+            f"{current.get('time_ms', '-'):>8} {current.get('alloc_kib', '-'):>10}  "
+            f"{'; '.join(problems) or 'ok'}"
+        )
+    return 1 if failed else 0
+
+
+def run(args):
+    clients = make_clients()
+    only = set(args.only.split(",")) if args.only else None
+    results = {}
+    for scenario in scenarios():
+        if only and scenario.name not in only:
+            continue
+        client, user = clients[scenario.role]
+        context = context_of(user)
+        results[scenario.key] = measure(
+            scenario, client, context, args.warmup, args.repeats
+        )
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Throughput of the borrowing list with and without the fast list path.
+
+Requests full pages of borrowings through the test client, once served
+by `FastListMixin` and once by the DRF serializers, and reports requests
+per second of both for every role, e.g.:
+
+    python -m benchmarks.list_serialization --page-size 100 --requests 200
+"""
+
+import argparse
+import time
+from unittest.mock import patch
+
+from benchmarks.endpoints import make_clients, seeded_database
+
+
+def throughput(client, url, requests):
+    client.get(url)
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--borrowings", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--keepdb", action="store_true")
+    args = parser.parse_args()
+
+    with seeded_database(args.books, args.borrowings, args.users, args.keepdb):
+        from borrowing.views import BorrowingViewSet
+
+        clients = make_clients()
+        url = f"/borrowings/?page_size={args.page_size}"
+        print(f"{'role':<8} {'drf rps':>9} {'fast rps':>9} {'speedup':>8}")
+        for role in ("user", "staff"):
+            client, _ = clients[role]
+            with patch.object(BorrowingViewSet, "fast_list", False):
+                drf = throughput(client, url, args.requests)
+            fast = throughput(client, url, args.requests)
+            print(f"{role:<8} {drf:>9.1f} {fast:>9.1f} {fast / drf:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Minimal closed-loop HTTP load generator.
+
+Every worker thread keeps one keep-alive connection and sends the next
+request as soon as the previous response is read, so the numbers show
+what the server sustains rather than what the client offers.
+"""
+
+import http.client
+import threading
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass
+class LoadResult:
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def requests(self):
+        return len(self.latencies) + self.errors
+
+    @property
+    def rps(self):
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, value):
+        if not self.latencies:
+            return float("nan")
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * value / 100))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rps": round(self.rps, 1),
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+        }
+
+
+def run_load(url, total=1000, concurrency=8, headers=None, timeout=30):
+    """Send `total` GET requests to `url` from `concurrency` threads."""
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+    headers = {"Connection": "keep-alive", **(headers or {})}
+
+    result = LoadResult()
+    lock = threading.Lock()
+    remaining = [total]
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        connection = http.client.HTTPConnection(parts.netloc, timeout=timeout)
+        latencies, errors = [], 0
+        while take():
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+        connection.close()
+        with lock:
+            result.latencies.extend(latencies)
+            result.errors += errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - start
+    return result
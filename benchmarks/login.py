@@ -0,0 +1,64 @@
+"""
+Login throughput of every password hasher policy.
+
+Logs a user in through `POST /users/token/` with each hasher of
+`PASSWORD_HASHER_CLASSES` at the costs of the environment
+(`PASSWORD_PBKDF2_ITERATIONS`, `PASSWORD_ARGON2_MEMORY_COST`, ...) and
+reports milliseconds per login and logins per second of one core, one
+login at a time (argon2 threads over `parallelism` lanes), e.g.:
+
+    python -m benchmarks.login --logins 50
+    PASSWORD_ARGON2_TIME_COST=3 python -m benchmarks.login --policy argon2
+"""
+
+import argparse
+import time
+
+from benchmarks.endpoints import PASSWORD, seeded_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--policy", action="append", help="all by default")
+    parser.add_argument("--keepdb", action="store_true")
+    args = parser.parse_args()
+
+    with seeded_database(1, 1, 1, args.keepdb):
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.hashers import identify_hasher
+        from django.test import override_settings
+        from rest_framework.test import APIClient
+
+        classes = settings.PASSWORD_HASHER_CLASSES
+        client = APIClient()
+        print(f"{'policy':<8} {'cost':<60} {'ms/login':>9} {'logins/s/core':>14}")
+        for policy in args.policy or classes:
+            hashers = [
+                classes[policy],
+                *(p for p in classes.values() if p != classes[policy]),
+            ]
+            with override_settings(PASSWORD_HASHERS=hashers):
+                email = f"login-{policy}@benchmark.test"
+                user, _ = get_user_model().objects.get_or_create(email=email)
+                user.set_password(PASSWORD)
+                user.save()
+                decoded = identify_hasher(user.password).decode(user.password)
+                cost = ",".join(
+                    f"{name}={value}"
+                    for name, value in decoded.items()
+                    if name not in ("algorithm", "hash", "salt", "params", "version")
+                )
+
+                credentials = {"email": email, "password": PASSWORD}
+                start = time.perf_counter()
+                for _ in range(args.logins):
+                    response = client.post("/users/token/", credentials)
+                    assert response.status_code == 200, response.status_code
+                seconds = (time.perf_counter() - start) / args.logins
+            print(f"{policy:<8} {cost:<60} {seconds * 1000:>9.1f} {1 / seconds:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compare `runserver` with the production Gunicorn setup.
+
+Starts every server on a free local port against the database configured
+in `.env`, warms it up and reports requests per second and latency
+percentiles, e.g.:
+
+    python -m benchmarks.serve --path /books/ --requests 5000 --concurrency 32
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from benchmarks.loadgen import run_load
+
+MODES = {
+    "runserver": {
+        "command": ["{python}", "manage.py", "runserver", "{bind}", "--noreload"],
+        "env": {"DEBUG": "True"},
+    },
+    "wsgi": {
+        "command": ["{python}", "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        "env": {"SERVER_INTERFACE": "wsgi"},
+    },
+    "asgi": {
+        "command": ["{python}", "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        "env": {"SERVER_INTERFACE": "asgi"},
+    },
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+@contextmanager
+def run_server(mode, workers=None, threads=None, env=None):
+    """Start the server of `mode` on a free port and yield its base URL."""
+    port = free_port()
+    bind = f"127.0.0.1:{port}"
+    config = MODES[mode]
+    command = [
+        part.format(python=sys.executable, bind=bind) for part in config["command"]
+    ]
+    server_env = {
+        **os.environ,
+        "GUNICORN_BIND": bind,
+        "GUNICORN_ACCESS_LOG": "",
+        # the load would only measure how fast 429s are sent
+        "THROTTLE_ENABLED": "False",
+        **config["env"],
+        **(env or {}),
+    }
+    if workers:
+        server_env["GUNICORN_WORKERS"] = str(workers)
+    if threads:
+        server_env["GUNICORN_THREADS"] = str(threads)
+
+    server = subprocess.Popen(
+        command, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(port)
+        yield f"http://{bind}"
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def benchmark(mode, args, env=None):
+    with run_server(mode, args.workers, args.threads, env) as base_url:
+        url = f"{base_url}{args.path}"
+        run_load(url, total=args.warmup, concurrency=args.concurrency)
+        return run_load(url, total=args.requests, concurrency=args.concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--path", default="/books/")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument(
+        "--modes", default=",".join(MODES), help="Comma separated, from: %(default)s"
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<10} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for mode in args.modes.split(","):
+        summary = benchmark(mode, args).summary()
+        print(
+            f"{mode:<10} {summary['requests']:>9} {summary['errors']:>7} "
+            f"{summary['rps']:>9} {summary['p50_ms']:>8} {summary['p99_ms']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
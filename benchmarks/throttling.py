@@ -0,0 +1,71 @@
+"""
+Cost of one rate limit check with each bucket store.
+
+Runs `TokenBucketThrottle.allow_request` over requests of `--clients`
+different IP addresses, with the in-process store and optionally with
+the Redis store, and reports microseconds per check, e.g.:
+
+    python -m benchmarks.throttling --checks 100000 --redis
+"""
+
+import argparse
+import os
+import time
+
+import django
+
+
+def per_check(throttle, view, requests, checks):
+    for request in requests:
+        throttle.allow_request(request, view)
+    start = time.perf_counter()
+    for i in range(checks):
+        throttle.allow_request(requests[i % len(requests)], view)
+    return (time.perf_counter() - start) / checks * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--checks", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--redis", action="store_true", help="also use REDIS_URL")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Library_service_project.settings")
+    django.setup()
+    from django.test import override_settings
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from Library_service_project.throttling import TokenBucketThrottle
+
+    class View:
+        throttle_scope = "read"
+
+    factory = APIRequestFactory()
+    requests = [
+        Request(factory.get("/books/", REMOTE_ADDR=f"10.0.{i // 256}.{i % 256}"))
+        for i in range(args.clients)
+    ]
+    redis_cache = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+    }
+
+    rates = {"read": f"{args.checks * 10}/s"}
+    print(f"{'store':<14} {'µs/check':>9}")
+    with override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES=rates):
+        with override_settings(THROTTLE_STORE="local"):
+            micros = per_check(TokenBucketThrottle(), View(), requests, args.checks)
+            print(f"{'local':<14} {micros:>9.1f}")
+        if args.redis:
+            with override_settings(
+                THROTTLE_STORE="redis", CACHES={"default": redis_cache}
+            ):
+                checks = args.checks // 10
+                micros = per_check(TokenBucketThrottle(), View(), requests, checks)
+            print(f"{'redis':<14} {micros:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
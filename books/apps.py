@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_index(using, **kwargs):
+    from django.db import connections
+
+    from books.search import install_sqlite_fts
+
+    connection = connections[using]
+    if (
+        connection.vendor == "sqlite"
+        and "books_book" in connection.introspection.table_names()
+    ):
+        install_sqlite_fts(connection)
 
 
 class BooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "books"
+
+    def ready(self):
+        from books import signals  # noqa: F401
+
+        post_migrate.connect(install_search_index, sender=self)
@@ -0,0 +1,95 @@
+"""
+Inventory of many books at once.
+
+`get_availability` reads the inventory of every requested book with one
+primary key query, `id = ANY(array)` on PostgreSQL so the statement has a
+single parameter whatever the number of ids.
+
+With `BOOK_AVAILABILITY_CACHE_TTL` above 0 the values are kept in a cache
+local to the process for that many seconds. Borrows and returns of this
+process adjust the cached values once committed and book edits drop
+them; changes made by other processes are seen when the entries expire.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Lookup
+
+from books.models import Book
+
+
+class AvailabilityCache:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, ids):
+        """Return the cached inventories of `ids` and the ids not cached."""
+        now = self.clock()
+        found, missing = {}, []
+        for book_id in ids:
+            entry = self._entries.get(book_id)
+            if entry is not None and entry[1] > now:
+                found[book_id] = entry[0]
+            else:
+                missing.append(book_id)
+        return found, missing
+
+    def set_many(self, inventories, ttl):
+        expires = self.clock() + ttl
+        with self._lock:
+            for book_id, inventory in inventories.items():
+                self._entries[book_id] = (inventory, expires)
+
+    def adjust(self, book_id, delta):
+        with self._lock:
+            entry = self._entries.get(book_id)
+            if entry is not None:
+                self._entries[book_id] = (max(entry[0] + delta, 0), entry[1])
+
+    def discard(self, book_id):
+        with self._lock:
+            self._entries.pop(book_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+availability_cache = AvailabilityCache()
+
+
+class AnyOf(Lookup):
+    """`lhs = ANY(%s)` with the whole list of ids as a single array parameter."""
+
+    lookup_name = "any"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        return f"{lhs} = ANY(%s::bigint[])", [*lhs_params, list(self.rhs)]
+
+
+def _filter_ids(queryset, ids):
+    if connections[queryset.db].vendor == "postgresql":
+        return queryset.filter(AnyOf(F("id"), ids))
+    return queryset.filter(id__in=ids)
+
+
+def get_availability(ids):
+    """Map every id of `ids` to the inventory of the book, None if unknown."""
+    ids = list(dict.fromkeys(ids))
+    ttl = settings.BOOK_AVAILABILITY_CACHE_TTL
+    found, missing = availability_cache.get_many(ids) if ttl else ({}, ids)
+    if missing:
+        fetched = dict(
+            _filter_ids(Book.objects.order_by(), missing).values_list("id", "inventory")
+        )
+        if ttl:
+            availability_cache.set_many(fetched, ttl)
+        found.update(fetched)
+    return {book_id: found.get(book_id) for book_id in ids}
@@ -0,0 +1,196 @@
+"""
+Bulk import and export of the book catalogue.
+
+Input is read line by line and written in chunks with a single
+`INSERT ... ON CONFLICT (isbn) DO UPDATE` per chunk, so importing a large
+file neither validates every row through a serializer nor holds the whole
+file in memory.
+"""
+
+import csv
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from books.availability import availability_cache
+from books.cache import bump_catalogue_version
+from books.models import Book
+from books.signals import books_restocked
+
+FORMATS = ("csv", "ndjson")
+IMPORT_FIELDS = ("isbn", "title", "author", "cover", "inventory", "daily_fee")
+EXPORT_FIELDS = ("id", *IMPORT_FIELDS)
+UPDATE_FIELDS = ("title", "author", "cover", "inventory", "daily_fee", "updated_at")
+
+ISBN_RE = re.compile(r"^(\d{9}[\dX]|\d{13})$")
+MAX_DAILY_FEE = Decimal("9999.99")
+
+
+class ImportFormatError(ValueError):
+    """The input cannot be read at all, as opposed to a single bad row."""
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def clean_row(row):
+    """
+    Validate one input row.
+
+    Returns `(values, errors)` where `values` are ready to be passed to
+    `Book` and `errors` maps field names to messages.
+    """
+    values, errors = {}, {}
+
+    isbn = _text(row.get("isbn")).replace("-", "").replace(" ", "").upper()
+    if not ISBN_RE.match(isbn):
+        errors["isbn"] = "Enter a valid ISBN-10 or ISBN-13."
+    values["isbn"] = isbn
+
+    for name in ("title", "author"):
+        value = _text(row.get(name))
+        max_length = Book._meta.get_field(name).max_length
+        if not value:
+            errors[name] = "This field is required."
+        elif len(value) > max_length:
+            errors[name] = (
+                f"Ensure this field has no more than {max_length} characters."
+            )
+        values[name] = value
+
+    cover = _text(row.get("cover")).upper()
+    if cover not in Book.COVER_CHOICES:
+        errors["cover"] = f"Must be one of: {', '.join(Book.COVER_CHOICES)}."
+    values["cover"] = cover
+
+    inventory = row.get("inventory")
+    try:
+        if isinstance(inventory, (bool, float)):
+            raise ValueError
+        values["inventory"] = int(_text(inventory))
+        if values["inventory"] < 0:
+            raise ValueError
+    except ValueError:
+        errors["inventory"] = "Enter a whole number greater than or equal to 0."
+
+    try:
+        daily_fee = Decimal(_text(row.get("daily_fee")))
+        if not Decimal("0.01") <= daily_fee <= MAX_DAILY_FEE:
+            raise InvalidOperation
+        if daily_fee.as_tuple().exponent < -2:
+            raise InvalidOperation
+        values["daily_fee"] = daily_fee
+    except InvalidOperation:
+        errors["daily_fee"] = (
+            f"Enter a number between 0.01 and {MAX_DAILY_FEE} "
+            f"with at most 2 decimal places."
+        )
+
+    return values, errors
+
+
+def _decode(stream):
+    for line in stream:
+        yield line.decode("utf-8-sig") if isinstance(line, bytes) else line
+
+
+def read_csv(stream):
+    """Yield `(line, row, error)` for every record of a CSV file with a header."""
+    reader = csv.DictReader(_decode(stream))
+    missing = set(IMPORT_FIELDS) - set(reader.fieldnames or ())
+    if missing:
+        raise ImportFormatError(
+            f"CSV header is missing columns: {', '.join(sorted(missing))}."
+        )
+    for row in reader:
+        yield reader.line_num, row, None
+
+
+def read_ndjson(stream):
+    """Yield `(line, row, error)` for every line of a newline-delimited JSON file."""
+    for number, line in enumerate(_decode(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON."
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Expected a JSON object."
+            continue
+        yield number, row, None
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def _write_chunk(books):
+    # an INSERT cannot update the same row twice, the last row of a
+    # duplicated ISBN wins
+    unique = list({book.isbn: book for book in books}.values())
+    with transaction.atomic():
+        Book.objects.bulk_create(
+            unique,
+            update_conflicts=True,
+            unique_fields=["isbn"],
+            update_fields=UPDATE_FIELDS,
+        )
+        books_restocked.send(
+            sender=Book,
+            book_ids=[book.pk for book in unique if book.inventory > 0],
+        )
+        bump_catalogue_version()
+        transaction.on_commit(availability_cache.clear)
+    return len(unique)
+
+
+def import_books(stream, input_format="csv", chunk_size=1000, max_errors=1000):
+    """
+    Insert or update books read from `stream`, matched by ISBN.
+
+    Every chunk is written in its own transaction and valid rows are
+    written even if other rows fail. Returns a report with the number of
+    processed and imported rows and the errors of up to `max_errors`
+    rows, each with its line number in the input.
+    """
+    if input_format not in READERS:
+        raise ImportFormatError(
+            f"Unsupported format, use one of: {', '.join(FORMATS)}."
+        )
+
+    report = {"processed": 0, "imported": 0, "failed": 0, "errors": []}
+    chunk = []
+    for line, row, error in READERS[input_format](stream):
+        report["processed"] += 1
+        if error:
+            values, errors = None, {"non_field_errors": error}
+        else:
+            values, errors = clean_row(row)
+
+        if errors:
+            report["failed"] += 1
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"line": line, "errors": errors})
+            continue
+
+        chunk.append(Book(**values))
+        if len(chunk) >= chunk_size:
+            report["imported"] += _write_chunk(chunk)
+            chunk = []
+
+    if chunk:
+        report["imported"] += _write_chunk(chunk)
+    return report
+
+
+def export_rows(chunk_size=2000):
+    """Yield every book as a tuple of `EXPORT_FIELDS` without caching the queryset."""
+    return (
+        Book.objects.order_by("id")
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
@@ -0,0 +1,126 @@
+"""
+Read-through cache for book responses.
+
+Cache keys embed a catalogue version number that is bumped whenever a
+book changes, so stale entries are never read again and simply expire.
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = "books:version"
+HITS_KEY = "books:cache:hits"
+MISSES_KEY = "books:cache:misses"
+
+
+def get_books_cache():
+    return caches[settings.BOOKS_CACHE_ALIAS]
+
+
+def get_catalogue_version():
+    cache = get_books_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # start from a fresh number, so an evicted version key can never
+        # make old entries valid again
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def _bump():
+    cache = get_books_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_catalogue_version():
+    """
+    Invalidate every cached book response.
+
+    Bumps right away and once more after the surrounding transaction
+    commits, so a response cached from not yet committed data is dropped.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _count(key):
+    cache = get_books_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_cache_stats():
+    cache = get_books_cache()
+    return {
+        "hits": cache.get(HITS_KEY, 0),
+        "misses": cache.get(MISSES_KEY, 0),
+    }
+
+
+class CachedResponseMixin:
+    """
+    Serve `list` and `retrieve` from the books cache.
+
+    Responses are keyed by the action, the path and the sorted query
+    parameters. Only successful responses are stored, together with their
+    validators, so conditional GETs are answered from the cache as well.
+    """
+
+    cached_headers = ("X-Total-Count", "ETag", "Last-Modified")
+
+    def get_cache_key(self, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        raw = f"{request.get_host()}{request.path}?{query}"
+        digest = hashlib.md5(raw.encode("utf-8")).hexdigest()
+        return f"books:response:{get_catalogue_version()}:{self.action}:{digest}"
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_books_cache()
+        key = self.get_cache_key(request)
+
+        cached = cache.get(key)
+        if cached is not None:
+            _count(HITS_KEY)
+            data, headers = cached
+            response = get_conditional_response(
+                request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+                response=Response(data, headers=headers),
+            )
+            response["X-Cache"] = "HIT"
+            return response
+
+        _count(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            headers = {
+                name: response[name]
+                for name in self.cached_headers
+                if response.has_header(name)
+            }
+            cache.set(key, (response.data, headers), settings.BOOKS_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
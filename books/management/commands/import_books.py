@@ -0,0 +1,54 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.bulk import FORMATS, ImportFormatError, import_books
+
+
+class Command(BaseCommand):
+    help = "Create or update books from a CSV or NDJSON file, matched by ISBN."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, '-' reads stdin.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Input format, guessed from the file extension by default.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--max-errors",
+            type=int,
+            default=100,
+            help="Maximum number of rejected rows to report.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+
+        try:
+            if path == "-":
+                report = self._import(sys.stdin, input_format, options)
+            else:
+                with open(path, encoding="utf-8-sig", newline="") as stream:
+                    report = self._import(stream, input_format, options)
+        except (OSError, ImportFormatError) as error:
+            raise CommandError(error)
+
+        for error in report["errors"]:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"Processed {report['processed']} rows, imported {report['imported']} "
+            f"books, rejected {report['failed']} rows."
+        )
+
+    @staticmethod
+    def _import(stream, input_format, options):
+        return import_books(
+            stream,
+            input_format,
+            chunk_size=options["chunk_size"],
+            max_errors=options["max_errors"],
+        )
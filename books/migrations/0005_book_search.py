@@ -0,0 +1,87 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:34
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION books_book_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.author, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER books_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, search_vector ON books_book
+    FOR EACH ROW EXECUTE FUNCTION books_book_search_vector_update()
+    """,
+    "UPDATE books_book SET search_vector = NULL",
+    "CREATE INDEX book_search_vector_idx ON books_book USING gin (search_vector)",
+    # istartswith compiles to UPPER("title"::text) LIKE UPPER(...)
+    """
+    CREATE INDEX book_title_trgm_idx
+    ON books_book USING gin (UPPER(title::text) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX book_author_trgm_idx
+    ON books_book USING gin (UPPER(author::text) gin_trgm_ops)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS book_author_trgm_idx",
+    "DROP INDEX IF EXISTS book_title_trgm_idx",
+    "DROP INDEX IF EXISTS book_search_vector_idx",
+    "DROP TRIGGER IF EXISTS books_book_search_vector_trigger ON books_book",
+    "DROP FUNCTION IF EXISTS books_book_search_vector_update()",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS books_book_fts_insert",
+    "DROP TRIGGER IF EXISTS books_book_fts_delete",
+    "DROP TRIGGER IF EXISTS books_book_fts_update",
+    "DROP TABLE IF EXISTS books_book_fts",
+]
+
+
+def install_search(apps, schema_editor):
+    # The SQLite FTS5 table is installed by the post_migrate handler in
+    # books.apps, because SQLite loses triggers on every table rebuild.
+    if schema_editor.connection.vendor == "postgresql":
+        for sql in POSTGRESQL_FORWARD:
+            schema_editor.execute(sql)
+
+
+def remove_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        statements = POSTGRESQL_BACKWARD
+    elif vendor == "sqlite":
+        statements = SQLITE_BACKWARD
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_book_title_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(install_search, remove_search),
+    ]
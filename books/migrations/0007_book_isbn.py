@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0006_book_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="isbn",
+            field=models.CharField(blank=True, max_length=13, null=True, unique=True),
+        ),
+    ]
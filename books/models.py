@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -5,6 +6,7 @@ from django.db import models
 class Book(models.Model):
     COVER_CHOICES = {"SOFT": "soft", "HARD": "hard"}
 
+    isbn = models.CharField(max_length=13, unique=True, null=True, blank=True)
     title = models.CharField(max_length=63)
     author = models.CharField(max_length=63)
     cover = models.CharField(
@@ -19,9 +21,15 @@ class Book(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(0.01)],
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # maintained by a database trigger on PostgreSQL, unused on SQLite
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f"Title: {self.title}, Author: {self.author}"
 
     class Meta:
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title", "id"], name="book_title_idx"),
+        ]
@@ -0,0 +1,136 @@
+"""
+Full-text and prefix search over the book catalogue.
+
+On PostgreSQL `Book.search_vector` is kept up to date by a trigger and
+served by a GIN index, prefix lookups use trigram indexes (see migration
+0005). On SQLite the same queries run against an FTS5 table.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# title matches weigh twice as much as author matches
+SQLITE_RANK = "-bm25(books_book_fts, 10.0, 5.0)"
+
+SQLITE_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_book_fts USING fts5(
+        title,
+        author,
+        content='books_book',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+"""
+
+SQLITE_FTS_TRIGGERS = {
+    "books_book_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS books_book_fts_insert
+        AFTER INSERT ON books_book BEGIN
+            INSERT INTO books_book_fts(rowid, title, author)
+            VALUES (new.id, new.title, new.author);
+        END
+    """,
+    "books_book_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS books_book_fts_delete
+        AFTER DELETE ON books_book BEGIN
+            INSERT INTO books_book_fts(books_book_fts, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+        END
+    """,
+    "books_book_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS books_book_fts_update
+        AFTER UPDATE OF title, author ON books_book BEGIN
+            INSERT INTO books_book_fts(books_book_fts, rowid, title, author)
+            VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_book_fts(rowid, title, author)
+            VALUES (new.id, new.title, new.author);
+        END
+    """,
+}
+
+
+def install_sqlite_fts(connection):
+    """
+    Create the FTS5 index of `books_book` if it is missing.
+
+    SQLite drops triggers whenever Django rebuilds a table during a
+    migration, so this runs after every `migrate` and rebuilds the index
+    when any trigger had to be recreated.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+            % ", ".join(["%s"] * len(SQLITE_FTS_TRIGGERS)),
+            list(SQLITE_FTS_TRIGGERS),
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing == set(SQLITE_FTS_TRIGGERS):
+            return
+
+        cursor.execute(SQLITE_FTS_TABLE)
+        for sql in SQLITE_FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute("INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')")
+
+
+def _tokens(text):
+    return TOKEN_RE.findall(text)
+
+
+def search_books(queryset, text):
+    """
+    Filter `queryset` to books matching `text` and annotate a `rank`,
+    higher is better.
+    """
+    if not _tokens(text):
+        return queryset.none()
+
+    if connections[queryset.db].vendor == "postgresql":
+        query = SearchQuery(text, config="simple", search_type="websearch")
+        return queryset.filter(search_vector=query).annotate(
+            # float8 so the rank survives a round trip through the cursor
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+
+    match = " ".join(f'"{token}"' for token in _tokens(text))
+    return queryset.filter(
+        id__in=RawSQL(
+            "SELECT rowid FROM books_book_fts WHERE books_book_fts MATCH %s",
+            (match,),
+        )
+    ).annotate(
+        rank=RawSQL(
+            f"SELECT {SQLITE_RANK} FROM books_book_fts "
+            f"WHERE books_book_fts MATCH %s AND rowid = books_book.id",
+            (match,),
+            output_field=FloatField(),
+        )
+    )
+
+
+def autocomplete_books(queryset, prefix):
+    """Filter `queryset` to books whose title or author starts with `prefix`."""
+    tokens = _tokens(prefix)
+    if not tokens:
+        return queryset.none()
+
+    if connections[queryset.db].vendor == "postgresql":
+        return queryset.filter(
+            Q(title__istartswith=prefix) | Q(author__istartswith=prefix)
+        )
+
+    phrase = " + ".join(f'"{token}"' for token in tokens)
+    return queryset.filter(
+        id__in=RawSQL(
+            "SELECT rowid FROM books_book_fts WHERE books_book_fts MATCH %s",
+            (f"{{title author}} : ^ {phrase} *",),
+        )
+    )
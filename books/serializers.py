@@ -7,9 +7,25 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = (
+            "isbn",
             "title",
             "author",
             "cover",
             "inventory",
             "daily_fee",
         )
+
+
+class BookAvailabilitySerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        # bigint range of the ids, larger ones cannot be bound to the query
+        child=serializers.IntegerField(min_value=1, max_value=2**63 - 1),
+        allow_empty=False,
+        max_length=5000,
+    )
+
+
+class BookAutocompleteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ("id", "title", "author")
@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils.timezone import now
+
+from books.availability import availability_cache
+from books.cache import bump_catalogue_version
+from books.models import Book
+
+
+def reserve_copy(book_id):
+    """
+    Take one copy of the book off the shelf.
+
+    The decrement is a single conditional UPDATE, so concurrent borrowers
+    can never push the inventory below zero. Its row lock is held until
+    the surrounding transaction commits, so concurrent borrowers of the
+    same book wait for each other. Returns False when the book is out of
+    stock.
+    """
+    reserved = Book.objects.filter(pk=book_id, inventory__gt=0).update(
+        inventory=F("inventory") - 1, updated_at=now()
+    )
+    if reserved:
+        bump_catalogue_version()
+        transaction.on_commit(lambda: availability_cache.adjust(book_id, -1))
+    return reserved == 1
+
+
+def release_copies_of_books(counts):
+    """
+    Put copies of several books back on the shelf, `counts` maps a book id
+    to the number of copies. All books are updated by one statement.
+    """
+    if not counts:
+        return
+    Book.objects.filter(pk__in=counts).update(
+        inventory=F("inventory")
+        + Case(
+            *(When(pk=book_id, then=Value(count)) for book_id, count in counts.items()),
+            output_field=IntegerField(),
+        ),
+        updated_at=now(),
+    )
+    bump_catalogue_version()
+
+    def adjust():
+        for book_id, count in counts.items():
+            availability_cache.adjust(book_id, count)
+
+    transaction.on_commit(adjust)
+
+
+def take_copies_of_books(counts):
+    """
+    Take copies of several books off the shelf, the opposite of
+    `release_copies_of_books`. The caller holds the locks of the books and
+    makes sure they have as many copies.
+    """
+    release_copies_of_books({book_id: -count for book_id, count in counts.items()})
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from books.availability import availability_cache
+from books.cache import bump_catalogue_version
+from books.models import Book
+
+
+# sent with `book_ids` inside the transaction that set the inventory of
+# existing books, other than by borrowing or returning copies
+books_restocked = Signal()
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_books_cache(sender, instance, **kwargs):
+    bump_catalogue_version()
+    availability_cache.discard(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+def announce_restock(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and instance.inventory > 0:
+        books_restocked.send(sender=Book, book_ids=[instance.pk])
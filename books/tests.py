@@ -1,11 +1,24 @@
+import io
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from books.availability import availability_cache
+from books.cache import get_books_cache, get_cache_stats
 from books.models import Book
+from books.pagination import BookPagination
+from books.search import search_books
 from books.serializers import BookSerializer
+from books.services import reserve_copy
+from Library_service_project.query_plans import QueryPlanAssertionsMixin
 
 BOOK_URL = reverse("books:book-list")
 
@@ -32,7 +45,7 @@ def _test_book_list(self):
     res = self.client.get(BOOK_URL)
     books = Book.objects.all()
     serializer = BookSerializer(books, many=True)
-    self.assertEqual(res.data, serializer.data)
+    self.assertEqual(res.data["results"], serializer.data)
     self.assertEqual(res.status_code, status.HTTP_200_OK)
 
 
@@ -119,3 +132,488 @@ class AdminBookTest(TestCase):
         book_count = Book.objects.count()
         self.assertEqual(book_count, 0)
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class BookPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for title in ("b", "a", "c", "a", "b"):
+            sample_book(title=title)
+
+    def _walk(self, url, params=None):
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data)
+            if not res.data["next"]:
+                return pages
+            res = self.client.get(res.data["next"])
+
+    def test_pages_follow_title_and_id_ordering(self):
+        pages = self._walk(BOOK_URL, {"page_size": 2})
+        expected = BookSerializer(Book.objects.order_by("title", "id"), many=True)
+
+        self.assertEqual([len(page["results"]) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [book for page in pages for book in page["results"]], expected.data
+        )
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get(BOOK_URL, {"page_size": 2})
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertEqual(back.data["results"], first.data["results"])
+        self.assertIsNotNone(back.data["next"])
+
+    def test_page_size_is_capped(self):
+        with patch.object(BookPagination, "max_page_size", 3):
+            res = self.client.get(BOOK_URL, {"page_size": 1000})
+
+        self.assertEqual(len(res.data["results"]), 3)
+
+    def test_total_count_header_is_opt_in(self):
+        res = self.client.get(BOOK_URL)
+        self.assertNotIn("X-Total-Count", res)
+
+        res = self.client.get(BOOK_URL, {"count": "true"})
+        self.assertEqual(res["X-Total-Count"], "5")
+
+    def test_total_count_can_be_disabled(self):
+        with patch.object(BookPagination, "allow_total_count", False):
+            res = self.client.get(BOOK_URL, {"count": "true"})
+
+        self.assertNotIn("X-Total-Count", res)
+
+    def test_invalid_cursor(self):
+        res = self.client.get(BOOK_URL, {"cursor": "not-a-cursor"})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookQueryPlanTest(QueryPlanAssertionsMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Book.objects.bulk_create(
+            Book(
+                title=f"book {number % 50}",
+                author="author",
+                cover="SOFT",
+                inventory=1,
+                daily_fee=1,
+            )
+            for number in range(200)
+        )
+
+    def test_list_queries_use_indexes(self):
+        res = self.assertNoSequentialScans(self.client.get, BOOK_URL)
+        self.assertNoSequentialScans(self.client.get, res.data["next"])
+
+
+class BookSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.hobbit = sample_book(title="The Hobbit", author="J. R. R. Tolkien")
+        self.rings = sample_book(title="The Lord of the Rings", author="Tolkien")
+        self.potter = sample_book(title="Harry Potter", author="J. K. Rowling")
+        self.harrison = sample_book(title="Potter about", author="Harry Harrison")
+
+    def _search(self, text, **params):
+        res = self.client.get(BOOK_URL, {"search": text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [book["title"] for book in res.data["results"]]
+
+    def test_search_matches_title_and_author(self):
+        self.assertEqual(
+            sorted(self._search("tolkien")), ["The Hobbit", "The Lord of the Rings"]
+        )
+        self.assertEqual(self._search("hobbit tolkien"), ["The Hobbit"])
+        self.assertEqual(self._search("dragons"), [])
+
+    def test_title_match_ranks_above_author_match(self):
+        self.assertEqual(self._search("harry"), ["Harry Potter", "Potter about"])
+
+    def test_search_results_are_paginated(self):
+        first = self.client.get(BOOK_URL, {"search": "potter", "page_size": 1})
+        second = self.client.get(first.data["next"])
+
+        titles = [first.data["results"][0]["title"], second.data["results"][0]["title"]]
+        self.assertEqual(sorted(titles), ["Harry Potter", "Potter about"])
+        self.assertIsNone(second.data["next"])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.hobbit.title = "There and Back Again"
+        self.hobbit.save()
+        self.rings.delete()
+
+        self.assertEqual(self._search("hobbit"), [])
+        self.assertEqual(self._search("tolkien"), ["There and Back Again"])
+
+    def test_autocomplete_by_prefix(self):
+        url = reverse("books:book-autocomplete")
+
+        res = self.client.get(url, {"q": "har"})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data,
+            [
+                {
+                    "id": self.potter.id,
+                    "title": "Harry Potter",
+                    "author": "J. K. Rowling",
+                },
+                {
+                    "id": self.harrison.id,
+                    "title": "Potter about",
+                    "author": "Harry Harrison",
+                },
+            ],
+        )
+
+        res = self.client.get(url, {"q": "the lo"})
+        self.assertEqual([book["id"] for book in res.data], [self.rings.id])
+
+        res = self.client.get(url, {"q": "har", "limit": 1})
+        self.assertEqual(len(res.data), 1)
+
+
+LOCMEM_CACHE = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "books-tests",
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BookCacheTest(TestCase):
+    def setUp(self):
+        get_books_cache().clear()
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            email="admin@test.test", password="testpassword", is_staff=True
+        )
+        self.book = sample_book(title="cached")
+
+    def test_list_is_served_from_cache(self):
+        first = self.client.get(BOOK_URL, {"count": "true"})
+        with self.assertNumQueries(0):
+            second = self.client.get(BOOK_URL, {"count": "true"})
+
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["X-Total-Count"], "1")
+        self.assertEqual(get_cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get(BOOK_URL, {"page_size": 1, "count": "true"})
+        res = self.client.get(BOOK_URL, {"count": "true", "page_size": 1})
+        self.assertEqual(res["X-Cache"], "HIT")
+
+        res = self.client.get(BOOK_URL, {"page_size": 2})
+        self.assertEqual(res["X-Cache"], "MISS")
+
+    def test_write_invalidates_list_and_detail(self):
+        url = retrieve_url("book", self.book.id)
+        self.client.get(BOOK_URL)
+        self.client.get(url)
+
+        self.client.force_authenticate(self.admin)
+        self.client.patch(url, {"title": "renamed"})
+
+        list_res = self.client.get(BOOK_URL)
+        detail_res = self.client.get(url)
+        self.assertEqual(list_res["X-Cache"], "MISS")
+        self.assertEqual(list_res.data["results"][0]["title"], "renamed")
+        self.assertEqual(detail_res["X-Cache"], "MISS")
+        self.assertEqual(detail_res.data["title"], "renamed")
+
+    def test_inventory_changes_invalidate_cache(self):
+        url = retrieve_url("book", self.book.id)
+        self.client.get(url)
+
+        reserve_copy(self.book.id)
+
+        res = self.client.get(url)
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertEqual(res.data["inventory"], 0)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches_setting = {
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                }
+            }
+            with override_settings(CACHES=caches_setting):
+                self.client.get(BOOK_URL)
+                res = self.client.get(BOOK_URL)
+
+        self.assertEqual(res["X-Cache"], "HIT")
+
+
+class BookConditionalRequestTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            email="admin@test.test", password="testpassword", is_staff=True
+        )
+        self.book = sample_book()
+        self.url = retrieve_url("book", self.book.id)
+
+    def test_detail_not_modified(self):
+        res = self.client.get(self.url)
+        self.assertIn("ETag", res)
+        self.assertIn("Last-Modified", res)
+
+        with patch.object(BookSerializer, "to_representation") as to_representation:
+            res = self.client.get(self.url, HTTP_IF_NONE_MATCH=res["ETag"])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        to_representation.assert_not_called()
+
+    def test_detail_if_modified_since(self):
+        res = self.client.get(self.url)
+        res = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=res["Last-Modified"])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_changes_when_a_book_changes(self):
+        first = self.client.get(BOOK_URL)
+        self.assertNotIn("Last-Modified", first)
+        res = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        reserve_copy(self.book.id)
+
+        res = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], first["ETag"])
+
+    def test_list_etag_changes_when_a_book_is_deleted(self):
+        other = sample_book(title="other")
+        first = self.client.get(BOOK_URL)
+
+        other.delete()
+
+        res = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_cached_response_not_modified(self):
+        get_books_cache().clear()
+        first = self.client.get(BOOK_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BOOK_URL, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res["X-Cache"], "HIT")
+
+    def test_update_if_match(self):
+        self.client.force_authenticate(self.admin)
+        etag = self.client.get(self.url)["ETag"]
+
+        res = self.client.patch(self.url, {"title": "first"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+        res = self.client.patch(self.url, {"title": "second"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.title, "first")
+
+
+class BookBulkTest(TestCase):
+    IMPORT_URL = reverse("books:book-bulk-import")
+    EXPORT_URL = reverse("books:book-bulk-export")
+    HEADER = "isbn,title,author,cover,inventory,daily_fee\n"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_user(
+            email="admin@test.test", password="testpassword", is_staff=True
+        )
+        self.client.force_authenticate(self.admin)
+
+    def _import(self, body, content_type="text/csv", **params):
+        url = self.IMPORT_URL
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        return self.client.generic("POST", url, body, content_type=content_type)
+
+    def test_csv_import_reports_rejected_rows(self):
+        res = self._import(
+            self.HEADER
+            + "978-0-306-40615-7,Dune,Frank Herbert,hard,3,1.50\n"
+            + "123,,Nobody,paper,-1,0\n"
+            + "0306406152,Emma,Jane Austen,SOFT,1,2\n"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["processed"], 3)
+        self.assertEqual(res.data["imported"], 2)
+        self.assertEqual(res.data["failed"], 1)
+        error = res.data["errors"][0]
+        self.assertEqual(error["line"], 3)
+        self.assertEqual(
+            set(error["errors"]),
+            {"isbn", "title", "cover", "inventory", "daily_fee"},
+        )
+        dune = Book.objects.get(isbn="9780306406157")
+        self.assertEqual((dune.cover, dune.inventory), ("HARD", 3))
+        self.assertEqual(search_books(Book.objects.all(), "dune").get(), dune)
+
+    def test_import_updates_books_by_isbn(self):
+        book = sample_book(isbn="9780306406157", title="Old")
+
+        res = self._import(
+            '{"isbn": "9780306406157", "title": "First", "author": "A", '
+            '"cover": "SOFT", "inventory": 1, "daily_fee": "1.00"}\n'
+            "not json\n"
+            '{"isbn": "9780306406157", "title": "Second", "author": "A", '
+            '"cover": "SOFT", "inventory": 7, "daily_fee": "1.00"}\n',
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(res.data["imported"], 1)
+        self.assertEqual(res.data["errors"][0]["line"], 2)
+        self.assertEqual(Book.objects.count(), 1)
+        book.refresh_from_db()
+        self.assertEqual((book.title, book.inventory), ("Second", 7))
+
+    def test_missing_csv_columns(self):
+        res = self._import("isbn,title\n0306406152,Emma\n")
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Book.objects.count(), 0)
+
+    def test_bulk_endpoints_are_admin_only(self):
+        user = get_user_model().objects.create_user(
+            email="test@test.test", password="testpassword"
+        )
+        self.client.force_authenticate(user)
+
+        self.assertEqual(
+            self._import(self.HEADER).status_code, status.HTTP_403_FORBIDDEN
+        )
+        self.assertEqual(
+            self.client.get(self.EXPORT_URL).status_code, status.HTTP_403_FORBIDDEN
+        )
+
+    def test_export_streams_every_book(self):
+        first = sample_book(isbn="0306406152", title="Emma")
+        second = sample_book(title="Dune", daily_fee="1.50")
+
+        res = self.client.get(self.EXPORT_URL)
+        self.assertTrue(res.streaming)
+        lines = b"".join(res.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                "id,isbn,title,author,cover,inventory,daily_fee",
+                f"{first.id},0306406152,Emma,author,soft,1,1.00",
+                f"{second.id},,Dune,author,soft,1,1.50",
+            ],
+        )
+
+        res = self.client.get(self.EXPORT_URL, {"type": "ndjson"})
+        rows = [json.loads(line) for line in b"".join(res.streaming_content).split()]
+        self.assertEqual(rows[0]["isbn"], "0306406152")
+        self.assertEqual(rows[1]["daily_fee"], "1.50")
+
+    def test_export_round_trips_through_import(self):
+        sample_book(isbn="0306406152", title="Emma", cover="HARD")
+        exported = b"".join(
+            self.client.get(self.EXPORT_URL, {"type": "ndjson"}).streaming_content
+        )
+        Book.objects.update(title="Changed")
+
+        res = self._import(exported, content_type="application/x-ndjson")
+
+        self.assertEqual(res.data["imported"], 1)
+        self.assertEqual(Book.objects.get().title, "Emma")
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as source:
+            source.write(self.HEADER + "0306406152,Emma,Jane Austen,soft,2,1\n")
+            source.flush()
+            out = io.StringIO()
+            call_command("import_books", source.name, "--chunk-size=1", stdout=out)
+
+        self.assertIn("imported 1 books", out.getvalue())
+        self.assertEqual(Book.objects.get().isbn, "0306406152")
+
+
+class RequestInstrumentationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        sample_book()
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        res = self.client.get(BOOK_URL)
+
+        timing = res["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="1 queries"')
+        self.assertRegex(timing, r"serialize;dur=[\d.]+")
+        self.assertRegex(timing, r"total;dur=[\d.]+$")
+
+    @override_settings(SERVER_TIMING=False)
+    def test_no_header_when_disabled(self):
+        self.assertNotIn("Server-Timing", self.client.get(BOOK_URL))
+
+    def test_slow_request_is_logged_and_profiled(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            SLOW_REQUEST_MS=0, PROFILE_SAMPLE_RATE=1, PROFILE_DIR=directory
+        ), self.assertLogs("library.requests", "WARNING") as logs:
+            self.client.get(BOOK_URL)
+            profiles = os.listdir(directory)
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record["path"], BOOK_URL)
+        self.assertEqual(record["db_queries"], 1)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].endswith("-GET-books.prof"))
+
+
+class BookAvailabilityTest(TestCase):
+    URL = reverse("books:book-availability")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.books = [sample_book(title=f"book{i}", inventory=i) for i in range(3)]
+        self.ids = [book.id for book in self.books]
+        availability_cache.clear()
+        self.addCleanup(availability_cache.clear)
+
+    def _availability(self, ids, queries):
+        with self.assertNumQueries(queries):
+            res = self.client.post(self.URL, {"ids": ids}, format="json")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.json()
+
+    def test_inventories_in_one_query(self):
+        data = self._availability([*self.ids, 999, self.ids[0]], queries=1)
+
+        self.assertEqual(
+            data, {**{str(book.id): book.inventory for book in self.books}, "999": None}
+        )
+
+    def test_invalid_ids(self):
+        for ids in ([], ["a"], [2**63], list(range(1, 5002))):
+            res = self.client.post(self.URL, {"ids": ids}, format="json")
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BOOK_AVAILABILITY_CACHE_TTL=60)
+    def test_cache_follows_borrows_and_edits(self):
+        self._availability(self.ids, queries=1)
+        self.assertEqual(self._availability(self.ids, queries=0)[str(self.ids[2])], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_copy(self.ids[2])
+        self.assertEqual(self._availability(self.ids, queries=0)[str(self.ids[2])], 1)
+
+        Book.objects.get(pk=self.ids[1]).save()
+        self.assertEqual(self._availability(self.ids, queries=1)[str(self.ids[1])], 1)
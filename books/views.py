@@ -1,17 +1,54 @@
 from django.shortcuts import render
-from drf_spectacular.utils import extend_schema, extend_schema_view
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticatedOrReadOnly,
+)
+from rest_framework.response import Response
 
+from Library_service_project.conditional import (
+    ConditionalGetMixin,
+    ConditionalUpdateMixin,
+)
+from Library_service_project.streaming import streaming_response
+from books.availability import get_availability
+from books.bulk import (
+    EXPORT_FIELDS,
+    FORMATS,
+    ImportFormatError,
+    export_rows,
+    import_books,
+)
+from books.cache import CachedResponseMixin
 from books.models import Book
+from books.pagination import BookPagination
 from books.permissions import IsAdminOrReadOnly
-from books.serializers import BookSerializer
+from books.search import autocomplete_books, search_books
+from books.serializers import (
+    BookSerializer,
+    BookAutocompleteSerializer,
+    BookAvailabilitySerializer,
+)
 
 
 @extend_schema_view(
     list=extend_schema(
         summary="List all books",
-        description="Retrieve a list of all books in the system. Accessible to all users.",
+        description=(
+            "Retrieve a cursor-paginated list of books ordered by title. "
+            "With `search`, books are ranked by relevance instead. "
+            "Accessible to all users."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="search",
+                type={"type": "string"},
+                description="Full-text search over title and author.",
+            ),
+        ],
         responses={
             200: BookSerializer(many=True),
             403: {"description": "Permission denied."},
@@ -64,14 +101,223 @@ from books.serializers import BookSerializer
         },
     ),
 )
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    ConditionalUpdateMixin,
+    viewsets.ModelViewSet,
+):
     """
     ViewSet for managing books.
 
     - Admin users can perform all actions (create, update, delete).
     - Non-admin users can only view books (list, retrieve).
+    - List, retrieve and autocomplete responses are cached until the
+      catalogue changes.
+    - List and retrieve support conditional GETs (ETag, Last-Modified),
+      updates honour If-Match.
+    - Admins can import and export the whole catalogue as CSV or NDJSON.
+    - Anyone can read the inventory of many books in one call.
     """
 
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = BookPagination
+    pagination_ordering = None
+    autocomplete_limit = 10
+    import_chunk_size = 1000
+    export_chunk_size = 2000
+    import_content_types = {
+        "text/csv": "csv",
+        "application/x-ndjson": "ndjson",
+        "application/jsonl": "ndjson",
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get("search")
+
+        if self.action == "list" and search:
+            queryset = search_books(queryset, search)
+            self.pagination_ordering = ("-rank", "id")
+
+        return queryset
+
+    @extend_schema(
+        summary="Autocomplete books",
+        description=(
+            "Return up to `limit` books whose title or author starts with `q`, "
+            "ordered by title. Accessible to all users."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                type={"type": "string"},
+                required=True,
+                description="Prefix of the title or the author.",
+            ),
+            OpenApiParameter(
+                name="limit",
+                type={"type": "integer"},
+                description="Maximum number of suggestions (10 by default, 50 max).",
+            ),
+        ],
+        responses={200: BookAutocompleteSerializer(many=True)},
+    )
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def autocomplete(self, request):
+        return self.cached_response(self._autocomplete, request)
+
+    def _autocomplete(self, request):
+        try:
+            limit = min(int(request.query_params.get("limit", "")), 50)
+        except ValueError:
+            limit = self.autocomplete_limit
+
+        queryset = autocomplete_books(
+            Book.objects.all(), request.query_params.get("q", "")
+        )
+        suggestions = queryset.order_by("title", "id").values(
+            *BookAutocompleteSerializer.Meta.fields
+        )[: max(limit, 1)]
+        return Response(list(suggestions))
+
+    @extend_schema(
+        summary="Availability of many books",
+        description=(
+            "Return the inventory of up to 5000 books by ID as "
+            "`{id: inventory}`, `null` for unknown IDs. Accessible to all users."
+        ),
+        request=BookAvailabilitySerializer,
+        responses={
+            200: {
+                "type": "object",
+                "additionalProperties": {"type": "integer", "nullable": True},
+            }
+        },
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[AllowAny],
+        pagination_class=None,
+    )
+    def availability(self, request):
+        serializer = BookAvailabilitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(get_availability(serializer.validated_data["ids"]))
+
+    def _get_format(self, request, default=None):
+        requested = request.query_params.get("type")
+        if requested:
+            return requested if requested in FORMATS else None
+        return default
+
+    @extend_schema(
+        summary="Import books",
+        description=(
+            "Create or update books from a CSV file with a header row or from "
+            "NDJSON, one object per line. Books are matched by `isbn`. The body "
+            "is read as a stream and written in chunks, valid rows are imported "
+            "even if other rows fail. The response reports the errors of every "
+            "rejected row by its line number. Only admins are allowed to "
+            "perform this action."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="type",
+                type={"type": "string", "enum": list(FORMATS)},
+                description=(
+                    "Input format, taken from the Content-Type or the uploaded "
+                    "file name when omitted."
+                ),
+            ),
+        ],
+        request={
+            "text/csv": {"type": "string"},
+            "application/x-ndjson": {"type": "string"},
+            "multipart/form-data": {
+                "type": "object",
+                "properties": {"file": {"type": "string", "format": "binary"}},
+            },
+        },
+        responses={
+            200: {"description": "Import report."},
+            400: {"description": "Unsupported format or missing CSV columns."},
+            403: {"description": "Permission denied."},
+        },
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        permission_classes=[IsAdminUser],
+        pagination_class=None,
+    )
+    def bulk_import(self, request):
+        if request.content_type.startswith("multipart/form-data"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response(
+                    {"detail": "No file was submitted."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            stream = upload
+            default = upload.name.rsplit(".", 1)[-1].lower()
+        else:
+            stream = request.stream or []
+            media_type = request.content_type.split(";")[0].strip()
+            default = self.import_content_types.get(media_type, "csv")
+
+        try:
+            report = import_books(
+                stream,
+                self._get_format(request, default),
+                chunk_size=self.import_chunk_size,
+            )
+        except ImportFormatError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+    @extend_schema(
+        summary="Export books",
+        description=(
+            "Stream every book ordered by ID as CSV or NDJSON. "
+            "Only admins are allowed to perform this action."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="type",
+                type={"type": "string", "enum": list(FORMATS)},
+                description="Output format, `csv` by default.",
+            ),
+        ],
+        responses={
+            (200, "text/csv"): {"type": "string"},
+            (200, "application/x-ndjson"): {"type": "string"},
+            400: {"description": "Unsupported format."},
+            403: {"description": "Permission denied."},
+        },
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        permission_classes=[IsAdminUser],
+        pagination_class=None,
+    )
+    def bulk_export(self, request):
+        export_format = self._get_format(request, "csv")
+        if export_format is None:
+            return Response(
+                {"detail": f"Unsupported format, use one of: {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return streaming_response(
+            request,
+            export_format,
+            EXPORT_FIELDS,
+            export_rows(chunk_size=self.export_chunk_size),
+            filename="books",
+        )
@@ -1,5 +1,33 @@
 from django.contrib import admin
 
-from borrowing.models import Borrowing
+from borrowing.models import Borrowing, Fine, Hold, Notification
 
 admin.site.register(Borrowing)
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ("id", "chat_id", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+
+
+@admin.register(Fine)
+class FineAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "borrowing",
+        "user",
+        "charged_from",
+        "days_overdue",
+        "amount",
+        "status",
+    )
+    list_filter = ("status",)
+    list_select_related = ("borrowing__book", "borrowing__user", "user")
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ("id", "book", "user", "status", "created_at")
+    list_filter = ("status",)
+    list_select_related = ("book", "user")
@@ -0,0 +1,62 @@
+"""
+Streaming export of borrowing histories.
+
+Rows are read with `values_list()` through a server-side cursor
+(`iterator()`) and written one by one, so the memory used stays the same
+whatever the number of borrowings.
+"""
+
+from datetime import datetime, time
+
+from django.utils.dateparse import parse_date
+from django.utils.timezone import get_current_timezone
+
+FORMATS = ("json", "ndjson", "csv")
+EXPORT_FIELDS = (
+    "id",
+    "user",
+    "book_id",
+    "book",
+    "borrow_date",
+    "expected_return_date",
+    "actual_return_date",
+    "is_active",
+)
+LOOKUPS = {"user": "user__email", "book": "book__title"}
+DATE_FILTERS = {
+    "borrowed_after": ("borrow_date__gte", time.min),
+    "borrowed_before": ("borrow_date__lte", time.max),
+}
+
+
+class ExportFilterError(ValueError):
+    pass
+
+
+def filter_dates(queryset, params):
+    """
+    Filter by the `borrowed_after` / `borrowed_before` dates (inclusive,
+    YYYY-MM-DD) of `params`.
+    """
+    for name, (lookup, bound) in DATE_FILTERS.items():
+        value = params.get(name)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ExportFilterError(f"'{name}' must be a date (YYYY-MM-DD)")
+        moment = datetime.combine(day, bound, tzinfo=get_current_timezone())
+        queryset = queryset.filter(**{lookup: moment})
+    return queryset
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Yield the borrowings as tuples of `EXPORT_FIELDS`, ordered by id."""
+    return (
+        queryset.order_by("id")
+        .values_list(*(LOOKUPS.get(field, field) for field in EXPORT_FIELDS))
+        .iterator(chunk_size=chunk_size)
+    )
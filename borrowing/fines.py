@@ -0,0 +1,217 @@
+"""
+Batch calculation of fines for overdue borrowings.
+
+Active borrowings past their expected return date are read in keyset
+chunks over the `(is_active, expected_return_date, id)` index, then the
+borrowings returned late since the previous run over the partial
+`(actual_return_date, id)` index of returned ones, fined up to their
+return date. Days overdue and amounts are computed by the database, and every
+chunk is upserted into `Fine` with one statement in the same transaction
+as the run checkpoint, so memory stays bounded and an interrupted run
+resumes where it stopped. Paid fines are locked and left as they are,
+the days after the one a paid fine was calculated on go into a new fine
+of the borrowing. Running it again for the same day only rewrites the
+same amounts.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    DateField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+from django.utils.timezone import localdate, now
+
+from borrowing.models import Borrowing, Fine, FineRun
+from borrowing.summary import refresh_overdue
+
+CENT = Decimal("0.01")
+
+
+class DaysBetween(Func):
+    """Whole days from the second date expression to the first one."""
+
+    arg_joiner = " - "
+    template = "(%(expressions)s)"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(julianday(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+
+def _with_fine(queryset, end, multiplier):
+    # a paid fine charged the days until it was calculated
+    paid_until = (
+        Fine.objects.filter(borrowing_id=OuterRef("pk"), status="PAID")
+        .order_by("-calculated_on")
+        .values("calculated_on")[:1]
+    )
+    return (
+        queryset.annotate(
+            charged_from=Coalesce(Subquery(paid_until), "expected_return_date")
+        )
+        .annotate(days_overdue=DaysBetween(end, "charged_from"))
+        .filter(days_overdue__gt=0)
+        .annotate(
+            fine_amount=ExpressionWrapper(
+                F("days_overdue") * F("book__daily_fee") * Value(multiplier),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+    )
+
+
+def overdue_borrowings(as_of, multiplier):
+    """Active borrowings due before `as_of`, annotated with their fine."""
+    return _with_fine(
+        Borrowing.objects.filter(is_active=True, expected_return_date__lt=as_of),
+        Value(as_of, output_field=DateField()),
+        multiplier,
+    ).order_by("expected_return_date", "id")
+
+
+def late_returns(as_of, multiplier, returned_since=None):
+    """
+    Borrowings returned after their expected return date from
+    `returned_since` (ever if None) until `as_of`, annotated with their fine.
+    """
+    queryset = Borrowing.objects.filter(
+        is_active=False,
+        actual_return_date__lte=as_of,
+        actual_return_date__gt=F("expected_return_date"),
+    )
+    if returned_since is not None:
+        queryset = queryset.filter(actual_return_date__gte=returned_since)
+    return _with_fine(queryset, F("actual_return_date"), multiplier).order_by(
+        "actual_return_date", "id"
+    )
+
+
+class FineCalculator:
+    """
+    Fine every overdue borrowing `multiplier` times the daily fee of its
+    book per day overdue, as of `as_of`.
+    """
+
+    def __init__(self, as_of=None, chunk_size=1000, multiplier=None):
+        self.as_of = as_of or localdate()
+        self.chunk_size = chunk_size
+        self.multiplier = Decimal(
+            str(multiplier if multiplier is not None else settings.FINE_MULTIPLIER)
+        )
+
+    @cached_property
+    def returned_since(self):
+        """`as_of` of the previous run, which fined the returns until then."""
+        return (
+            FineRun.objects.filter(as_of__lt=self.as_of)
+            .order_by("-as_of")
+            .values_list("as_of", flat=True)
+            .first()
+        )
+
+    def get_run(self, restart=False):
+        run, created = FineRun.objects.get_or_create(as_of=self.as_of)
+        if restart and not created:
+            run.last_due_date = run.last_borrowing_id = run.finished_at = None
+            run.phase = "OVERDUE"
+            run.processed = 0
+            run.save()
+        return run
+
+    def next_chunk(self, run):
+        if run.phase == "OVERDUE":
+            queryset = overdue_borrowings(self.as_of, self.multiplier)
+            key = "expected_return_date"
+        else:
+            queryset = late_returns(self.as_of, self.multiplier, self.returned_since)
+            key = "actual_return_date"
+        if run.last_borrowing_id is not None:
+            queryset = queryset.filter(
+                Q(**{f"{key}__gt": run.last_due_date})
+                | Q(**{key: run.last_due_date, "id__gt": run.last_borrowing_id})
+            )
+        return list(
+            queryset.values_list(
+                "id", "user_id", key, "charged_from", "days_overdue", "fine_amount"
+            )[: self.chunk_size]
+        )
+
+    def write_chunk(self, run, rows):
+        fines = [
+            Fine(
+                borrowing_id=borrowing_id,
+                user_id=user_id,
+                charged_from=charged_from,
+                days_overdue=days,
+                amount=Decimal(str(amount)).quantize(CENT),
+                calculated_on=self.as_of,
+            )
+            for borrowing_id, user_id, _, charged_from, days, amount in rows
+        ]
+        with transaction.atomic():
+            # the upsert cannot skip rows, so leave out the fines paid since
+            # the chunk was read and keep them locked until it is done, the
+            # next run charges the days after them
+            paid = set(
+                Fine.objects.select_for_update()
+                .filter(borrowing_id__in=[fine.borrowing_id for fine in fines])
+                .filter(status="PAID")
+                .values_list("borrowing_id", "charged_from")
+            )
+            Fine.objects.bulk_create(
+                [
+                    fine
+                    for fine in fines
+                    if (fine.borrowing_id, fine.charged_from) not in paid
+                ],
+                update_conflicts=True,
+                unique_fields=["borrowing", "charged_from"],
+                update_fields=["days_overdue", "amount", "calculated_on", "updated_at"],
+            )
+            borrowing_id, _, due_date, _, _, _ = rows[-1]
+            run.last_due_date = due_date
+            run.last_borrowing_id = borrowing_id
+            run.processed += len(rows)
+            run.save(update_fields=["last_due_date", "last_borrowing_id", "processed"])
+
+    def run(self, restart=False):
+        """Calculate the fines of the day, returns the `FineRun`."""
+        run = self.get_run(restart)
+        if run.finished_at is not None:
+            return run
+
+        while True:
+            rows = self.next_chunk(run)
+            if rows:
+                self.write_chunk(run, rows)
+            if len(rows) == self.chunk_size:
+                continue
+            if run.phase == "RETURNED":
+                break
+            run.phase = "RETURNED"
+            run.last_due_date = run.last_borrowing_id = None
+            run.save(update_fields=["phase", "last_due_date", "last_borrowing_id"])
+
+        refresh_overdue(self.as_of)
+        run.finished_at = now()
+        run.save(update_fields=["finished_at"])
+        return run
@@ -1,21 +1,57 @@
 import os
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from Library_service_project.instrumentation import timed
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", 5))
+
+
+class TelegramError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 
-def send_telegram_message(text):
+def create_telegram_session(pool_size=10):
+    """Return a session that keeps connections to the Telegram API alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def send_telegram_message(
+    text, chat_id=None, session=None, api_url=None, timeout=TELEGRAM_TIMEOUT
+):
     payload = {
-        "chat_id": CHAT_ID,
+        "chat_id": chat_id or CHAT_ID,
         "text": text,
         "parse_mode": "HTML",
     }
-    response = requests.post(TELEGRAM_API_URL, json=payload)
+    try:
+        with timed("http"):
+            response = (session or requests).post(
+                api_url or TELEGRAM_API_URL, json=payload, timeout=timeout
+            )
+    except requests.RequestException as e:
+        raise TelegramError(f"Error sending message: {e}") from e
+
     if response.status_code != 200:
-        raise Exception(f"Error sending message: {response.text}")
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = response.json()["parameters"]["retry_after"]
+            except (ValueError, KeyError, TypeError):
+                pass
+        raise TelegramError(
+            f"Error sending message: {response.text}", retry_after=retry_after
+        )
     return response.json()
@@ -0,0 +1,131 @@
+"""
+`Idempotency-Key` support for POST actions.
+
+The first request with a key inserts an `IdempotencyKey` row and runs
+the action in the same transaction, then stores the response on the
+row. A retry with the same key finds the row and gets the stored
+response back, with an `Idempotent-Replayed` header, without running
+the action again. A duplicate that arrives while the first request is
+still running conflicts on the uncommitted row of the unique
+(user, key) index, so the database makes it wait for the first one to
+commit. It is replayed afterwards, or runs itself if the first one
+rolled back.
+
+Only returned responses below 500 are stored. Exceptions and server
+errors roll the key back, so the request can be retried. Responses
+marked `retryable` are not stored either, but what the action wrote
+before them is committed.
+"""
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.response import Response
+
+from borrowing.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(request):
+    """Hash of the method, path and payload, to detect a reused key."""
+    payload = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    content = f"{request.method} {request.path}\n{payload}"
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def retryable(response):
+    """Keep the response out of the key store, a retry runs the action again."""
+    response.idempotent_retryable = True
+    return response
+
+
+def _claim(user_id, key, request_fingerprint):
+    """The stored row of the key, or None once a new row is inserted."""
+    expires_at = now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    user_id=user_id,
+                    key=key,
+                    fingerprint=request_fingerprint,
+                    expires_at=expires_at,
+                )
+            return None
+        except IntegrityError:
+            stored = IdempotencyKey.objects.get(user_id=user_id, key=key)
+            if stored.expires_at > now():
+                return stored
+            # expired but not purged yet, the key is free again
+            stored.delete()
+    raise IntegrityError(f"{HEADER} {key!r} could not be claimed.")
+
+
+def idempotent(view_method):
+    """Replay the stored response of retries with the same `Idempotency-Key`."""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response(
+                {"detail": f"{HEADER} must be 1 to 255 characters long."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        request_fingerprint = fingerprint(request)
+        with transaction.atomic():
+            stored = _claim(request.user.id, key, request_fingerprint)
+            if stored is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                    return response
+                if getattr(response, "idempotent_retryable", False):
+                    IdempotencyKey.objects.filter(
+                        user_id=request.user.id, key=key
+                    ).delete()
+                    return response
+                IdempotencyKey.objects.filter(user_id=request.user.id, key=key).update(
+                    status_code=response.status_code, response=response.data
+                )
+                return response
+
+        if stored.fingerprint != request_fingerprint:
+            return Response(
+                {"detail": f"{HEADER} was already used for another request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(
+            stored.response,
+            status=stored.status_code,
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    return wrapper
+
+
+def purge_expired_keys(chunk_size=10_000):
+    """Delete expired keys chunk by chunk, returns how many were deleted."""
+    deleted = 0
+    cutoff = now()
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=cutoff)
+            .order_by()
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
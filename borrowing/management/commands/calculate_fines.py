@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from borrowing.fines import FineCalculator
+
+
+class Command(BaseCommand):
+    help = (
+        "Calculate fines for overdue borrowings. Run it daily, an interrupted "
+        "run continues from its last chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            help="Day to calculate the fines for (YYYY-MM-DD), today by default.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Recalculate the day from the start even if it was finished.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            as_of = date.fromisoformat(options["date"]) if options["date"] else None
+        except ValueError:
+            raise CommandError("--date must be in the YYYY-MM-DD format.")
+
+        calculator = FineCalculator(as_of=as_of, chunk_size=options["chunk_size"])
+        run = calculator.run(restart=options["restart"])
+        self.stdout.write(
+            f"Fines for {run.as_of}: {run.processed} overdue borrowings processed."
+        )
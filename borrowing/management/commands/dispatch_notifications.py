@@ -0,0 +1,75 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+
+from borrowing.outbox import NotificationDispatcher
+
+
+class Command(BaseCommand):
+    help = "Deliver queued Telegram notifications from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the notifications that are due and exit.",
+        )
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the outbox is empty.",
+        )
+        parser.add_argument(
+            "--chat-interval",
+            type=float,
+            default=1.0,
+            help="Minimum seconds between two messages to the same chat.",
+        )
+        parser.add_argument(
+            "--lease",
+            type=float,
+            default=600.0,
+            help=(
+                "Seconds a claimed batch is reserved for this dispatcher, "
+                "longer than it takes to deliver a batch."
+            ),
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=int(os.getenv("NOTIFICATIONS_METRICS_PORT", 0)),
+            help=(
+                "Serve the Prometheus metrics of the dispatcher on this port, "
+                "not served when 0."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["metrics_port"]:
+            # its samples are not in the workers' PROMETHEUS_MULTIPROC_DIR
+            start_http_server(options["metrics_port"])
+
+        dispatcher = NotificationDispatcher(
+            batch_size=options["batch_size"],
+            max_attempts=options["max_attempts"],
+            chat_interval=options["chat_interval"],
+            lease=options["lease"],
+        )
+
+        if options["once"]:
+            processed = dispatcher.dispatch_all()
+            self.stdout.write(f"Processed {processed} notifications.")
+            return
+
+        self.stdout.write("Dispatching notifications, press CTRL+C to stop.")
+        try:
+            while True:
+                if not dispatcher.dispatch_batch():
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from borrowing.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete the expired idempotency keys. Run it periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(chunk_size=options["chunk_size"])
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys.")
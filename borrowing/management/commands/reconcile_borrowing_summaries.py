@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from borrowing.summary import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-user borrowing counters from borrowings and fines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_summaries(chunk_size=options["chunk_size"])
+        self.stdout.write(f"Rebuilt borrowing summaries of {updated} users.")
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_book_title_idx"),
+        ("borrowing", "0003_notification"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["user", "is_active", "-borrow_date", "-id"],
+                name="borrowing_user_active_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["user", "-borrow_date", "-id"], name="borrowing_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["-borrow_date", "-id"], name="borrowing_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-borrow_date", "-id"],
+                name="borrowing_active_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.1.4 on 2026-10-18 05:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0007_book_isbn"),
+        ("borrowing", "0005_borrowing_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Fine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("days_overdue", models.PositiveIntegerField()),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("PENDING", "pending"), ("PAID", "paid")],
+                        default="PENDING",
+                        max_length=7,
+                    ),
+                ),
+                ("calculated_on", models.DateField()),
+                ("paid_at", models.DateTimeField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-calculated_on", "-id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="FineRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("as_of", models.DateField(unique=True)),
+                ("last_due_date", models.DateField(blank=True, null=True)),
+                ("last_borrowing_id", models.BigIntegerField(blank=True, null=True)),
+                ("processed", models.PositiveIntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-as_of"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                fields=["is_active", "expected_return_date", "id"],
+                name="borrowing_active_due_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="fine",
+            name="borrowing",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="fine",
+                to="borrowing.borrowing",
+            ),
+        ),
+        migrations.AddField(
+            model_name="fine",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="fines",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fine",
+            index=models.Index(fields=["user", "status"], name="fine_user_status_idx"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowing", "0007_borrowingsummary"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="borrowing",
+            name="borrow_date",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0007_book_isbn"),
+        ("borrowing", "0010_idempotencykey"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="finerun",
+            name="phase",
+            field=models.CharField(
+                choices=[("OVERDUE", "overdue"), ("RETURNED", "returned")],
+                default="OVERDUE",
+                max_length=8,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("is_active", False)),
+                fields=["actual_return_date", "id"],
+                name="borrowing_returned_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def charge_from_expected_return_date(apps, schema_editor):
+    # every existing fine is the only one of its borrowing
+    Borrowing = apps.get_model("borrowing", "Borrowing")
+    Fine = apps.get_model("borrowing", "Fine")
+    Fine.objects.update(
+        charged_from=Subquery(
+            Borrowing.objects.filter(pk=OuterRef("borrowing_id")).values(
+                "expected_return_date"
+            )[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowing", "0011_fine_late_returns"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fine",
+            name="charged_from",
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(
+            charge_from_expected_return_date, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="fine",
+            name="charged_from",
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name="fine",
+            name="borrowing",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="fines",
+                to="borrowing.borrowing",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="fine",
+            constraint=models.UniqueConstraint(
+                fields=("borrowing", "charged_from"),
+                name="fine_borrowing_charged_from_uniq",
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.timezone import now
 
 from django.db import models
@@ -7,7 +8,7 @@ from books.models import Book
 
 
 class Borrowing(models.Model):
-    borrow_date = models.DateTimeField(auto_now=True)
+    borrow_date = models.DateTimeField(auto_now_add=True)
     expected_return_date = models.DateField()
     actual_return_date = models.DateField(null=True, blank=True)
     book = models.ForeignKey(
@@ -21,19 +22,290 @@ class Borrowing(models.Model):
         related_name="borrows",
     )
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.borrow_date}, {self.book}, {self.user}"
 
     def return_book(self):
-        if self.is_active:
-            self.is_active = False
-            self.actual_return_date = now()
-            self.book.inventory += 1
-            self.book.save()
-            self.save()
-        else:
-            raise ValueError("This borrowing is already returned")
+        """Return the borrowing, see `borrowing.services.return_borrowing`."""
+        from borrowing.services import return_borrowing
+
+        return return_borrowing(self)
 
     class Meta:
         ordering = ["-borrow_date"]
+        indexes = [
+            # user list, optionally filtered by is_active
+            models.Index(
+                fields=["user", "is_active", "-borrow_date", "-id"],
+                name="borrowing_user_active_date_idx",
+            ),
+            models.Index(
+                fields=["user", "-borrow_date", "-id"],
+                name="borrowing_user_date_idx",
+            ),
+            # staff list of all borrowings and of active ones
+            models.Index(
+                fields=["-borrow_date", "-id"],
+                name="borrowing_date_idx",
+            ),
+            models.Index(
+                fields=["-borrow_date", "-id"],
+                condition=models.Q(is_active=True),
+                name="borrowing_active_date_idx",
+            ),
+            # overdue scan of the fine calculation
+            models.Index(
+                fields=["is_active", "expected_return_date", "id"],
+                name="borrowing_active_due_idx",
+            ),
+            # late returns of the fine calculation
+            models.Index(
+                fields=["actual_return_date", "id"],
+                condition=models.Q(is_active=False),
+                name="borrowing_returned_idx",
+            ),
+        ]
+
+
+class Fine(models.Model):
+    """
+    Fine for an overdue borrowing, written by the `calculate_fines` command.
+
+    The pending fine of a borrowing is recalculated on every run while
+    the borrowing stays active, so the amount grows with the days overdue,
+    and once more up to its return date after a late return. Paid fines
+    are not recalculated, the days after the one a paid fine was
+    calculated on are charged by a new fine, `charged_from` that day.
+    """
+
+    STATUS_CHOICES = {"PENDING": "pending", "PAID": "paid"}
+
+    borrowing = models.ForeignKey(
+        Borrowing,
+        on_delete=models.CASCADE,
+        related_name="fines",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="fines",
+    )
+    charged_from = models.DateField()
+    days_overdue = models.PositiveIntegerField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(
+        choices=STATUS_CHOICES,
+        max_length=7,
+        default="PENDING",
+    )
+    calculated_on = models.DateField()
+    paid_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.borrowing_id}: {self.amount} ({self.status})"
+
+    class Meta:
+        ordering = ["-calculated_on", "-id"]
+        indexes = [
+            models.Index(fields=["user", "status"], name="fine_user_status_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["borrowing", "charged_from"],
+                name="fine_borrowing_charged_from_uniq",
+            ),
+        ]
+
+
+class FineRun(models.Model):
+    """
+    Progress of one fine calculation, so an interrupted run resumes from
+    the last committed chunk.
+
+    A run fines the overdue active borrowings, then the late returns. The
+    keyset of the current phase is its last borrowing and the expected,
+    respectively the actual return date of it.
+    """
+
+    PHASE_CHOICES = {"OVERDUE": "overdue", "RETURNED": "returned"}
+
+    as_of = models.DateField(unique=True)
+    phase = models.CharField(
+        choices=PHASE_CHOICES,
+        max_length=8,
+        default="OVERDUE",
+    )
+    last_due_date = models.DateField(null=True, blank=True)
+    last_borrowing_id = models.BigIntegerField(null=True, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.as_of}: {self.processed} processed"
+
+    class Meta:
+        ordering = ["-as_of"]
+
+
+class BorrowingSummary(models.Model):
+    """
+    Per-user borrowing counters, so the summary is read from one row.
+
+    `active_count` and `total_borrowed` change in the same transaction as
+    every borrow and return. `overdue_count` and `outstanding_fines` are
+    refreshed by `calculate_fines` and lowered on returns. The
+    `reconcile_borrowing_summaries` command rebuilds all of them.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="borrowing_summary",
+    )
+    active_count = models.PositiveIntegerField(default=0)
+    total_borrowed = models.PositiveIntegerField(default=0)
+    overdue_count = models.PositiveIntegerField(default=0)
+    outstanding_fines = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.active_count} active"
+
+
+class Hold(models.Model):
+    """
+    Place of a user in the queue of an out-of-stock book.
+
+    Waiting holds of a book are served first come, first served: a
+    returned copy is handed to the oldest one in the transaction of the
+    return, which creates the borrowing instead of putting the copy back
+    on the shelf.
+    """
+
+    STATUS_CHOICES = {
+        "WAITING": "waiting",
+        "FULFILLED": "fulfilled",
+        "CANCELLED": "cancelled",
+    }
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="holds",
+    )
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name="holds",
+    )
+    loan_days = models.PositiveSmallIntegerField(default=14)
+    status = models.CharField(
+        choices=STATUS_CHOICES,
+        max_length=9,
+        default="WAITING",
+    )
+    borrowing = models.OneToOneField(
+        Borrowing,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="hold",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.book_id}, {self.user_id} ({self.status})"
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "book"],
+                condition=models.Q(status="WAITING"),
+                name="hold_one_waiting_per_book",
+            ),
+        ]
+        indexes = [
+            # queue of a book, oldest first
+            models.Index(
+                fields=["book", "id"],
+                condition=models.Q(status="WAITING"),
+                name="hold_waiting_queue_idx",
+            ),
+        ]
+
+
+class Notification(models.Model):
+    """
+    Outbox row for a Telegram message.
+
+    Rows are written in the same transaction as the change they describe
+    and delivered later by the `dispatch_notifications` command.
+    """
+
+    STATUS_CHOICES = {"PENDING": "pending", "SENT": "sent", "FAILED": "failed"}
+
+    chat_id = models.CharField(max_length=64, blank=True)
+    text = models.TextField()
+    status = models.CharField(
+        choices=STATUS_CHOICES,
+        max_length=7,
+        default="PENDING",
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.status}: {self.text[:30]}"
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"],
+                name="notification_due_idx",
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a POST sent with an `Idempotency-Key` header, replayed to
+    retries of the same request by the same user until `expires_at`.
+
+    The `purge_idempotency_keys` command deletes the expired rows.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="idempotency_key_per_user"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_key_expiry_idx"),
+        ]
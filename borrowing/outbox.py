@@ -0,0 +1,155 @@
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from Library_service_project.metrics import NOTIFICATION_LATENCY, NOTIFICATIONS
+from borrowing.helper import (
+    CHAT_ID,
+    TelegramError,
+    create_telegram_session,
+    send_telegram_message,
+)
+from borrowing.models import Notification
+
+
+def enqueue_notification(text, chat_id=None):
+    """
+    Queue a Telegram message.
+
+    Call it inside the transaction that makes the change, so the message
+    is stored only if the change is committed.
+    """
+    return Notification.objects.create(chat_id=chat_id or CHAT_ID or "", text=text)
+
+
+class NotificationDispatcher:
+    """
+    Deliver pending notifications in batches.
+
+    - One pooled HTTP session is reused for every message.
+    - Failed deliveries are retried with exponential backoff, honouring
+      Telegram's `retry_after` hint, until `max_attempts` is reached.
+    - Messages to the same chat are spaced at least `chat_interval`
+      seconds apart (Telegram allows about one message per second per chat).
+    - A batch is claimed in a short transaction that leases its rows, by
+      moving `next_attempt_at` `lease` seconds ahead, and is delivered
+      outside any transaction, each row being updated in its own write. The
+      rows of a dispatcher that dies are picked up again once the lease
+      expires.
+    - On PostgreSQL rows are claimed with SKIP LOCKED, so several
+      dispatchers can drain the outbox side by side.
+    """
+
+    def __init__(
+        self,
+        session=None,
+        api_url=None,
+        batch_size=50,
+        max_attempts=5,
+        backoff_base=2.0,
+        backoff_max=600.0,
+        chat_interval=1.0,
+        lease=600.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.session = session or create_telegram_session()
+        self.api_url = api_url
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.chat_interval = chat_interval
+        self.lease = lease
+        self.clock = clock
+        self.sleep = sleep
+        self._last_sent = {}
+
+    def claim_batch(self):
+        """Lease up to `batch_size` due notifications."""
+        leased_until = now() + timedelta(seconds=self.lease)
+        with transaction.atomic():
+            queryset = Notification.objects.filter(
+                status="PENDING", next_attempt_at__lte=now()
+            ).order_by("id")
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+
+            batch = list(queryset[: self.batch_size])
+            Notification.objects.filter(pk__in=[n.pk for n in batch]).update(
+                next_attempt_at=leased_until
+            )
+        for notification in batch:
+            notification.next_attempt_at = leased_until
+        return batch
+
+    def dispatch_batch(self):
+        """Deliver up to `batch_size` due notifications, return how many were tried."""
+        batch = self.claim_batch()
+        for notification in batch:
+            self.deliver(notification)
+        return len(batch)
+
+    def dispatch_all(self):
+        """Drain every notification that is currently due."""
+        total = 0
+        while processed := self.dispatch_batch():
+            total += processed
+        return total
+
+    def deliver(self, notification):
+        self._wait_for_chat(notification.chat_id)
+        notification.attempts += 1
+        try:
+            send_telegram_message(
+                notification.text,
+                chat_id=notification.chat_id,
+                session=self.session,
+                api_url=self.api_url,
+            )
+        except TelegramError as e:
+            notification.last_error = str(e)
+            if notification.attempts >= self.max_attempts:
+                notification.status = "FAILED"
+                NOTIFICATIONS.labels("failed").inc()
+            else:
+                NOTIFICATIONS.labels("retry").inc()
+                notification.next_attempt_at = now() + self._backoff(
+                    notification.attempts, e.retry_after
+                )
+        else:
+            notification.status = "SENT"
+            notification.sent_at = now()
+            notification.last_error = ""
+            NOTIFICATIONS.labels("sent").inc()
+            NOTIFICATION_LATENCY.observe(
+                (notification.sent_at - notification.created_at).total_seconds()
+            )
+        finally:
+            self._last_sent[notification.chat_id] = self.clock()
+
+        notification.save(
+            update_fields=[
+                "status",
+                "attempts",
+                "next_attempt_at",
+                "last_error",
+                "sent_at",
+            ]
+        )
+
+    def _backoff(self, attempts, retry_after=None):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return timedelta(seconds=delay)
+
+    def _wait_for_chat(self, chat_id):
+        last_sent = self._last_sent.get(chat_id)
+        if last_sent is None:
+            return
+        remaining = self.chat_interval - (self.clock() - last_sent)
+        if remaining > 0:
+            self.sleep(remaining)
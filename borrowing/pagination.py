@@ -0,0 +1,5 @@
+from Library_service_project.pagination import KeysetPagination
+
+
+class BorrowingPagination(KeysetPagination):
+    ordering = ("-borrow_date", "-id")
@@ -1,7 +1,8 @@
 from rest_framework import serializers
 
 from books.serializers import BookSerializer
-from borrowing.models import Borrowing
+from borrowing.models import Borrowing, BorrowingSummary, Hold
+from borrowing.services import BorrowingStateError, borrow_book, place_hold
 
 
 class BorrowingUserSerializer(serializers.ModelSerializer):
@@ -38,13 +39,18 @@ class BorrowingCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ["is_active", "actual_return_date"]
 
     def create(self, validated_data):
-        book = validated_data["book"]
-        if book.inventory < 1:
-            raise serializers.ValidationError("No inventory available for this book.")
-        book.inventory -= 1
-        book.save()
-
-        return super().create(validated_data)
+        user_id = validated_data.get("user_id")
+        if user_id is None:
+            # request.user may be a token user, which is not a model instance
+            user_id = self.context["request"].user.id
+        try:
+            return borrow_book(
+                user_id,
+                validated_data["book"],
+                validated_data["expected_return_date"],
+            )
+        except BorrowingStateError as e:
+            raise serializers.ValidationError(str(e))
 
 
 class BorrowingUserRetrieveSerializer(BorrowingUserSerializer):
@@ -73,3 +79,58 @@ class BorrowingAdminListSerializer(serializers.ModelSerializer):
 
 class BorrowingAdminRetrieveSerializer(BorrowingAdminListSerializer):
     book = BookSerializer(many=False, read_only=True)
+
+
+class BorrowingSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BorrowingSummary
+        fields = [
+            "active_count",
+            "total_borrowed",
+            "overdue_count",
+            "outstanding_fines",
+        ]
+
+
+class BorrowingBulkReturnSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class BorrowingBulkReturnResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(
+        choices=["returned", "already_returned", "not_found"]
+    )
+
+
+class HoldSerializer(serializers.ModelSerializer):
+    position = serializers.IntegerField(read_only=True, allow_null=True)
+    loan_days = serializers.IntegerField(min_value=1, max_value=60, default=14)
+    created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S", read_only=True)
+
+    class Meta:
+        model = Hold
+        fields = [
+            "id",
+            "book",
+            "loan_days",
+            "status",
+            "position",
+            "borrowing",
+            "created_at",
+        ]
+        read_only_fields = ["status", "borrowing"]
+
+    def create(self, validated_data):
+        try:
+            return place_hold(
+                validated_data["user_id"],
+                validated_data["book"],
+                validated_data["loan_days"],
+            )
+        except BorrowingStateError as e:
+            raise serializers.ValidationError(str(e))
@@ -0,0 +1,280 @@
+"""
+State transitions of borrowings.
+
+Every transition runs in one transaction and writes only what changes:
+inventories and counters are moved by expressions in the database and a
+return updates only the borrowing columns it affects, so `borrow_date`
+is never rewritten.
+
+Returned copies go to the waiting holds of their book first, oldest
+first, and only the copies nobody waits for are put back on the shelf.
+Copies put on the shelf otherwise (book edits, imports) and copies a
+borrower finds on the shelf are given to waiting holds first as well.
+Every path that reads the inventory to decide about holds locks the book
+rows first, so a hold placed while a copy comes back is not missed.
+"""
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, OuterRef, Subquery, When
+from django.utils.timezone import localdate, now
+
+from Library_service_project.metrics import BORROW_REJECTIONS, BORROWINGS
+from books.models import Book
+from books.services import (
+    release_copies_of_books,
+    reserve_copy,
+    take_copies_of_books,
+)
+from borrowing.models import Borrowing, Hold
+from borrowing.outbox import enqueue_notification
+from borrowing.summary import record_borrow, record_returns
+
+RETURNED = "returned"
+ALREADY_RETURNED = "already_returned"
+NOT_FOUND = "not_found"
+
+
+class BorrowingStateError(ValueError):
+    """The borrowing cannot make the requested transition."""
+
+
+def borrow_book(user_id, book, expected_return_date):
+    """
+    Take a copy of the book off the shelf and create the borrowing, once
+    the waiting holds of the book got theirs.
+    """
+    borrowing = None
+    with transaction.atomic():
+        # the decrement locks the book row, so the holds read after it
+        # include every hold placed before
+        reserved = reserve_copy(book.id)
+        if reserved and Hold.objects.filter(book_id=book.id, status="WAITING").exists():
+            release_copies_of_books({book.id: 1})
+            _serve_holds(_lock_books([book.id]))
+            reserved = reserve_copy(book.id)
+        if reserved:
+            borrowing = Borrowing.objects.create(
+                user_id=user_id, book=book, expected_return_date=expected_return_date
+            )
+            record_borrow(user_id)
+            transaction.on_commit(BORROWINGS.labels("borrow").inc)
+
+    # raised outside the transaction, so the holds served on the way are
+    # kept, callers inside a transaction of their own must not let the
+    # error roll it back
+    if borrowing is None:
+        BORROW_REJECTIONS.labels("out_of_stock").inc()
+        raise BorrowingStateError("No inventory available for this book.")
+    return borrowing
+
+
+def return_borrowing(borrowing):
+    """
+    Mark the borrowing returned today and put its copy back on the shelf.
+
+    The update is conditional on the borrowing being active, so a
+    concurrent return of the same borrowing fails instead of releasing the
+    copy twice.
+    """
+    actual_return_date = localdate()
+    updated_at = now()
+    with transaction.atomic():
+        returned = Borrowing.objects.filter(pk=borrowing.pk, is_active=True).update(
+            is_active=False,
+            actual_return_date=actual_return_date,
+            updated_at=updated_at,
+        )
+        if not returned:
+            raise BorrowingStateError("This borrowing is already returned")
+        hand_back_copies({borrowing.book_id: 1})
+        record_returns(borrowing.user_id, [borrowing.pk])
+        transaction.on_commit(BORROWINGS.labels("return").inc)
+
+    borrowing.is_active = False
+    borrowing.actual_return_date = actual_return_date
+    borrowing.updated_at = updated_at
+    return borrowing
+
+
+def return_borrowings(borrowing_ids):
+    """
+    Return a batch of borrowings in one transaction.
+
+    The active ones are locked and marked returned by a single UPDATE, the
+    copies go back to the shelf with one UPDATE over all their books and
+    the counters of every user are lowered once. Returns the status of
+    each id, in the order they were given.
+    """
+    borrowing_ids = list(dict.fromkeys(borrowing_ids))
+    actual_return_date = localdate()
+    with transaction.atomic():
+        rows = (
+            Borrowing.objects.select_for_update()
+            .filter(pk__in=borrowing_ids)
+            .order_by("pk")
+            .values_list("pk", "book_id", "user_id", "is_active")
+        )
+        statuses = {}
+        copies = Counter()
+        by_user = defaultdict(list)
+        for pk, book_id, user_id, is_active in rows:
+            statuses[pk] = RETURNED if is_active else ALREADY_RETURNED
+            if is_active:
+                copies[book_id] += 1
+                by_user[user_id].append(pk)
+
+        returned_ids = [pk for ids in by_user.values() for pk in ids]
+        if returned_ids:
+            Borrowing.objects.filter(pk__in=returned_ids).update(
+                is_active=False,
+                actual_return_date=actual_return_date,
+                updated_at=now(),
+            )
+            hand_back_copies(copies)
+            for user_id, ids in by_user.items():
+                record_returns(user_id, ids)
+            transaction.on_commit(
+                lambda: BORROWINGS.labels("return").inc(len(returned_ids))
+            )
+
+    return [{"id": pk, "status": statuses.get(pk, NOT_FOUND)} for pk in borrowing_ids]
+
+
+def place_hold(user_id, book, loan_days):
+    """Queue the user for a copy of an out-of-stock book."""
+    with transaction.atomic():
+        # a return waits for the lock, then sees the hold
+        if _lock_books([book.id]).get(book.id, 0) > 0:
+            raise BorrowingStateError("This book is available, borrow it instead.")
+        try:
+            with transaction.atomic():
+                hold = Hold.objects.create(
+                    user_id=user_id, book=book, loan_days=loan_days
+                )
+        except IntegrityError:
+            raise BorrowingStateError("You are already waiting for this book.")
+    hold.position = queue_positions(Hold.objects.filter(pk=hold.pk)).get().position
+    return hold
+
+
+def cancel_hold(hold):
+    cancelled = Hold.objects.filter(pk=hold.pk, status="WAITING").update(
+        status="CANCELLED", updated_at=now()
+    )
+    if not cancelled:
+        raise BorrowingStateError("Only waiting holds can be cancelled.")
+    hold.status = "CANCELLED"
+    hold.position = None
+    return hold
+
+
+def queue_positions(queryset):
+    """Annotate `position`, 1 for the next hold served, None unless waiting."""
+    ahead = (
+        Hold.objects.filter(
+            book_id=OuterRef("book_id"), status="WAITING", id__lte=OuterRef("id")
+        )
+        .order_by()
+        .values("book_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return queryset.annotate(
+        position=Case(When(status="WAITING", then=Subquery(ahead)), default=None)
+    )
+
+
+def _lock_books(book_ids):
+    """Lock the rows of the books in id order, returns their inventories."""
+    return dict(
+        Book.objects.select_for_update()
+        .filter(pk__in=book_ids)
+        .order_by("pk")
+        .values_list("pk", "inventory")
+    )
+
+
+def _waiting_holds(counts):
+    """Oldest waiting holds of each book, at most as many as its copies."""
+    if len(counts) == 1:
+        books = list(counts)
+    else:
+        books = (
+            Hold.objects.filter(book_id__in=counts, status="WAITING")
+            .order_by()
+            .values_list("book_id", flat=True)
+            .distinct()
+        )
+    queryset = (
+        Hold.objects.filter(status="WAITING")
+        .select_related("user", "book")
+        .only("user_id", "book_id", "loan_days", "user__email", "book__title")
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        # a hold being cancelled is passed over instead of waited for
+        queryset = queryset.select_for_update(skip_locked=True, of=("self",))
+    holds = []
+    for book_id in books:
+        holds += queryset.filter(book_id=book_id).order_by("id")[: counts[book_id]]
+    return holds
+
+
+def _fulfil(holds):
+    """Create the borrowings of the holds, returns the copies used per book."""
+    today = localdate()
+    fulfilled = Counter()
+    for hold in holds:
+        borrowing = Borrowing.objects.create(
+            user_id=hold.user_id,
+            book_id=hold.book_id,
+            expected_return_date=today + timedelta(days=hold.loan_days),
+        )
+        Hold.objects.filter(pk=hold.pk).update(
+            status="FULFILLED", borrowing=borrowing, updated_at=now()
+        )
+        record_borrow(hold.user_id)
+        enqueue_notification(
+            f"Hold fulfilled, new borrowing created:\n"
+            f"User: {hold.user.email}\n"
+            f"Book: {hold.book.title}\n"
+            f"Expected Return Date: {borrowing.expected_return_date}"
+        )
+        fulfilled[hold.book_id] += 1
+
+    total = fulfilled.total()
+    if total:
+        transaction.on_commit(lambda: BORROWINGS.labels("borrow").inc(total))
+    return fulfilled
+
+
+def _serve_holds(inventories):
+    """
+    Give copies on the shelf to waiting holds, `inventories` maps the id of
+    a locked book to its copies on the shelf.
+    """
+    inventories = {book_id: count for book_id, count in inventories.items() if count}
+    if inventories:
+        take_copies_of_books(_fulfil(_waiting_holds(inventories)))
+
+
+def hand_back_copies(counts):
+    """
+    Give returned copies to the waiting holds of their books and put the
+    rest back on the shelf, `counts` maps a book id to the number of
+    copies. Call it inside the transaction of the return.
+    """
+    counts = Counter(counts)
+    _lock_books(counts)
+    release_copies_of_books(counts - _fulfil(_waiting_holds(counts)))
+
+
+def serve_waiting_holds(book_ids):
+    """
+    Give the copies on the shelf of the books to their waiting holds. Call
+    it inside the transaction that put copies on the shelf other than by
+    a return.
+    """
+    _serve_holds(_lock_books(book_ids))
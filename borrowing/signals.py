@@ -0,0 +1,9 @@
+from django.dispatch import receiver
+
+from books.signals import books_restocked
+from borrowing.services import serve_waiting_holds
+
+
+@receiver(books_restocked)
+def serve_restocked_books(sender, book_ids, **kwargs):
+    serve_waiting_holds(book_ids)
@@ -0,0 +1,139 @@
+"""
+Maintenance of the per-user `BorrowingSummary` counters.
+
+`record_borrow` and `record_returns` must be called inside the
+transaction that creates or returns the borrowings, so the counters are
+committed together with the change.
+"""
+
+from decimal import Decimal
+
+from django.db.models import (
+    Count,
+    DecimalField,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.timezone import localdate, now
+
+from borrowing.models import Borrowing, BorrowingSummary, Fine
+
+ZERO = Decimal("0.00")
+
+
+def get_summary(user_id):
+    """Counters of the user, all zero if they never borrowed a book."""
+    return BorrowingSummary.objects.filter(user_id=user_id).first() or (
+        BorrowingSummary(user_id=user_id)
+    )
+
+
+def _update_counters(user_id, **changes):
+    updated = BorrowingSummary.objects.filter(user_id=user_id).update(
+        updated_at=now(), **changes
+    )
+    if not updated:
+        # first borrowing of the user since the counters were rebuilt
+        BorrowingSummary.objects.bulk_create(
+            [BorrowingSummary(user_id=user_id)], ignore_conflicts=True
+        )
+        BorrowingSummary.objects.filter(user_id=user_id).update(
+            updated_at=now(), **changes
+        )
+
+
+def record_borrow(user_id, count=1):
+    _update_counters(
+        user_id,
+        active_count=F("active_count") + count,
+        total_borrowed=F("total_borrowed") + count,
+    )
+
+
+def record_returns(user_id, borrowing_ids):
+    """
+    Count the borrowings as returned. Fined borrowings were counted as
+    overdue by the last fine calculation, so they leave `overdue_count`.
+    """
+    fined = (
+        Fine.objects.filter(borrowing_id__in=borrowing_ids)
+        .order_by()
+        .values("user_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    _update_counters(
+        user_id,
+        active_count=Greatest(F("active_count") - len(borrowing_ids), 0),
+        overdue_count=Greatest(
+            F("overdue_count")
+            - Coalesce(Subquery(fined, output_field=IntegerField()), 0),
+            0,
+        ),
+    )
+
+
+def _count(queryset):
+    subquery = (
+        queryset.filter(user_id=OuterRef("user_id"))
+        .order_by()
+        .values("user_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def _outstanding_fines():
+    subquery = (
+        Fine.objects.filter(user_id=OuterRef("user_id"), status="PENDING")
+        .order_by()
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    output_field = DecimalField(max_digits=12, decimal_places=2)
+    return Coalesce(
+        Subquery(subquery, output_field=output_field),
+        Value(ZERO, output_field=output_field),
+    )
+
+
+def refresh_overdue(as_of=None):
+    """Recount overdue borrowings and outstanding fines of every user."""
+    as_of = as_of or localdate()
+    return BorrowingSummary.objects.update(
+        overdue_count=_count(
+            Borrowing.objects.filter(is_active=True, expected_return_date__lt=as_of)
+        ),
+        outstanding_fines=_outstanding_fines(),
+        updated_at=now(),
+    )
+
+
+def rebuild_summaries(as_of=None, chunk_size=1000):
+    """Recompute every counter from the borrowings and fines."""
+    user_ids = (
+        Borrowing.objects.order_by("user_id")
+        .values_list("user_id", flat=True)
+        .distinct()
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for user_id in user_ids:
+        chunk.append(BorrowingSummary(user_id=user_id))
+        if len(chunk) >= chunk_size:
+            BorrowingSummary.objects.bulk_create(chunk, ignore_conflicts=True)
+            chunk = []
+    BorrowingSummary.objects.bulk_create(chunk, ignore_conflicts=True)
+
+    BorrowingSummary.objects.update(
+        active_count=_count(Borrowing.objects.filter(is_active=True)),
+        total_borrowed=_count(Borrowing.objects.all()),
+    )
+    return refresh_overdue(as_of)
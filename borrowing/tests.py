@@ -1,18 +1,49 @@
-from datetime import timedelta
+import io
+import json
+import threading
 from unittest.mock import patch
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-from django.test import TestCase
-from django.utils.timezone import now
+from django.db import OperationalError, connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import localdate, now
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework.reverse import reverse
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from prometheus_client import REGISTRY
 
+from books.bulk import import_books
 from books.models import Book
-from borrowing.models import Borrowing
+from borrowing.fines import FineCalculator
+from borrowing.models import (
+    Borrowing,
+    BorrowingSummary,
+    Fine,
+    FineRun,
+    Hold,
+    IdempotencyKey,
+    Notification,
+)
+from borrowing.outbox import NotificationDispatcher, enqueue_notification
+from borrowing.views import BorrowingViewSet
+from borrowing.services import (
+    BorrowingStateError,
+    borrow_book,
+    return_borrowing,
+    return_borrowings,
+)
+from Library_service_project.query_plans import QueryPlanAssertionsMixin
 from borrowing.serializers import (
     BorrowingUserSerializer,
     BorrowingAdminListSerializer,
+    BorrowingCreateSerializer,
 )
 
 URL_BORROWING_LIST = reverse("borrowing:borrowing-list")
@@ -150,6 +181,47 @@ class BorrowingUserTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data["detail"], "This borrowing is already returned")
 
+    def test_retrieve_not_modified_until_returned(self):
+        url = reverse("borrowing:borrowing-detail", kwargs={"pk": self.borrowing.id})
+        etag = self.client.get(url)["ETag"]
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        return_borrowing(self.borrowing)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(res.data["is_active"])
+
+    def test_retrieve_modified_when_the_book_changes(self):
+        url = reverse("borrowing:borrowing-detail", kwargs={"pk": self.borrowing.id})
+        etag = self.client.get(url)["ETag"]
+
+        user = sample_user(email="user2@test.com")
+        borrow_book(user.id, self.book, EXPECTED_RETURN_DATE)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["book"]["inventory"], 0)
+
+    def test_list_not_modified_from_one_page_query(self):
+        etag = self.client.get(URL_BORROWING_LIST)["ETag"]
+
+        with self.assertNumQueries(1):
+            res = self.client.get(URL_BORROWING_LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Book.objects.filter(pk=self.book.pk).update(updated_at=now())
+        res = self.client.get(URL_BORROWING_LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_list_has_no_last_modified(self):
+        res = self.client.get(URL_BORROWING_LIST)
+        self.assertIn("ETag", res)
+        self.assertNotIn("Last-Modified", res)
+
     def test_user_borrowing_list(self):
         """
         test check what user can see only his borrowings list
@@ -163,8 +235,18 @@ class BorrowingUserTest(TestCase):
         borrowings = Borrowing.objects.filter(user=self.user)
         serializer = BorrowingUserSerializer(borrowings, many=True)
 
-        self.assertEqual(res.data, serializer.data)
-        self.assertEqual(res1.data, [])
+        self.assertEqual(res.data["results"], serializer.data)
+        self.assertEqual(res1.data["results"], [])
+
+    def test_user_borrowing_list_queries_do_not_grow(self):
+        for i in range(5):
+            sample_borrowing(user=self.user, book=sample_book(title=f"book{i}"))
+
+        # the page with its conditional GET validators, with the books
+        # joined instead of loaded one by one
+        with self.assertNumQueries(1):
+            res = self.client.get(URL_BORROWING_LIST)
+        self.assertEqual(len(res.data["results"]), 6)
 
     def test_user_borrowings_filter_by_active(self):
         """
@@ -180,14 +262,13 @@ class BorrowingUserTest(TestCase):
         serializer1 = BorrowingUserSerializer(self.borrowing)
         serializer2 = BorrowingUserSerializer(inactive_borrowing)
 
-        self.assertIn(serializer1.data, res1.data)
-        self.assertNotIn(serializer1.data, res2.data)
+        self.assertIn(serializer1.data, res1.data["results"])
+        self.assertNotIn(serializer1.data, res2.data["results"])
 
-        self.assertIn(serializer2.data, res2.data)
-        self.assertNotIn(serializer2.data, res1.data)
+        self.assertIn(serializer2.data, res2.data["results"])
+        self.assertNotIn(serializer2.data, res1.data["results"])
 
-    @patch("borrowing.views.send_telegram_message")
-    def test_borrowing_create_sends_notification(self, mock_send_message):
+    def test_borrowing_create_queues_notification(self):
         payload = {
             "book": self.book.id,
             "user": self.user.id,
@@ -204,7 +285,16 @@ class BorrowingUserTest(TestCase):
             f"Expected Return Date: {borrowing.expected_return_date}"
         )
 
-        mock_send_message.assert_called_once_with(message)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.text, message)
+        self.assertEqual(notification.status, "PENDING")
+
+    def test_rejected_borrowing_queues_no_notification(self):
+        book = sample_book(inventory=0)
+        payload = {"book": book.id, "expected_return_date": EXPECTED_RETURN_DATE}
+        self.client.post(URL_BORROWING_LIST, payload)
+
+        self.assertFalse(Notification.objects.exists())
 
 
 class BorrowingAdminTest(TestCase):
@@ -231,7 +321,7 @@ class BorrowingAdminTest(TestCase):
         borrowings = Borrowing.objects.all()
         serializer = BorrowingAdminListSerializer(borrowings, many=True)
 
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_admin_filter_by_is_active_and_user_id(self):
         """
@@ -260,6 +350,1018 @@ class BorrowingAdminTest(TestCase):
         serializer2 = BorrowingAdminListSerializer(borrowings_user1, many=True)
         serializer3 = BorrowingAdminListSerializer(borrowings_user1_active, many=True)
 
-        self.assertEqual(serializer1.data, res1.data)
-        self.assertEqual(serializer2.data, res2.data)
-        self.assertEqual(serializer3.data, res3.data)
+        self.assertEqual(serializer1.data, res1.data["results"])
+        self.assertEqual(serializer2.data, res2.data["results"])
+        self.assertEqual(serializer3.data, res3.data["results"])
+
+    def test_admin_borrowing_list_pagination(self):
+        """
+        test check what admin can walk the whole borrowings list page by page
+        """
+        user = sample_user()
+        for _ in range(5):
+            sample_borrowing(user=user)
+
+        results = []
+        res = self.client.get(URL_BORROWING_LIST, {"page_size": 2})
+        while True:
+            results.extend(res.data["results"])
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+
+        borrowings = Borrowing.objects.order_by("-borrow_date", "-id")
+        serializer = BorrowingAdminListSerializer(borrowings, many=True)
+
+        self.assertEqual(results, serializer.data)
+
+
+class BorrowingServiceTest(TestCase):
+    def setUp(self):
+        self.user = sample_user()
+        self.book = sample_book(inventory=1)
+        BorrowingSummary.objects.create(user=self.user)
+
+    def test_borrow_book_queries(self):
+        # savepoint, inventory decrement, waiting holds, insert, counters,
+        # release
+        with self.assertNumQueries(6):
+            borrowing = borrow_book(self.user.id, self.book, EXPECTED_RETURN_DATE)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+        self.assertIsNotNone(borrowing.borrow_date)
+
+    def test_borrow_book_out_of_stock(self):
+        Book.objects.filter(pk=self.book.pk).update(inventory=0)
+
+        with self.assertRaises(BorrowingStateError):
+            borrow_book(self.user.id, self.book, EXPECTED_RETURN_DATE)
+        self.assertFalse(Borrowing.objects.exists())
+
+    def test_return_borrowing_queries_and_keeps_borrow_date(self):
+        borrowing = borrow_book(self.user.id, self.book, EXPECTED_RETURN_DATE)
+        borrow_date = borrowing.borrow_date
+
+        # savepoint, conditional update, lock of the book, waiting holds,
+        # inventory increment, counters, release
+        with self.assertNumQueries(7):
+            return_borrowing(borrowing)
+
+        borrowing.refresh_from_db()
+        self.assertFalse(borrowing.is_active)
+        self.assertEqual(borrowing.actual_return_date, localdate())
+        self.assertEqual(borrowing.borrow_date, borrow_date)
+        self.assertGreater(borrowing.updated_at, borrow_date)
+        with self.assertRaises(BorrowingStateError):
+            return_borrowing(borrowing)
+
+    def test_model_return_book_uses_the_service(self):
+        borrowing = borrow_book(self.user.id, self.book, EXPECTED_RETURN_DATE)
+
+        borrowing.return_book()
+
+        self.book.refresh_from_db()
+        self.assertFalse(borrowing.is_active)
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_create_serializer_defaults_to_the_request_user(self):
+        request = APIRequestFactory().post(URL_BORROWING_LIST)
+        request.user = self.user
+        payload = {"book": self.book.id, "expected_return_date": EXPECTED_RETURN_DATE}
+        serializer = BorrowingCreateSerializer(
+            data=payload, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        borrowing = serializer.save()
+
+        self.assertEqual(borrowing.user_id, self.user.id)
+
+
+class BorrowingBulkReturnTest(TestCase):
+    URL = reverse("borrowing:borrowing-bulk-return")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(sample_user(email="a@a.com", is_staff=True))
+        self.books = [sample_book(title=f"book{i}", inventory=0) for i in range(2)]
+
+    def _borrow(self, book, **params):
+        return Borrowing.objects.create(
+            user=self.user,
+            book=book,
+            expected_return_date=EXPECTED_RETURN_DATE,
+            **params,
+        )
+
+    def test_bulk_return_reports_each_borrowing(self):
+        first, second = self.books
+        borrowings = [self._borrow(first), self._borrow(first), self._borrow(second)]
+        returned = self._borrow(second, is_active=False)
+        call_command("reconcile_borrowing_summaries", stdout=io.StringIO())
+        ids = [borrowing.id for borrowing in borrowings]
+
+        res = self.client.post(
+            self.URL, {"ids": [*ids, returned.id, 999, ids[0]]}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data,
+            [{"id": pk, "status": "returned"} for pk in ids]
+            + [
+                {"id": returned.id, "status": "already_returned"},
+                {"id": 999, "status": "not_found"},
+            ],
+        )
+        self.assertFalse(Borrowing.objects.filter(is_active=True).exists())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.inventory, second.inventory), (2, 1))
+        self.assertEqual(BorrowingSummary.objects.get(user=self.user).active_count, 0)
+
+    def test_bulk_return_queries_do_not_grow_with_the_batch(self):
+        ids = [self._borrow(book).id for book in self.books for _ in range(5)]
+        call_command("reconcile_borrowing_summaries", stdout=io.StringIO())
+
+        # savepoint, locking select, update of the borrowings, lock of the
+        # books, books with waiting holds, updates of the books and the
+        # counters of the user, release
+        with self.assertNumQueries(8):
+            self.client.post(self.URL, {"ids": ids}, format="json")
+
+    def test_bulk_return_only_for_staff(self):
+        self.client.force_authenticate(self.user)
+        borrowing = self._borrow(self.books[0])
+
+        res = self.client.post(self.URL, {"ids": [borrowing.id]}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(Borrowing.objects.get(pk=borrowing.id).is_active)
+
+    def test_bulk_return_rejects_empty_list(self):
+        res = self.client.post(self.URL, {"ids": []}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HoldTest(TestCase):
+    URL = reverse("borrowing:hold-list")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.reader = sample_user(email="reader@test.com")
+        self.book = sample_book(title="Emma", inventory=1)
+        self.borrowing = borrow_book(self.reader.id, self.book, EXPECTED_RETURN_DATE)
+        self.users = [sample_user(email=f"waiting{i}@test.com") for i in range(2)]
+
+    def _hold(self, user, **data):
+        self.client.force_authenticate(user)
+        return self.client.post(self.URL, {"book": self.book.id, **data})
+
+    def test_place_hold_reports_queue_position(self):
+        first = self._hold(self.users[0])
+        second = self._hold(self.users[1], loan_days=7)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((first.data["position"], first.data["status"]), (1, "WAITING"))
+        self.assertEqual((second.data["position"], second.data["loan_days"]), (2, 7))
+        res = self.client.get(self.URL)
+        self.assertEqual([hold["position"] for hold in res.data], [2])
+
+    def test_place_hold_rejected(self):
+        self._hold(self.users[0])
+
+        self.assertEqual(
+            self._hold(self.users[0]).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        Book.objects.filter(pk=self.book.pk).update(inventory=1)
+        self.assertEqual(
+            self._hold(self.users[1]).status_code, status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_return_fulfils_the_oldest_hold(self):
+        for user in self.users:
+            self._hold(user)
+        BorrowingSummary.objects.create(user=self.users[0])
+
+        return_borrowing(self.borrowing)
+
+        first, second = Hold.objects.order_by("id")
+        self.assertEqual(first.status, "FULFILLED")
+        self.assertEqual(first.borrowing.user, self.users[0])
+        self.assertEqual(
+            first.borrowing.expected_return_date, localdate() + timedelta(days=14)
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+        self.assertEqual(
+            BorrowingSummary.objects.get(user=self.users[0]).active_count, 1
+        )
+        self.assertIn("Hold fulfilled", Notification.objects.last().text)
+        res = self.client.get(reverse("borrowing:hold-detail", args=[second.id]))
+        self.assertEqual(res.data["position"], 1)
+
+    def test_bulk_return_shelves_copies_nobody_waits_for(self):
+        extra = borrow_book(
+            self.users[1].id, sample_book(title="Ulysses"), EXPECTED_RETURN_DATE
+        )
+        Book.objects.filter(pk=self.book.pk).update(inventory=0)
+        self._hold(self.users[0])
+
+        return_borrowings([self.borrowing.id, extra.id])
+
+        self.assertEqual(Hold.objects.get().status, "FULFILLED")
+        self.assertEqual(
+            dict(Book.objects.values_list("title", "inventory")),
+            {"Emma": 0, "Ulysses": 1},
+        )
+
+    def test_borrower_comes_after_waiting_holds(self):
+        self._hold(self.users[0])
+        Book.objects.filter(pk=self.book.pk).update(inventory=1)
+
+        with self.assertRaises(BorrowingStateError):
+            borrow_book(self.users[1].id, self.book, EXPECTED_RETURN_DATE)
+
+        self.assertEqual(Hold.objects.get().borrowing.user, self.users[0])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_borrow_request_rejected_after_waiting_holds_keeps_them_served(self):
+        self._hold(self.users[0])
+        Book.objects.filter(pk=self.book.pk).update(inventory=1)
+        self.client.force_authenticate(self.users[1])
+
+        res = self.client.post(
+            URL_BORROWING_LIST,
+            {"book": self.book.id, "expected_return_date": EXPECTED_RETURN_DATE},
+            HTTP_IDEMPOTENCY_KEY="borrow-1",
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data, ["No inventory available for this book."])
+        hold = Hold.objects.get()
+        self.assertEqual(
+            (hold.status, hold.borrowing.user), ("FULFILLED", self.users[0])
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+        self.assertFalse(Borrowing.objects.filter(user=self.users[1]).exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_restocked_book_serves_waiting_holds(self):
+        for user in self.users:
+            self._hold(user)
+        admin = sample_user(email="admin@test.com", is_staff=True)
+        self.client.force_authenticate(admin)
+
+        res = self.client.patch(
+            reverse("books:book-detail", args=[self.book.id]), {"inventory": 3}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(Hold.objects.values_list("status", flat=True)),
+            ["FULFILLED", "FULFILLED"],
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+    def test_imported_inventory_serves_waiting_holds(self):
+        Book.objects.filter(pk=self.book.pk).update(isbn="9780141439587")
+        self._hold(self.users[0])
+        rows = io.StringIO(
+            "isbn,title,author,cover,inventory,daily_fee\n"
+            "9780141439587,Emma,Jane Austen,SOFT,1,1.00\n"
+        )
+
+        import_books(rows)
+
+        self.assertEqual(Hold.objects.get().status, "FULFILLED")
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_cancel_hold(self):
+        hold_id = self._hold(self.users[0]).data["id"]
+        url = reverse("borrowing:hold-detail", args=[hold_id])
+
+        res = self.client.delete(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            (res.data["status"], res.data["position"]), ("CANCELLED", None)
+        )
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        return_borrowing(self.borrowing)
+        self.assertEqual(Hold.objects.get().status, "CANCELLED")
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(self.user)
+        self.book = sample_book(inventory=2)
+        self.payload = {
+            "book": self.book.id,
+            "expected_return_date": EXPECTED_RETURN_DATE,
+        }
+
+    def _post(self, url, data=None, key="key-1"):
+        return self.client.post(url, data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_borrow_is_replayed(self):
+        first = self._post(URL_BORROWING_LIST, self.payload)
+        retry = self._post(URL_BORROWING_LIST, self.payload)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertFalse(first.has_header("Idempotent-Replayed"))
+        self.assertEqual(Borrowing.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 1)
+
+        other = self._post(URL_BORROWING_LIST, {**self.payload, "book": 0})
+        self.assertEqual(other.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_retried_return_is_replayed(self):
+        borrowing = borrow_book(self.user.id, self.book, EXPECTED_RETURN_DATE)
+        self.client.force_authenticate(sample_user(email="a@a.com", is_staff=True))
+        url = reverse("borrowing:borrowing-return-book", args=[borrowing.id])
+
+        responses = [self._post(url) for _ in range(2)]
+
+        self.assertEqual([res.status_code for res in responses], [200, 200])
+        self.assertEqual(responses[1].data, responses[0].data)
+        self.assertEqual(self._post(url, key="key-2").status_code, 400)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 2)
+
+    def test_errors_raised_by_the_view_are_not_stored(self):
+        Book.objects.filter(pk=self.book.pk).update(inventory=0)
+        self.assertEqual(self._post(URL_BORROWING_LIST, self.payload).status_code, 400)
+
+        Book.objects.filter(pk=self.book.pk).update(inventory=1)
+        res = self._post(URL_BORROWING_LIST, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(res.has_header("Idempotent-Replayed"))
+
+    def test_expired_keys_are_reused_and_purged(self):
+        Book.objects.filter(pk=self.book.pk).update(inventory=3)
+        self._post(URL_BORROWING_LIST, self.payload)
+        IdempotencyKey.objects.update(expires_at=now() - timedelta(seconds=1))
+
+        res = self._post(URL_BORROWING_LIST, self.payload)
+
+        self.assertFalse(res.has_header("Idempotent-Replayed"))
+        self.assertEqual(Borrowing.objects.count(), 2)
+        self._post(URL_BORROWING_LIST, self.payload, key="key-2")
+        IdempotencyKey.objects.filter(key="key-2").update(expires_at=now())
+        out = io.StringIO()
+        call_command("purge_idempotency_keys", "--chunk-size=1", stdout=out)
+        self.assertIn("Deleted 1 ", out.getvalue())
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["key-1"]
+        )
+
+
+class BorrowingConcurrencyTest(TransactionTestCase):
+    """
+    Hammer one hot book from many threads at once and check that every
+    copy is handed out exactly once.
+    """
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 5
+    INVENTORY = 12
+
+    def setUp(self):
+        self.book = sample_book(inventory=self.INVENTORY)
+        self.user = sample_user()
+
+    def _borrow(self, barrier, results):
+        payload = {"book": self.book.id, "expected_return_date": EXPECTED_RETURN_DATE}
+        barrier.wait()
+        try:
+            for _ in range(self.ATTEMPTS_PER_THREAD):
+                while True:
+                    try:
+                        serializer = BorrowingCreateSerializer(data=payload)
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save(user_id=self.user.id)
+                        results.append(True)
+                    except ValidationError:
+                        results.append(False)
+                    except OperationalError:
+                        # SQLite reports a lock conflict instead of waiting
+                        continue
+                    break
+        finally:
+            connection.close()
+
+    def test_inventory_is_never_oversold(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        threads = [
+            threading.Thread(target=self._borrow, args=(barrier, results))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.book.refresh_from_db()
+        created = results.count(True)
+
+        self.assertEqual(len(results), self.THREADS * self.ATTEMPTS_PER_THREAD)
+        self.assertEqual(created, self.INVENTORY)
+        self.assertEqual(self.book.inventory, 0)
+        self.assertEqual(Borrowing.objects.filter(book=self.book).count(), created)
+
+
+class StubTelegramHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append(json.loads(body))
+        status_code, payload = (
+            self.server.responses.pop(0)
+            if self.server.responses
+            else (200, {"ok": True})
+        )
+        data = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NotificationDispatcherTest(TestCase):
+    """
+    Deliver the outbox to a local stub of the Telegram API.
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubTelegramHandler)
+        self.server.received = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.clock = [0.0]
+        self.sleeps = []
+        self.dispatcher = NotificationDispatcher(
+            api_url=f"http://127.0.0.1:{self.server.server_port}/sendMessage",
+            batch_size=2,
+            max_attempts=2,
+            clock=lambda: self.clock[0],
+            sleep=self.sleeps.append,
+        )
+
+    def test_dispatch_delivers_in_batches(self):
+        for number in range(3):
+            enqueue_notification(f"message {number}", chat_id=str(number))
+
+        self.assertEqual(self.dispatcher.dispatch_batch(), 2)
+        self.assertEqual(self.dispatcher.dispatch_all(), 1)
+
+        self.assertEqual(
+            [message["text"] for message in self.server.received],
+            ["message 0", "message 1", "message 2"],
+        )
+        self.assertEqual(Notification.objects.filter(status="SENT").count(), 3)
+
+    def test_delivery_is_measured(self):
+        enqueue_notification("message", chat_id="1")
+        delivered = REGISTRY.get_sample_value(
+            "library_notification_delivery_seconds_count"
+        )
+
+        self.dispatcher.dispatch_all()
+
+        self.assertEqual(
+            REGISTRY.get_sample_value("library_notification_delivery_seconds_count"),
+            delivered + 1,
+        )
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        notification = enqueue_notification("message", chat_id="1")
+        self.server.responses = [
+            (429, {"ok": False, "parameters": {"retry_after": 30}}),
+            (500, {"ok": False}),
+        ]
+
+        self.dispatcher.dispatch_all()
+        notification.refresh_from_db()
+
+        self.assertEqual(notification.status, "PENDING")
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreaterEqual(
+            notification.next_attempt_at, now() + timedelta(seconds=25)
+        )
+
+        Notification.objects.update(next_attempt_at=now())
+        self.dispatcher.dispatch_all()
+        notification.refresh_from_db()
+
+        self.assertEqual(notification.status, "FAILED")
+        self.assertEqual(notification.attempts, 2)
+
+    def test_batch_is_leased_before_delivery(self):
+        enqueue_notification("first", chat_id="1")
+        enqueue_notification("second", chat_id="1")
+        due = []
+        self.dispatcher.sleep = lambda seconds: due.append(
+            Notification.objects.filter(
+                status="PENDING", next_attempt_at__lte=now()
+            ).count()
+        )
+
+        self.assertEqual(self.dispatcher.dispatch_batch(), 2)
+
+        # while the second message waits for the chat, no row is due
+        self.assertEqual(due, [0])
+        self.assertEqual(Notification.objects.filter(status="SENT").count(), 2)
+
+    def test_messages_to_one_chat_are_rate_limited(self):
+        enqueue_notification("first", chat_id="1")
+        enqueue_notification("second", chat_id="1")
+
+        self.dispatcher.dispatch_all()
+
+        self.assertEqual(self.sleeps, [1.0])
+        self.assertEqual(len(self.server.received), 2)
+
+
+class BorrowingQueryPlanTest(QueryPlanAssertionsMixin, TestCase):
+    """
+    Every list query shape must be served by an index on seeded data.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [
+            sample_user(email=f"user{number}@test.com") for number in range(5)
+        ]
+        self.admin = sample_user(email="admin@test.com", is_staff=True)
+        books = [sample_book(title=f"book{number}") for number in range(5)]
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                user=self.users[number % 5],
+                book=books[number % 5],
+                expected_return_date=EXPECTED_RETURN_DATE,
+                is_active=number % 3 == 0,
+            )
+            for number in range(300)
+        )
+
+    def _assert_list_uses_indexes(self, params):
+        res = self.assertNoSequentialScans(self.client.get, URL_BORROWING_LIST, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        if res.data["next"]:
+            self.assertNoSequentialScans(self.client.get, res.data["next"])
+
+    def test_user_list_queries_use_indexes(self):
+        self.client.force_authenticate(self.users[0])
+        for params in ({}, {"is_active": "true"}, {"is_active": "false"}):
+            with self.subTest(params=params):
+                self._assert_list_uses_indexes(params)
+
+    def test_admin_list_queries_use_indexes(self):
+        self.client.force_authenticate(self.admin)
+        user_id = self.users[0].id
+        for params in (
+            {},
+            {"is_active": "true"},
+            {"user_id": user_id},
+            {"user_id": user_id, "is_active": "false"},
+        ):
+            with self.subTest(params=params):
+                self._assert_list_uses_indexes(params)
+
+
+class FineCalculatorTest(QueryPlanAssertionsMixin, TestCase):
+    AS_OF = date(2030, 1, 10)
+
+    def setUp(self):
+        self.user = sample_user()
+        self.book = sample_book(daily_fee="1.50", inventory=10)
+
+    def _borrow(self, due, **params):
+        return Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return_date=due, **params
+        )
+
+    def test_only_active_overdue_borrowings_are_fined(self):
+        overdue = self._borrow(date(2030, 1, 7))
+        self._borrow(date(2030, 1, 10))
+        self._borrow(date(2030, 1, 1), is_active=False)
+
+        run = FineCalculator(as_of=self.AS_OF).run()
+
+        self.assertEqual(run.processed, 1)
+        fine = Fine.objects.get()
+        self.assertEqual(fine.borrowing, overdue)
+        self.assertEqual(fine.user, self.user)
+        self.assertEqual(fine.days_overdue, 3)
+        self.assertEqual(fine.amount, Decimal("9.00"))
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        borrowings = [self._borrow(date(2030, 1, day)) for day in (1, 5, 5, 8, 9)]
+
+        class CrashingCalculator(FineCalculator):
+            def write_chunk(self, run, rows):
+                if run.processed >= 2:
+                    raise RuntimeError("worker killed")
+                super().write_chunk(run, rows)
+
+        with self.assertRaises(RuntimeError):
+            CrashingCalculator(as_of=self.AS_OF, chunk_size=2).run()
+        self.assertEqual(Fine.objects.count(), 2)
+
+        calculator = FineCalculator(as_of=self.AS_OF, chunk_size=2)
+        # get the run, two chunks of select + paid fines lock, upsert and
+        # checkpoint inside a savepoint, switch to the late returns, find
+        # the previous run and select them, then refresh the summaries and
+        # mark the run finished
+        with self.assertNumQueries(1 + 2 * 6 + 3 + 2):
+            run = calculator.run()
+        self.assertEqual(run.processed, len(borrowings))
+        self.assertEqual(
+            sorted(Fine.objects.values_list("days_overdue", flat=True)),
+            [1, 2, 5, 5, 9],
+        )
+
+        with self.assertNumQueries(1):
+            calculator.run()
+
+    def test_next_day_updates_fines(self):
+        borrowing = self._borrow(date(2030, 1, 9))
+        FineCalculator(as_of=self.AS_OF).run()
+        FineCalculator(as_of=self.AS_OF).run(restart=True)
+
+        FineCalculator(as_of=date(2030, 1, 12)).run()
+
+        fine = Fine.objects.get(borrowing=borrowing)
+        self.assertEqual((fine.days_overdue, fine.amount), (3, Decimal("9.00")))
+        self.assertEqual(FineRun.objects.count(), 2)
+
+    def test_late_returns_since_previous_run_are_fined_until_returned(self):
+        FineCalculator(as_of=date(2030, 1, 5)).run()
+        late = self._borrow(
+            date(2030, 1, 4), is_active=False, actual_return_date=date(2030, 1, 7)
+        )
+        self._borrow(
+            date(2030, 1, 1), is_active=False, actual_return_date=date(2030, 1, 3)
+        )
+        self._borrow(
+            date(2030, 1, 8), is_active=False, actual_return_date=date(2030, 1, 8)
+        )
+
+        run = FineCalculator(as_of=self.AS_OF, chunk_size=1).run()
+
+        self.assertEqual(run.processed, 1)
+        fine = Fine.objects.get()
+        self.assertEqual(fine.borrowing, late)
+        self.assertEqual((fine.days_overdue, fine.amount), (3, Decimal("9.00")))
+
+    def test_paid_fines_are_kept_and_later_days_fined_anew(self):
+        borrowing = self._borrow(date(2030, 1, 9))
+        FineCalculator(as_of=self.AS_OF).run()
+        Fine.objects.update(status="PAID")
+
+        FineCalculator(as_of=self.AS_OF).run(restart=True)
+        self.assertEqual(Fine.objects.count(), 1)
+        FineCalculator(as_of=date(2030, 1, 12)).run()
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            is_active=False, actual_return_date=date(2030, 1, 13)
+        )
+        FineCalculator(as_of=date(2030, 1, 14)).run()
+
+        self.assertEqual(
+            list(
+                Fine.objects.order_by("charged_from").values_list(
+                    "charged_from", "days_overdue", "amount", "status"
+                )
+            ),
+            [
+                (date(2030, 1, 9), 1, Decimal("3.00"), "PAID"),
+                (self.AS_OF, 3, Decimal("9.00"), "PENDING"),
+            ],
+        )
+
+    def test_chunks_are_read_through_an_index(self):
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                user=self.user,
+                book=self.book,
+                expected_return_date=date(2030, 1, 1 + number % 20),
+                is_active=number % 3 == 0,
+            )
+            for number in range(300)
+        )
+        calculator = FineCalculator(as_of=self.AS_OF, chunk_size=10)
+        run = calculator.get_run()
+        calculator.write_chunk(run, calculator.next_chunk(run))
+
+        self.assertNoSequentialScans(calculator.next_chunk, run)
+        run.phase = "RETURNED"
+        self.assertNoSequentialScans(calculator.next_chunk, run)
+
+    def test_calculate_fines_command(self):
+        self._borrow(date(2030, 1, 1))
+        out = io.StringIO()
+
+        call_command("calculate_fines", "--date=2030-01-10", stdout=out)
+
+        self.assertIn("1 overdue borrowings processed", out.getvalue())
+        self.assertEqual(Fine.objects.get().amount, Decimal("27.00"))
+
+
+class BorrowingSummaryTest(TestCase):
+    SUMMARY_URL = reverse("borrowing:borrowing-summary")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = sample_user()
+        self.book = sample_book(inventory=5)
+        self.client.force_authenticate(self.user)
+
+    def _summary(self, **params):
+        with self.assertNumQueries(1):
+            res = self.client.get(self.SUMMARY_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_counters_follow_borrow_and_return(self):
+        self.assertEqual(self._summary()["active_count"], 0)
+
+        for _ in range(2):
+            res = self.client.post(
+                URL_BORROWING_LIST,
+                {"book": self.book.id, "expected_return_date": EXPECTED_RETURN_DATE},
+            )
+        return_borrowing(Borrowing.objects.get(pk=res.data["id"]))
+
+        summary = self._summary()
+        self.assertEqual(summary["active_count"], 1)
+        self.assertEqual(summary["total_borrowed"], 2)
+        self.assertEqual(summary["overdue_count"], 0)
+
+    def test_overdue_and_fines_after_calculation(self):
+        borrowing = sample_borrowing(
+            user=self.user, book=self.book, expected_return_date=date(2030, 1, 1)
+        )
+        call_command("reconcile_borrowing_summaries", stdout=io.StringIO())
+        FineCalculator(as_of=date(2030, 1, 3)).run()
+
+        summary = self._summary()
+        self.assertEqual(summary["overdue_count"], 1)
+        self.assertEqual(summary["outstanding_fines"], "4.00")
+
+        return_borrowing(borrowing)
+        summary = self._summary()
+        self.assertEqual((summary["active_count"], summary["overdue_count"]), (0, 0))
+        self.assertEqual(summary["outstanding_fines"], "4.00")
+
+    def test_only_staff_see_other_users(self):
+        other = sample_user(email="other@test.com")
+        BorrowingSummary.objects.create(user=other, active_count=3)
+
+        self.assertEqual(self._summary(user_id=other.id)["active_count"], 0)
+        self.client.force_authenticate(sample_user(email="a@a.com", is_staff=True))
+        self.assertEqual(self._summary(user_id=other.id)["active_count"], 3)
+
+    def test_users_me_stats(self):
+        BorrowingSummary.objects.create(user=self.user, total_borrowed=7)
+
+        res = self.client.get(reverse("user:stats"))
+
+        self.assertEqual(res.data["total_borrowed"], 7)
+
+    def test_reconcile_rebuilds_counters(self):
+        sample_borrowing(user=self.user, book=self.book)
+        sample_borrowing(user=self.user, book=self.book, is_active=False)
+        BorrowingSummary.objects.create(user=self.user, active_count=9)
+
+        call_command("reconcile_borrowing_summaries", stdout=io.StringIO())
+
+        summary = BorrowingSummary.objects.get(user=self.user)
+        self.assertEqual((summary.active_count, summary.total_borrowed), (1, 2))
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(self.user)
+
+    def _sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_borrowings_and_rejections_are_counted(self):
+        book = sample_book(inventory=1)
+        payload = {"book": book.id, "expected_return_date": EXPECTED_RETURN_DATE}
+        borrowed = self._sample("library_borrowings_total", operation="borrow")
+        rejected = self._sample(
+            "library_borrow_rejections_total", reason="out_of_stock"
+        )
+        requests = self._sample(
+            "library_request_duration_seconds_count",
+            view="BorrowingViewSet",
+            action="create",
+            method="POST",
+            status="201",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(URL_BORROWING_LIST, payload)
+        self.client.post(URL_BORROWING_LIST, payload)
+
+        self.assertEqual(
+            self._sample("library_borrowings_total", operation="borrow"), borrowed + 1
+        )
+        self.assertEqual(
+            self._sample("library_borrow_rejections_total", reason="out_of_stock"),
+            rejected + 1,
+        )
+        self.assertEqual(
+            self._sample(
+                "library_request_duration_seconds_count",
+                view="BorrowingViewSet",
+                action="create",
+                method="POST",
+                status="201",
+            ),
+            requests + 1,
+        )
+
+    @override_settings(DEBUG=True)
+    def test_metrics_endpoint(self):
+        self.client.get(URL_BORROWING_LIST)
+
+        res = self.client.get("/metrics")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            b'library_request_db_queries_count{action="list",view="BorrowingViewSet"}',
+            res.content,
+        )
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+
+        res = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_metrics_need_a_token_without_debug(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+
+    @patch("borrowing.management.commands.dispatch_notifications.start_http_server")
+    def test_dispatcher_serves_its_metrics(self, start_http_server):
+        call_command("dispatch_notifications", "--once", stdout=io.StringIO())
+        start_http_server.assert_not_called()
+
+        call_command(
+            "dispatch_notifications",
+            "--once",
+            "--metrics-port=9100",
+            stdout=io.StringIO(),
+        )
+
+        start_http_server.assert_called_once_with(9100)
+
+
+class BorrowingFastListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = sample_user(email="ü@test.com")
+        titles = ['Dostoyevsky "Idiot"', "line\nbreak \u2028 \\ </script>", "книга"]
+        for number, title in enumerate(titles):
+            sample_borrowing(
+                user=self.user,
+                book=sample_book(title=title),
+                is_active=bool(number % 2),
+                actual_return_date=None if number % 2 else date(2030, 1, 2),
+            )
+
+    def _compare(self, params=None, url=URL_BORROWING_LIST):
+        res = self.client.get(url, params)
+        with patch.object(BorrowingViewSet, "fast_list", False):
+            expected = self.client.get(url, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, expected.content)
+        self.assertEqual(res["Content-Type"], expected["Content-Type"])
+        self.assertEqual(res.get("X-Total-Count"), expected.get("X-Total-Count"))
+        self.assertEqual(res["ETag"], expected["ETag"])
+        return res
+
+    def test_user_list_is_byte_compatible(self):
+        self.client.force_authenticate(self.user)
+
+        res = self._compare({"page_size": 2, "count": "true"})
+        res = self._compare(url=res.json()["next"])
+        self.assertEqual(len(res.json()["results"]), 1)
+
+    def test_admin_list_is_byte_compatible(self):
+        self.client.force_authenticate(sample_user(email="a@a.com", is_staff=True))
+
+        self._compare()
+        self._compare({"is_active": "false", "user_id": self.user.id})
+
+    def test_browsable_api_uses_serializers(self):
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(URL_BORROWING_LIST, HTTP_ACCEPT="text/html")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn("text/html", res["Content-Type"])
+
+
+class BorrowingExportTest(TestCase):
+    EXPORT_URL = reverse("borrowing:borrowing-bulk-export")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(sample_user(email="a@a.com", is_staff=True))
+        self.user = sample_user()
+        self.book = sample_book(title="Emma", inventory=5)
+        self.borrowings = [
+            sample_borrowing(user=self.user, book=self.book, is_active=i == 0)
+            for i in range(3)
+        ]
+        Borrowing.objects.filter(pk=self.borrowings[2].pk).update(
+            borrow_date=datetime(2030, 1, 10, 12, tzinfo=dt_timezone.utc)
+        )
+
+    def _export(self, **params):
+        res = self.client.get(self.EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        return b"".join(res.streaming_content)
+
+    def test_json_array(self):
+        sample_borrowing(user=sample_user(email="other@test.com"))
+
+        rows = json.loads(self._export(user_id=self.user.id))
+
+        self.assertEqual([row["id"] for row in rows], [b.id for b in self.borrowings])
+        self.assertEqual(rows[0]["user"], "user@test.com")
+        self.assertEqual(rows[0]["book"], "Emma")
+        self.assertIs(rows[0]["is_active"], True)
+        self.assertEqual(json.loads(self._export(user_id=0)), [])
+
+    def test_ndjson_with_filters(self):
+        content = self._export(
+            type="ndjson",
+            is_active="false",
+            borrowed_after="2030-01-10",
+            borrowed_before="2030-01-10",
+        )
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.borrowings[2].id])
+        self.assertTrue(rows[0]["borrow_date"].startswith("2030-01-10T12:00:00"))
+
+    async def test_asgi_streams_batches_of_an_async_iterator(self):
+        admin = await get_user_model().objects.aget(email="a@a.com")
+        auth = {"Authorization": f"Bearer {AccessToken.for_user(admin)}"}
+
+        with patch("Library_service_project.streaming.ASYNC_BATCH_SIZE", 2):
+            res = await AsyncClient().get(
+                self.EXPORT_URL, {"type": "ndjson"}, headers=auth
+            )
+            self.assertTrue(res.is_async)
+            chunks = [chunk async for chunk in res.streaming_content]
+
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [b.id for b in self.borrowings])
+
+    def test_invalid_parameters(self):
+        for params in ({"type": "xml"}, {"borrowed_after": "yesterday"}):
+            res = self.client.get(self.EXPORT_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_only_for_staff(self):
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(self.EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
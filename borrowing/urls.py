@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from borrowing.views import BorrowingViewSet
+from borrowing.views import BorrowingViewSet, HoldViewSet
 
 app_name = "borrowing"
 
 router = routers.DefaultRouter()
+# before the borrowings, whose detail route would match "holds"
+router.register(r"holds", HoldViewSet, basename="hold")
 router.register(r"", BorrowingViewSet, basename="borrowing")
 
 urlpatterns = [path("", include(router.urls))]
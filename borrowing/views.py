@@ -1,18 +1,59 @@
 from django.core.exceptions import RequestAborted
+from django.db import transaction
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter
 from rest_framework import mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from borrowing.helper import send_telegram_message
-from borrowing.models import Borrowing
+from Library_service_project.conditional import ConditionalGetMixin
+from Library_service_project.fast_lists import FastListMixin
+from Library_service_project.streaming import streaming_response
+from borrowing.export import (
+    EXPORT_FIELDS,
+    FORMATS,
+    ExportFilterError,
+    export_rows,
+    filter_dates,
+)
+from borrowing.idempotency import (
+    HEADER as IDEMPOTENCY_HEADER,
+    idempotent,
+    retryable,
+)
+from borrowing.models import Borrowing, Hold
+from borrowing.outbox import enqueue_notification
+from borrowing.pagination import BorrowingPagination
 from borrowing.serializers import (
     BorrowingUserSerializer,
     BorrowingAdminListSerializer,
     BorrowingAdminRetrieveSerializer,
     BorrowingUserRetrieveSerializer,
     BorrowingCreateSerializer,
+    BorrowingSummarySerializer,
+    BorrowingBulkReturnSerializer,
+    BorrowingBulkReturnResultSerializer,
+    HoldSerializer,
+)
+from borrowing.services import (
+    BorrowingStateError,
+    cancel_hold,
+    queue_positions,
+    return_borrowing,
+    return_borrowings,
+)
+from borrowing.summary import get_summary
+
+IDEMPOTENCY_KEY = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER,
+    location=OpenApiParameter.HEADER,
+    type={"type": "string"},
+    description=(
+        "Retries with the same key get the first response back instead of "
+        "repeating the operation."
+    ),
 )
 
 
@@ -20,7 +61,7 @@ from borrowing.serializers import (
     list=extend_schema(
         summary="List borrowings",
         description=(
-            "Retrieve a list of borrowings. "
+            "Retrieve a cursor-paginated list of borrowings, newest first. "
             "Staff users can filter by `user_id` and `is_active`."
         ),
         parameters=[
@@ -46,11 +87,14 @@ from borrowing.serializers import (
     create=extend_schema(
         summary="Create a borrowing",
         description="Create a new borrowing for the authenticated user.",
+        parameters=[IDEMPOTENCY_KEY],
         request=BorrowingCreateSerializer,
         responses={201: BorrowingCreateSerializer},
     ),
 )
 class BorrowingViewSet(
+    ConditionalGetMixin,
+    FastListMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
@@ -61,9 +105,25 @@ class BorrowingViewSet(
 
     - Regular users can list and retrieve their borrowings.
     - Staff users can list, retrieve, and filter all borrowings.
+    - List and retrieve support conditional GETs (ETag, Last-Modified on
+      retrieve), validated against the borrowing and its book.
+    - JSON lists are read with `.values()` and encoded with orjson.
+    - Summary returns the borrowing counters of the user.
+    - Staff users can return a batch of borrowings at once.
+    - Staff users can export borrowing histories as JSON, NDJSON or CSV.
+    - Create and return replay their first response to retries sent with
+      the same `Idempotency-Key` header.
+    - Create is rate limited per user (`borrow` scope), reads per user
+      (`read` scope).
     """
 
     queryset = Borrowing.objects.select_related("user", "book")
+    pagination_class = BorrowingPagination
+    export_chunk_size = 2000
+
+    @property
+    def throttle_scope(self):
+        return "borrow" if self.action == "create" else None
 
     @staticmethod
     def change_str_bool_to_int(is_active):
@@ -81,7 +141,8 @@ class BorrowingViewSet(
         is_active = self.request.query_params.get("is_active")
 
         if not user.is_staff:
-            queryset = Borrowing.objects.filter(user=user)
+            # own borrowings, their user is never serialized
+            queryset = Borrowing.objects.select_related("book").filter(user_id=user.id)
 
         if user_id:
             queryset = queryset.filter(user_id=int(user_id))
@@ -95,6 +156,13 @@ class BorrowingViewSet(
 
         return queryset
 
+    def get_related_fields(self):
+        # the book is embedded in every representation, the user's email
+        # only in the staff ones
+        if self.request.user.is_staff:
+            return ("book__updated_at",), ("user__email",)
+        return ("book__updated_at",), ()
+
     def get_serializer_class(self):
         user = self.request.user
 
@@ -112,15 +180,30 @@ class BorrowingViewSet(
 
         return BorrowingCreateSerializer
 
-    def perform_create(self, serializer):
-        borrowing = serializer.save(user=self.request.user)
-        message = (
-            f"New borrowing created:\n"
-            f"User: {borrowing.user.email}\n"
-            f"Book: {borrowing.book.title}\n"
-            f"Expected Return Date: {borrowing.expected_return_date}"
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            try:
+                # request.user may be a token user, which is not a model instance
+                borrowing = serializer.save(user_id=request.user.id)
+            except ValidationError as e:
+                # returned, not raised, so the transaction commits the holds
+                # given the copy before the borrower was turned down, the
+                # borrower may retry once a copy comes back
+                return retryable(Response(e.detail, status=status.HTTP_400_BAD_REQUEST))
+            message = (
+                f"New borrowing created:\n"
+                f"User: {request.user.email}\n"
+                f"Book: {borrowing.book.title}\n"
+                f"Expected Return Date: {borrowing.expected_return_date}"
+            )
+            enqueue_notification(message)
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
-        send_telegram_message(message)
 
     @extend_schema(
         summary="Return a borrowed book",
@@ -128,6 +211,7 @@ class BorrowingViewSet(
             "Mark a book as returned. "
             "This operation is available only for staff users."
         ),
+        parameters=[IDEMPOTENCY_KEY],
         responses={
             200: OpenApiParameter(
                 name="detail", type={"type": "string"}, description="Success message"
@@ -138,16 +222,195 @@ class BorrowingViewSet(
         },
     )
     @action(detail=True, methods=["post"], url_path="return")
+    @idempotent
     def return_book(self, request, pk=None):
         """
         Custom action to mark a borrowed book as returned.
         """
         borrowing = self.get_object()
         try:
-            borrowing.return_book()
+            return_borrowing(borrowing)
             return Response(
                 {"detail": "Book successfully returned"},
                 status=status.HTTP_200_OK,
             )
-        except ValueError as e:
+        except BorrowingStateError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(
+        summary="Return a batch of borrowed books",
+        description=(
+            "Mark up to 1000 borrowings as returned in one transaction. "
+            "Each id is reported as `returned`, `already_returned` or "
+            "`not_found`. This operation is available only for staff users."
+        ),
+        request=BorrowingBulkReturnSerializer,
+        responses={200: BorrowingBulkReturnResultSerializer(many=True)},
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="return",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk_return(self, request):
+        serializer = BorrowingBulkReturnSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = return_borrowings(serializer.validated_data["ids"])
+        return Response(results, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="Export borrowings",
+        description=(
+            "Stream every matching borrowing ordered by ID as a JSON array, "
+            "NDJSON or CSV. Supports the `user_id` and `is_active` filters of "
+            "the list and an inclusive range of borrow dates. "
+            "This operation is available only for staff users."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="type",
+                type={"type": "string", "enum": list(FORMATS)},
+                description="Output format, `json` by default.",
+            ),
+            OpenApiParameter(
+                name="user_id",
+                type={"type": "integer"},
+                description="Borrowings of one user.",
+            ),
+            OpenApiParameter(
+                name="is_active",
+                type={"type": "string", "enum": ["true", "false"]},
+                description="Filter borrowings by active status.",
+            ),
+            OpenApiParameter(
+                name="borrowed_after",
+                type={"type": "string", "format": "date"},
+                description="Borrowed on or after this date.",
+            ),
+            OpenApiParameter(
+                name="borrowed_before",
+                type={"type": "string", "format": "date"},
+                description="Borrowed on or before this date.",
+            ),
+        ],
+        responses={
+            (200, "application/json"): {"type": "array", "items": {"type": "object"}},
+            (200, "application/x-ndjson"): {"type": "string"},
+            (200, "text/csv"): {"type": "string"},
+            400: {"description": "Unsupported format or invalid date."},
+            403: {"description": "Permission denied."},
+        },
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="export",
+        permission_classes=[IsAdminUser],
+        pagination_class=None,
+    )
+    def bulk_export(self, request):
+        export_format = request.query_params.get("type", "json")
+        if export_format not in FORMATS:
+            return Response(
+                {"detail": f"Unsupported format, use one of: {', '.join(FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            queryset = filter_dates(self.get_queryset(), request.query_params)
+        except ExportFilterError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return streaming_response(
+            request,
+            export_format,
+            EXPORT_FIELDS,
+            export_rows(queryset, chunk_size=self.export_chunk_size),
+            filename="borrowings",
+        )
+
+    @extend_schema(
+        summary="Borrowing summary",
+        description=(
+            "Number of active, overdue and all borrowings and the outstanding "
+            "fines of the authenticated user. Staff users can pass `user_id`. "
+            "Overdue counts and fines are as of the last fine calculation."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name="user_id",
+                type={"type": "integer"},
+                description="Summary of another user (staff only).",
+            ),
+        ],
+        responses={200: BorrowingSummarySerializer},
+    )
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def summary(self, request):
+        user_id = request.user.id
+        if request.user.is_staff and request.query_params.get("user_id"):
+            try:
+                user_id = int(request.query_params["user_id"])
+            except ValueError:
+                return Response(
+                    {"detail": "'user_id' must be an integer"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        return Response(BorrowingSummarySerializer(get_summary(user_id)).data)
+
+
+@extend_schema_view(
+    list=extend_schema(
+        summary="List holds",
+        description=(
+            "Holds of the authenticated user with their position in the queue "
+            "of the book, 1 being the next served."
+        ),
+    ),
+    retrieve=extend_schema(
+        summary="Retrieve a hold",
+        description="Retrieve a hold of the authenticated user.",
+    ),
+    create=extend_schema(
+        summary="Place a hold",
+        description=(
+            "Join the queue of an out-of-stock book. The first returned copy "
+            "goes to the oldest waiting hold, which becomes a borrowing of "
+            "`loan_days` days."
+        ),
+    ),
+    destroy=extend_schema(
+        summary="Cancel a hold",
+        description="Leave the queue of the book.",
+    ),
+)
+class HoldViewSet(
+    mixins.ListModelMixin,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    GenericViewSet,
+):
+    """
+    Hold API ViewSet to queue for out-of-stock books.
+
+    - Users list, place and cancel their own holds.
+    - Waiting holds show their position in the queue of the book.
+    - Returned copies are given to the oldest waiting hold.
+    """
+
+    queryset = Hold.objects.all()
+    serializer_class = HoldSerializer
+
+    def get_queryset(self):
+        return queue_positions(self.queryset.filter(user_id=self.request.user.id))
+
+    def perform_create(self, serializer):
+        # request.user may be a token user, which is not a model instance
+        serializer.save(user_id=self.request.user.id)
+
+    def destroy(self, request, *args, **kwargs):
+        try:
+            hold = cancel_hold(self.get_object())
+        except BorrowingStateError as e:
             return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(hold).data, status=status.HTTP_200_OK)
@@ -17,5 +17,19 @@ if not User.objects.filter(email='admin@admin.com').exists():
     User.objects.create_superuser(email='admin@admin.com', password='1qazcde3')
 "
 
-echo "!! Starting Django server..."
-python manage.py runserver 0.0.0.0:8000
+case "${1:-runserver}" in
+  serve)
+    echo "!! Collecting static files..."
+    python manage.py collectstatic --noinput
+
+    echo "!! Starting Gunicorn..."
+    exec gunicorn --config gunicorn.conf.py
+    ;;
+  runserver)
+    echo "!! Starting Django server..."
+    exec python manage.py runserver 0.0.0.0:8000
+    ;;
+  *)
+    exec "$@"
+    ;;
+esac
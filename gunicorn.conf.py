@@ -0,0 +1,74 @@
+"""
+Gunicorn settings for `entrypoint.sh serve`, every value can be overridden
+from the environment.
+
+The WSGI application runs on sync workers, or on threaded workers when
+GUNICORN_THREADS is above 1. With SERVER_INTERFACE=asgi the ASGI
+application runs on uvicorn workers instead.
+
+Prometheus samples of all workers are collected in
+PROMETHEUS_MULTIPROC_DIR, which is emptied when the server starts.
+
+Send SIGHUP to the master process to replace the workers gracefully, the
+new workers load the current code. GUNICORN_PRELOAD=true loads the code
+once in the master instead, which starts workers faster and shares
+memory between them, but then a code change needs a full restart.
+
+Static files (admin, API docs) are collected by `entrypoint.sh serve`
+and served by WhiteNoise.
+"""
+
+import multiprocessing
+import os
+import shutil
+
+
+def _bool(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+
+if os.getenv("SERVER_INTERFACE", "wsgi") == "asgi":
+    wsgi_app = "Library_service_project.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "Library_service_project.wsgi:application"
+    worker_class = "gthread" if threads > 1 else "sync"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", worker_class)
+
+preload_app = _bool("GUNICORN_PRELOAD", "false")
+reload = _bool("GUNICORN_RELOAD", "false")
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+
+# recycle workers now and then, so a slow leak cannot grow forever
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# set before the application imports prometheus_client
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/library-prometheus"
+)
+
+
+def on_starting(server):
+    # samples of a previous run would be added to the new ones
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
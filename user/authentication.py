@@ -0,0 +1,93 @@
+"""
+JWT authentication that can trust the claims of the token.
+
+Access tokens carry `email`, `is_staff` and `is_active` claims (see
+`user.serializers.TokenObtainPairSerializerExtended`). With
+`JWT_STATELESS_AUTH` enabled the request user is built from those claims
+instead of being loaded from the database.
+
+Claims can go stale while a token is alive, so while it is enabled any
+change of these fields, the password or a deletion records a revocation
+time in the cache for the lifetime of an access token. Tokens issued before it are rejected.
+The revocation is only seen by every worker when the cache is shared
+(file or redis).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+USER_CLAIMS = ("email", "is_staff", "is_active")
+# "iat" only has a precision of seconds, too coarse to tell a token issued
+# right after a revocation from one issued right before it
+ISSUED_AT_CLAIM = "issued_at"
+REVOKED_KEY = "user:revoked:{}"
+
+
+def get_auth_cache():
+    return caches[settings.AUTH_CACHE_ALIAS]
+
+
+def revoke_tokens(user_id):
+    """Reject every access token of the user issued until now."""
+    timeout = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    get_auth_cache().set(REVOKED_KEY.format(user_id), time.time(), timeout)
+
+
+def is_revoked(user_id, issued_at):
+    revoked_at = get_auth_cache().get(REVOKED_KEY.format(user_id))
+    return revoked_at is not None and (issued_at or 0) < revoked_at
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token[ISSUED_AT_CLAIM] = time.time()
+    return token
+
+
+class ClaimsTokenUser(TokenUser):
+    """User backed by the claims of a validated access token."""
+
+    @cached_property
+    def email(self):
+        return self.token.get("email", "")
+
+    @cached_property
+    def is_active(self):
+        return self.token.get("is_active", False)
+
+    def get_username(self):
+        return self.email
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` that skips the user query when
+    `JWT_STATELESS_AUTH` is on and the token carries the user claims.
+    """
+
+    def get_user(self, validated_token):
+        claims = (api_settings.USER_ID_CLAIM, *USER_CLAIMS)
+        if not settings.JWT_STATELESS_AUTH or any(
+            claim not in validated_token for claim in claims
+        ):
+            # tokens issued before the claims were added still work
+            return super().get_user(validated_token)
+
+        user = ClaimsTokenUser(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        issued_at = validated_token.get(ISSUED_AT_CLAIM, validated_token.get("iat"))
+        if is_revoked(user.id, issued_at):
+            raise AuthenticationFailed(
+                _("Token has been revoked"), code="token_revoked"
+            )
+        return user
@@ -0,0 +1,61 @@
+"""
+Password hashers with their cost read from `PASSWORD_HASHER_COSTS`.
+
+They keep the algorithm names of Django's hashers, so existing hashes
+still verify. `must_update` compares a hash with the current cost, and a
+login rehashes a password whose cost or hasher is not the current one.
+"""
+
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def cost(policy, name, default):
+    """Cost attribute `name` of the `policy` hasher, Django's when unset."""
+    return property(
+        lambda self: settings.PASSWORD_HASHER_COSTS.get(policy, {}).get(name, default)
+    )
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = cost("pbkdf2", "iterations", hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = cost(
+        "scrypt", "work_factor", hashers.ScryptPasswordHasher.work_factor
+    )
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        # Django's, with maxmem of the cost being hashed: scrypt uses
+        # 128 * block_size * work_factor bytes, OpenSSL refuses more than
+        # 32 MiB unless maxmem allows it, and a hash being verified may have
+        # a higher cost than the current one
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            maxmem=2 * 128 * n * r,
+            dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode("ascii").strip()
+        return "%s$%d$%s$%d$%d$%s" % (self.algorithm, n, salt, r, p, hash_)
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = cost("argon2", "time_cost", hashers.Argon2PasswordHasher.time_cost)
+    memory_cost = cost(
+        "argon2", "memory_cost", hashers.Argon2PasswordHasher.memory_cost
+    )
+    parallelism = cost(
+        "argon2", "parallelism", hashers.Argon2PasswordHasher.parallelism
+    )
@@ -2,6 +2,7 @@ from django.contrib.auth.models import (
     AbstractUser,
     BaseUserManager,
 )
+from django.contrib.auth.hashers import check_password
 from django.db import models
 from django.utils.translation import gettext as _
 
@@ -48,3 +49,22 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+
+    def check_password(self, raw_password):
+        """
+        Check the password and rehash it when the hasher policy changed.
+
+        The rehash keeps the password, so it is saved with
+        `password_rehashed` set and does not revoke the tokens of the user.
+        """
+
+        def setter(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            self.password_rehashed = True
+            try:
+                self.save(update_fields=["password"])
+            finally:
+                self.password_rehashed = False
+
+        return check_password(raw_password, self.password, setter)
@@ -1,6 +1,14 @@
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers
 from django.utils.translation import gettext as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+from user.authentication import add_user_claims
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -51,3 +59,35 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs["user"] = user
         return attrs
+
+
+class TokenObtainPairSerializerExtended(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        """Embed the claims the stateless authentication relies on"""
+        return add_user_claims(super().get_token(user), user)
+
+
+class TokenRefreshSerializerExtended(TokenRefreshSerializer):
+    def validate(self, attrs):
+        """Issue the new access token with the current claims of the user"""
+        refresh = self.token_class(attrs["refresh"])
+        user = (
+            get_user_model()
+            .objects.filter(
+                **{api_settings.USER_ID_FIELD: refresh.get(api_settings.USER_ID_CLAIM)}
+            )
+            .first()
+        )
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                _("No active account found with the given credentials"),
+                code="no_active_account",
+            )
+
+        data = super().validate(attrs)
+        access = add_user_claims(refresh.access_token, user)
+        # the "iat" copied from the refresh token would predate a revocation
+        access.set_iat()
+        data["access"] = str(access)
+        return data
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, pre_save
+from django.dispatch import receiver
+
+from user.authentication import USER_CLAIMS, revoke_tokens
+
+User = get_user_model()
+
+WATCHED_FIELDS = (*USER_CLAIMS, "is_superuser", "password")
+
+
+@receiver(pre_save, sender=User)
+def revoke_stale_claims(sender, instance, raw=False, update_fields=None, **kwargs):
+    # only stateless authentication trusts the claims, skip the extra query
+    if not settings.JWT_STATELESS_AUTH:
+        return
+    if raw or instance.pk is None or getattr(instance, "password_rehashed", False):
+        return
+    if update_fields is not None and not set(update_fields) & set(WATCHED_FIELDS):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values(*WATCHED_FIELDS).first()
+    if previous is None:
+        return
+    if any(previous[field] != getattr(instance, field) for field in WATCHED_FIELDS):
+        revoke_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user(sender, instance, **kwargs):
+    revoke_tokens(instance.pk)
@@ -1,3 +1,355 @@
-from django.test import TestCase
+import datetime
+from unittest import SkipTest
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from redis import Redis, RedisError
+
+from Library_service_project.throttling import local_store
+from books.models import Book
+from user.authentication import REVOKED_KEY, get_auth_cache
+
+TOKEN_URL = reverse("user:token_obtain_pair")
+REFRESH_URL = reverse("user:token_refresh")
+ME_URL = reverse("user:manage")
+REGISTER_URL = reverse("user:create")
+BOOK_URL = reverse("books:book-list")
+BORROWING_URL = reverse("borrowing:borrowing-list")
+
+LOCMEM_CACHE = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "user-tests",
+    }
+}
+
+
+@override_settings(JWT_STATELESS_AUTH=True, CACHES=LOCMEM_CACHE)
+class StatelessAuthenticationTest(TestCase):
+    def setUp(self):
+        get_auth_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.test", password="testpassword"
+        )
+
+    def _login(self, email="test@test.test", password="testpassword"):
+        res = self.client.post(TOKEN_URL, {"email": email, "password": password})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data["access"], res.data["refresh"]
+
+    def _get(self, url, access):
+        return self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def _user_queries(self, url, access):
+        with CaptureQueriesContext(connection) as queries:
+            res = self._get(url, access)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [query for query in queries if '"user_user"' in query["sql"]]
+
+    def test_token_carries_user_claims(self):
+        access, refresh = self._login()
+        token = AccessToken(access)
+
+        self.assertEqual(token["email"], "test@test.test")
+        self.assertIs(token["is_staff"], False)
+        self.assertIs(token["is_active"], True)
+
+    def test_authenticated_read_skips_user_query(self):
+        access, refresh = self._login()
+
+        self.assertEqual(self._user_queries(BORROWING_URL, access), [])
+        with override_settings(JWT_STATELESS_AUTH=False):
+            self.assertEqual(len(self._user_queries(BORROWING_URL, access)), 1)
+
+    def test_staff_claim_allows_admin_actions(self):
+        get_user_model().objects.create_user(
+            email="admin@test.test", password="testpassword", is_staff=True
+        )
+        access, refresh = self._login("admin@test.test")
+        payload = {
+            "title": "book",
+            "author": "author",
+            "cover": "SOFT",
+            "inventory": 1,
+            "daily_fee": 1,
+        }
+
+        res = self.client.post(BOOK_URL, payload, HTTP_AUTHORIZATION=f"Bearer {access}")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_changed_user_revokes_issued_tokens(self):
+        access, refresh = self._login()
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self._get(BORROWING_URL, access)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_save_skips_claims_query_with_stateful_auth(self):
+        self.user.is_staff = True
+        with override_settings(JWT_STATELESS_AUTH=False):
+            with CaptureQueriesContext(connection) as queries:
+                self.user.save()
+
+        self.assertEqual(len(queries), 1)
+
+    def test_last_login_update_keeps_tokens(self):
+        access, refresh = self._login()
+        self.user.last_login = datetime.datetime.now(datetime.timezone.utc)
+        self.user.save(update_fields=["last_login"])
+
+        self.assertEqual(self._get(BORROWING_URL, access).status_code, 200)
+
+    def test_refresh_issues_current_claims(self):
+        access, refresh = self._login()
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {"refresh": refresh})
+        access = res.data["access"]
+
+        self.assertIs(AccessToken(access)["is_staff"], True)
+        self.assertEqual(self._get(BORROWING_URL, access).status_code, 200)
+
+    def test_refresh_rejected_for_inactive_user(self):
+        access, refresh = self._login()
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(REFRESH_URL, {"refresh": refresh})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(
+            self._get(BORROWING_URL, access).status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+    def test_token_without_claims_loads_the_user(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+
+        self.assertEqual(len(self._user_queries(BORROWING_URL, access)), 1)
+
+    def test_manage_user_and_borrow_with_token_user(self):
+        access, refresh = self._login()
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {access}"}
+        book = Book.objects.create(
+            title="book", author="author", cover="SOFT", inventory=1, daily_fee=1
+        )
+
+        res = self.client.patch(ME_URL, {"first_name": "Name"}, **auth)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], "test@test.test")
+
+        res = self.client.post(
+            BORROWING_URL,
+            {"book": book.id, "expected_return_date": "2099-01-01"},
+            **auth,
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.user.borrows.count(), 1)
+
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={"login": "2/min", "register": "1/hour", "read": "3/min"},
+)
+class TokenBucketThrottleTest(TestCase):
+    def setUp(self):
+        local_store.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="test@test.test", password="testpassword"
+        )
+
+    def test_login_attempts_are_limited_per_ip(self):
+        credentials = {"email": "test@test.test", "password": "wrong"}
+        responses = [self.client.post(TOKEN_URL, credentials) for _ in range(3)]
+
+        self.assertEqual(
+            [res.status_code for res in responses],
+            [401, 401, status.HTTP_429_TOO_MANY_REQUESTS],
+        )
+        self.assertEqual(responses[0]["RateLimit-Limit"], "2")
+        self.assertEqual(responses[0]["RateLimit-Remaining"], "1")
+        self.assertEqual(responses[1]["RateLimit-Reset"], "60")
+        self.assertEqual(responses[2]["Retry-After"], "30")
+
+        other_ip = self.client.post(TOKEN_URL, credentials, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other_ip.status_code, 401)
+
+    def test_reads_are_limited_per_user(self):
+        self.client.force_authenticate(self.user)
+        statuses = [self.client.get(ME_URL).status_code for _ in range(4)]
+
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(BOOK_URL).status_code, 200)
+
+    def test_tokens_refill_over_time(self):
+        clock = [0.0]
+        with patch.object(local_store, "clock", lambda: clock[0]):
+            payload = {"email": "new@test.test", "password": "newpassword"}
+            self.assertEqual(self.client.post(REGISTER_URL, payload).status_code, 201)
+            payload["email"] = "other@test.test"
+            self.assertEqual(self.client.post(REGISTER_URL, payload).status_code, 429)
+            clock[0] += 3600
+            self.assertEqual(self.client.post(REGISTER_URL, payload).status_code, 201)
+
+    def test_forwarded_for_header_is_not_trusted(self):
+        credentials = {"email": "test@test.test", "password": "wrong"}
+        statuses = [
+            self.client.post(
+                TOKEN_URL, credentials, HTTP_X_FORWARDED_FOR=f"10.0.1.{i}"
+            ).status_code
+            for i in range(3)
+        ]
+
+        self.assertEqual(statuses, [401, 401, status.HTTP_429_TOO_MANY_REQUESTS])
+
+    @override_settings(THROTTLE_STORE="redis", CACHES=LOCMEM_CACHE)
+    def test_redis_store_needs_a_redis_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get(BOOK_URL)
+
+
+REDIS_CACHE = {
+    "default": {**settings.CACHE_BACKENDS["redis"], "KEY_PREFIX": "user-tests"},
+}
+
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={"login": "2/min"},
+    THROTTLE_STORE="redis",
+    CACHES=REDIS_CACHE,
+)
+class RedisBucketStoreTest(TestCase):
+    """Runs the token bucket script on the Redis of `REDIS_URL`, if any."""
+
+    CREDENTIALS = {"email": "test@test.test", "password": "wrong"}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.redis = Redis.from_url(REDIS_CACHE["default"]["LOCATION"])
+        try:
+            cls.redis.ping()
+        except RedisError:
+            raise SkipTest("no Redis server at REDIS_URL")
+        super().setUpClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.key = caches["default"].make_and_validate_key(
+            "throttle:login:ip:127.0.0.1"
+        )
+        self.addCleanup(self.redis.delete, self.key)
+        self.redis.delete(self.key)
+
+    def test_bucket_is_emptied_then_denied(self):
+        responses = [self.client.post(TOKEN_URL, self.CREDENTIALS) for _ in range(3)]
+
+        self.assertEqual(
+            [res.status_code for res in responses],
+            [401, 401, status.HTTP_429_TOO_MANY_REQUESTS],
+        )
+        self.assertEqual(responses[0]["RateLimit-Remaining"], "1")
+        self.assertEqual(responses[2]["Retry-After"], "30")
+        self.assertTrue(0 < self.redis.ttl(self.key) <= 61)
+
+    def test_bucket_is_refilled_over_the_period(self):
+        for _ in range(2):
+            self.client.post(TOKEN_URL, self.CREDENTIALS)
+        # half a minute earlier, one of two tokens a minute is back
+        updated = float(self.redis.hget(self.key, "updated"))
+        self.redis.hset(self.key, "updated", str(updated - 30))
+
+        res = self.client.post(TOKEN_URL, self.CREDENTIALS)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res["RateLimit-Remaining"], "0")
+        self.assertEqual(
+            self.client.post(TOKEN_URL, self.CREDENTIALS).status_code,
+            status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+
+
+FAST_HASHER_COSTS = {
+    "pbkdf2": {"iterations": 1000},
+    "scrypt": {"work_factor": 2**10},
+    "argon2": {"time_cost": 1, "memory_cost": 256, "parallelism": 1},
+}
+
+
+def hasher_policy(name, **costs):
+    """Settings of the `name` hasher policy at test costs."""
+    classes = settings.PASSWORD_HASHER_CLASSES
+    return override_settings(
+        PASSWORD_HASHERS=[
+            classes[name],
+            *(path for policy, path in classes.items() if policy != name),
+        ],
+        PASSWORD_HASHER_COSTS={**FAST_HASHER_COSTS, **costs},
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PasswordHasherPolicyTest(TestCase):
+    def setUp(self):
+        get_auth_cache().clear()
+        self.client = APIClient()
+        with hasher_policy("pbkdf2"):
+            self.user = get_user_model().objects.create_user(
+                email="test@test.test", password="testpassword"
+            )
+
+    def _login(self):
+        payload = {"email": "test@test.test", "password": "testpassword"}
+        res = self.client.post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        return self.user.password
+
+    def test_each_policy_hashes_with_its_cost(self):
+        expected = {"pbkdf2": "$1000$", "scrypt": "$1024$", "argon2": "t=1,p=1"}
+        for name, fragment in expected.items():
+            with self.subTest(name), hasher_policy(name):
+                encoded = make_password("testpassword")
+                self.assertTrue(encoded.startswith(f"{name}"), encoded)
+                self.assertIn(fragment, encoded)
+                self.assertTrue(check_password("testpassword", encoded))
+
+    def test_scrypt_verifies_a_hash_of_a_higher_cost(self):
+        with hasher_policy("scrypt", scrypt={"work_factor": 2**12}):
+            encoded = make_password("testpassword")
+
+        with hasher_policy("scrypt"):
+            self.assertTrue(check_password("testpassword", encoded))
+
+    def test_login_upgrades_the_hasher_without_revoking_tokens(self):
+        with hasher_policy("argon2"):
+            password = self._login()
+
+        self.assertTrue(password.startswith("argon2$"))
+        self.assertIsNone(get_auth_cache().get(REVOKED_KEY.format(self.user.id)))
+        with hasher_policy("pbkdf2"):
+            self.assertTrue(self._login().startswith("pbkdf2_sha256$1000$"))
+
+    def test_login_applies_a_new_cost(self):
+        with hasher_policy("pbkdf2"):
+            self.assertEqual(self._login(), self.user.password)
+        with hasher_policy("pbkdf2", pbkdf2={"iterations": 2000}):
+            self.assertIn("$2000$", self._login())
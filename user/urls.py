@@ -3,6 +3,7 @@ from django.urls import path
 from user.views import (
     CreateUserView,
     ManageUserView,
+    ManageUserStatsView,
     TokenObtainPairViewExtended,
     TokenRefreshViewExtended,
     TokenVerifyViewExtended,
@@ -16,4 +17,5 @@ urlpatterns = [
     path("token/refresh/", TokenRefreshViewExtended.as_view(), name="token_refresh"),
     path("token/verify/", TokenVerifyViewExtended.as_view(), name="token_verify"),
     path("me/", ManageUserView.as_view(), name="manage"),
+    path("me/stats/", ManageUserStatsView.as_view(), name="stats"),
 ]
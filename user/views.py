@@ -1,3 +1,5 @@
+from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from rest_framework import generics
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -9,7 +11,14 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from borrowing.serializers import BorrowingSummarySerializer
+from borrowing.summary import get_summary
+from user.serializers import (
+    UserSerializer,
+    AuthTokenSerializer,
+    TokenObtainPairSerializerExtended,
+    TokenRefreshSerializerExtended,
+)
 
 
 @extend_schema_view(
@@ -29,10 +38,12 @@ class CreateUserView(generics.CreateAPIView):
 
     - Publicly accessible (no authentication required).
     - Requires a valid payload containing user details.
+    - Rate limited per IP address (`register` scope).
     """
 
     serializer_class = UserSerializer
     permission_classes = (AllowAny,)
+    throttle_scope = "register"
 
 
 @extend_schema_view(
@@ -53,11 +64,13 @@ class CreateTokenView(ObtainAuthToken):
 
     - Requires valid user credentials (email and password).
     - Returns an authentication token upon success.
+    - Rate limited per IP address (`login` scope).
     """
 
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
     permission_classes = (AllowAny,)
     serializer_class = AuthTokenSerializer
+    throttle_scope = "login"
 
 
 @extend_schema_view(
@@ -104,7 +117,38 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         """
         Override to return the currently authenticated user.
         """
-        return self.request.user
+        user = self.request.user
+        if isinstance(user, get_user_model()):
+            return user
+        # stateless authentication only provides the token claims
+        return get_object_or_404(get_user_model(), pk=user.pk)
+
+
+@extend_schema_view(
+    get=extend_schema(
+        summary="Retrieve current user borrowing stats",
+        description=(
+            "Number of active, overdue and all borrowings and the outstanding "
+            "fines of the authenticated user."
+        ),
+        responses={
+            200: BorrowingSummarySerializer,
+            401: {"description": "Authentication required."},
+        },
+    ),
+)
+class ManageUserStatsView(generics.RetrieveAPIView):
+    """
+    Endpoint with the borrowing counters of the authenticated user.
+
+    - Requires authentication.
+    - Reads a single row of precomputed counters.
+    """
+
+    serializer_class = BorrowingSummarySerializer
+
+    def get_object(self):
+        return get_summary(self.request.user.id)
 
 
 @extend_schema(
@@ -135,7 +179,9 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     },
 )
 class TokenObtainPairViewExtended(TokenObtainPairView):
-    pass
+    serializer_class = TokenObtainPairSerializerExtended
+    # every attempt runs the password hasher
+    throttle_scope = "login"
 
 
 @extend_schema(
@@ -164,7 +210,7 @@ class TokenObtainPairViewExtended(TokenObtainPairView):
     },
 )
 class TokenRefreshViewExtended(TokenRefreshView):
-    pass
+    serializer_class = TokenRefreshSerializerExtended
 
 
 @extend_schema(